@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
+
+The real-time stream (api/events/) keeps one connection open per client and
+should be served through this entry point (uvicorn, daphne) rather than WSGI.
 """
 
 import os
@@ -48,10 +48,34 @@ INSTALLED_APPS = [
 # Configuración de Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Usuario construido con los claims del token, sin query por petición (ver social/tokens.py)
+        'social.tokens.ClaimsJWTAuthentication',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'social.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,  # Tamaño de página por defecto de los listados (cursor)
+    'DEFAULT_RENDERER_CLASSES': (
+        'social.instrumentation.TimedJSONRenderer',  # JSONRenderer que mide el tiempo de serialización
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
 }
 
+SOCIAL_MAX_PAGE_SIZE = 100  # Máximo que puede pedir el cliente con ?page_size=
+SOCIAL_COMPACT_LATEST_COMMENTS = 3  # Comentarios incluidos en cada post con ?fields=compact
+SOCIAL_USER_SEARCH_LIMIT = 50  # Máximo de resultados de search-users/
+SOCIAL_RANKED_FEED_CANDIDATES = 1000  # Máximo de posts candidatos que se puntúan en home-posts/?mode=ranked
+SOCIAL_RANKED_FEED_BUDGET_MS = 150  # Presupuesto de tiempo; al agotarse se omiten las fuentes opcionales
+SOCIAL_SUGGESTIONS_TOP_K = 50  # Sugerencias de a quién seguir guardadas por usuario
+SOCIAL_SUGGESTIONS_REFRESH_FOLLOWEES = 100  # Seguidos recientes que cuenta el cálculo en la petición
+SOCIAL_CONTENT_SEARCH_BACKEND = 'social.search.TokenTableBackend'  # Búsqueda en posts y comentarios
+SOCIAL_BATCH_MAX_IDS = 100  # Máximo de ids en like-status/?ids= y follow-status/?ids=
+SOCIAL_NOTIFICATION_ACTORS = 3  # Usuarios que se guardan en cada aviso agregado ("A, B y 12 más")
+SOCIAL_EVENT_BROKER = 'social.events.InMemoryBroker'  # Reparto de eventos del stream events/ (un solo proceso)
+SOCIAL_EVENT_KEEPALIVE = 15  # Segundos entre comentarios keepalive del stream SSE
+SOCIAL_EVENT_TICKET_TTL = 30  # Segundos que vale el ticket de events/ticket/ para abrir el stream
+SOCIAL_BULK_MAX_ITEMS = 1000  # Máximo de elementos en likes/bulk/, follows/bulk/ y comments/bulk/
+SOCIAL_AUTH_USER_CACHE_TTL = 60  # Segundos que se reutiliza la fila de usuario en tokens sin claims y en el refresh
+SOCIAL_ASYNC_VIEWS = False  # True al servir con ASGI: feed, perfil, comentarios, estados y búsquedas async
+
 # Configuración de JWT
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),  # Tiempo de vida del token
@@ -64,20 +88,30 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
+    # Añaden username y email como claims; la lista negra de refresh rotados vive en la caché
+    'TOKEN_OBTAIN_SERIALIZER': 'social.tokens.TokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'social.tokens.TokenRefreshSerializer',
 }
 
 MIDDLEWARE = [
+    'social.instrumentation.InstrumentationMiddleware',  # Primero, para medir la petición entera
+    'social.db_router.ReplicaRoutingMiddleware',  # Lecturas de GET en réplicas (ver SOCIAL_DB_REPLICAS)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'corsheaders.middleware.CorsMiddleware',  # Antes de CommonMiddleware, como pide django-cors-headers
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'corsheaders.middleware.CorsMiddleware',
-    'django.middleware.common.CommonMiddleware',
 ]
 
+# Instrumentación por petición (ver social/instrumentation.py)
+SOCIAL_SERVER_TIMING = True  # Cabecera Server-Timing con queries, tiempo de BD, serialización y total
+SOCIAL_SLOW_QUERY_MS = 100  # Las queries más lentas se registran con su huella y la ruta
+SOCIAL_PROFILE_SAMPLE_RATE = 0.0  # Fracción de peticiones síncronas perfiladas con cProfile (p. ej. 0.01)
+SOCIAL_METRICS_TOKEN = None  # Token para /metrics (Prometheus); sin él solo se sirve con DEBUG
+
 ROOT_URLCONF = 'SocialRed.urls'
 
 TEMPLATES = [
@@ -134,9 +168,35 @@ DATABASES = {
         'PASSWORD': '',
         'HOST': 'localhost',  # o la dirección IP de tu servidor de base de datos
         'PORT': '3306',  # El puerto por defecto para MySQL
+    },
+    # Réplicas de solo lectura, p. ej.:
+    # 'replica1': {'ENGINE': 'django.db.backends.mysql', 'NAME': 'socialRed', 'HOST': 'replica1', ...},
+    # Shards de posts, likes y comentarios; en local pueden ser ficheros SQLite, p. ej.:
+    # 'shard1': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'shard1.sqlite3'},
+}
+
+# Réplicas de lectura (ver social/db_router.py): los GET leen de ellas y el resto va al primario.
+# Sharding de posts, likes y comentarios por usuario (ver social/sharding.py)
+DATABASE_ROUTERS = ['social.db_router.ReplicaRouter', 'social.sharding.ShardRouter']
+SOCIAL_DB_REPLICAS = []  # Alias de DATABASES, p. ej. ['replica1']
+SOCIAL_REPLICA_PIN_SECONDS = 10  # Tras escribir, el usuario lee del primario este tiempo (read-your-writes)
+SOCIAL_REPLICA_MAX_LAG = 5  # Segundos de retraso a partir de los que una réplica deja de usarse
+SOCIAL_REPLICA_CHECK_INTERVAL = 5  # Cada cuánto se comprueba la salud de cada réplica
+SOCIAL_SHARDS = []  # Alias de DATABASES, p. ej. ['default', 'shard1']; los nuevos se añaden al final (ver reshard)
+SOCIAL_SHARD_PLACEMENT_TTL = 300  # Segundos que se cachea el shard de cada usuario
+
+# Caché (respuestas de perfil y de listados de posts, ver social/response_cache.py)
+# En producción se usa un backend compartido, p. ej.:
+#   'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379/1'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+SOCIAL_CACHE_ALIAS = 'default'
+SOCIAL_CACHE_TIMEOUT = 600  # Segundos; la invalidación es por versión, esto solo limpia entradas viejas
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -155,9 +215,34 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Timeline de la home (fan-out on write)
+SOCIAL_TIMELINE_BACKEND = 'social.timeline.DatabaseTimelineStore'  # o 'social.timeline.LocMemTimelineStore'
+SOCIAL_TIMELINE_FANOUT_LIMIT = 5000  # Por encima de estos seguidores el autor se lee en fan-out on read
+SOCIAL_TIMELINE_MAX_ENTRIES = 1000
+SOCIAL_TIMELINE_TRIM_SLACK = 200  # Entradas de más antes de que rebuild_timelines --trim (periódico) recorte un timeline
+SOCIAL_TIMELINE_BACKFILL = 50  # Posts que se copian al seguir a alguien
+
+# Procesado de imágenes de los posts (ver social/images.py)
+SOCIAL_IMAGE_VARIANT_WIDTHS = (320, 640, 1080)
+SOCIAL_IMAGE_WORKERS = 2
+SOCIAL_IMAGE_PIPELINE_SYNC = False  # True para procesar dentro de la petición (tests)
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Las imágenes de los posts se guardan por contenido (media/blobs/ab/cd/<sha256>.<ext>)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'post_images': {
+        'BACKEND': 'social.storage.ContentAddressedStorage',
+    },
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -2,11 +2,17 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from social.instrumentation import metrics_view
+from social.storage import serve_blob
+import os
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('social.urls')),  # Incluye las rutas de tu aplicación 'auth'
+    path('metrics', metrics_view, name='metrics'),  # Histogramas por ruta en formato Prometheus
 ]
 
 if settings.DEBUG:
+    # Los blobs de imágenes no cambian nunca de contenido: se sirven como inmutables
+    urlpatterns += static(settings.MEDIA_URL + 'blobs/', view=serve_blob, document_root=os.path.join(settings.MEDIA_ROOT, 'blobs'))
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
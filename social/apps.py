@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SocialConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'social'
+
+    def ready(self):
+        from . import instrumentation, sharding, signals  # noqa: F401
@@ -0,0 +1,319 @@
+# Vistas asíncronas de las lecturas más frecuentes (feed, perfil, comentarios, estados de
+# like/follow y búsquedas) para servir la API con ASGI sin ocupar un hilo por petición.
+#
+# Usan los métodos async del ORM (aget, aexists, iteración con async for). Las consultas van
+# una tras otra: el ORM async de Django las ejecuta todas en el mismo hilo, así que lanzarlas
+# con asyncio.gather no las solapa. Lo que se gana es no ocupar un hilo por petición mientras
+# se espera. Devuelven lo mismo que sus equivalentes de views.py; urls.py elige una u otra
+# pila con SOCIAL_ASYNC_VIEWS.
+
+import asyncio
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from . import counters, events, instrumentation, ranking, response_cache, search, sharding, timeline
+from .models import Comment, ContentToken, Follow, Like, Post, UserStats
+from .pagination import CommentPagination, PostPagination, RankedPagination, SearchPagination
+from .prefetch import afollowed_ids, aliked_post_ids, apost_page_context, prefetch_comments, prefetch_post_page
+from .serializers import CommentSerializer, CompactPostSerializer, PostSerializer, UserSerializer, requested_fields
+from .tokens import ClaimsJWTAuthentication
+from .views import LikePostView, batch_max_ids, home_dependencies, parse_id_list
+
+User = get_user_model()
+
+
+class AsyncAPIView(APIView):
+    # APIView con dispatch asíncrono. La autenticación (JWT) y los permisos siguen siendo
+    # síncronos en DRF y se ejecutan con sync_to_async; el resto de la petición no sale del
+    # event loop.
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+async def aslist(queryset):
+    return [obj async for obj in queryset]
+
+
+def post_serializer_class(request):
+    compact, _ = requested_fields(request)
+    return CompactPostSerializer if compact else PostSerializer
+
+
+class AsyncHomePostsView(AsyncAPIView):
+    permission_classes = [permissions.AllowAny]
+
+    async def get(self, request):
+        if not request.user.is_authenticated:
+            return Response({'next': None, 'results': []})
+
+        if request.query_params.get('mode') == 'ranked':
+            return await self.ranked(request)
+
+        # El timeline puede estar en la base de datos o en memoria; su interfaz es síncrona
+        entries = await sync_to_async(timeline.home_entries)(request.user, *PostPagination().get_window(request))
+        validators = await response_cache.avalidators_for(home_dependencies(request.user.id, entries))
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        posts = await sync_to_async(timeline.home_posts)(entries)  # Con sharding consulta UserShard
+        paginator = PostPagination()
+        page = await paginator.apaginate_queryset(prefetch_post_page(request, posts), request, view=self)
+        context = await apost_page_context(request, page)
+        data = instrumentation.serialized(post_serializer_class(request)(page, many=True, context=context))
+        return validators.apply(paginator.get_paginated_response(data))
+
+
+    async def ranked(self, request):
+        paginator = RankedPagination()
+        refresh = not request.query_params.get(paginator.cursor_query_param)
+        ranked = await sync_to_async(ranking.cached_ranked_post_ids)(request.user, refresh)
+        page_ids = await paginator.apaginate_queryset(ranked, request, view=self)
+        # Ubicar los posts puede consultar PostLocation: es síncrono
+        posts = await sync_to_async(sharding.for_posts)(Post.objects.all(), page_ids)
+        posts = {post.id: post async for post in prefetch_post_page(request, posts)}
+        page = [posts[post_id] for post_id in page_ids if post_id in posts]
+        context = await apost_page_context(request, page)
+        data = instrumentation.serialized(post_serializer_class(request)(page, many=True, context=context))
+        return paginator.get_paginated_response(data)
+
+
+class AsyncUserProfileView(AsyncAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request, user_id):
+        validators = await response_cache.avalidators_for([('user', user_id), ('user', request.user.id)])
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        try:
+            data = await response_cache.acached_data('profile', [('user', user_id)], request, lambda: self.build(request, user_id))
+        except User.DoesNotExist:
+            return Response({'error': 'User does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+        followed = await afollowed_ids(request.user, [user_id])
+        await response_cache.aapply_viewer_fields(request, data['posts'])
+        data['is_followed'] = user_id in followed
+        return validators.apply(Response(data, status=status.HTTP_200_OK))
+
+    async def build(self, request, user_id):
+        paginator = PostPagination()
+        user = await User.objects.only('username', 'email').aget(id=user_id)
+        stats = await UserStats.objects.filter(user_id=user_id).afirst()
+        posts = await sync_to_async(sharding.posts_of)(user_id)
+        page = await paginator.apaginate_queryset(prefetch_post_page(request, posts), request, view=self)
+        if stats is None:
+            stats = await counters.aget_user_stats(user_id)
+        context = await apost_page_context(request, page, viewer_fields=False)
+        posts = instrumentation.serialized(post_serializer_class(request)(page, many=True, context=context))
+
+        return {
+            'username': user.username,
+            'email': user.email,
+            'followers_count': stats.follower_count,
+            'following_count': stats.following_count,
+            'post_count': stats.post_count,
+            'posts': posts,
+            'posts_next': paginator.get_next_link(),
+        }
+
+
+class AsyncCommentListView(AsyncAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request, post_id):
+        validators = await response_cache.avalidators_for([('post', post_id), ('user', request.user.id)])
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        paginator = CommentPagination()
+        alias = await sync_to_async(sharding.shard_for_post)(post_id)
+        comments = prefetch_comments(Comment.objects.using(alias).filter(post_id=post_id))
+        post_owner_id = await Post.objects.using(alias).filter(id=post_id).values_list('user_id', flat=True).afirst()
+        if post_owner_id is None:
+            return Response({"error": "Post not found"}, status=404)
+        page = await paginator.apaginate_queryset(comments, request, view=self)
+
+        context = {
+            'request': request,
+            'followed_ids': await afollowed_ids(request.user, {comment.user_id for comment in page}),
+        }
+        return validators.apply(Response({
+            'post_owner_id': post_owner_id,
+            'comments': instrumentation.serialized(CommentSerializer(page, many=True, context=context)),
+            'next': paginator.get_next_link(),
+            'current_user_id': request.user.id,
+        }))
+
+
+class AsyncLikeStatusView(AsyncAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request, post_id):
+        alias = await sync_to_async(sharding.shard_for_post)(post_id)
+        if not await Post.objects.using(alias).filter(id=post_id).aexists():
+            return Response({'error': 'Post not found'}, status=404)
+        has_liked = await Like.objects.using(alias).filter(user_id=request.user.id, post_id=post_id).aexists()
+        return Response({'liked': has_liked})
+
+    async def post(self, request, post_id):
+        # La ruta también acepta el like (como LikePostView); las escrituras siguen siendo síncronas
+        return await sync_to_async(LikePostView().post)(request)
+
+
+class AsyncFollowStatusView(AsyncAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request, user_id):
+        if not await User.objects.filter(id=user_id).aexists():
+            return Response({'error': 'User does not exist'}, status=404)
+        is_followed = await Follow.objects.filter(follower_id=request.user.id, following_id=user_id).aexists()
+        return Response({'is_followed': is_followed}, status=200)
+
+
+class AsyncBatchLikeStatusView(AsyncAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request):
+        post_ids = parse_id_list(request)
+        if post_ids is None:
+            return Response({'error': 'ids must be a comma separated list of at most %d post ids' % batch_max_ids()}, status=400)
+
+        posts = await sync_to_async(sharding.for_posts)(Post.objects.all(), post_ids)
+        like_counts = await aslist(posts.values_list('id', 'like_count'))
+        liked = await aliked_post_ids(request.user, post_ids)
+        data = {post_id: {'liked': post_id in liked, 'likesCount': like_count} for post_id, like_count in like_counts}
+        return Response({'likes': data}, status=200)
+
+
+class AsyncBatchFollowStatusView(AsyncAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request):
+        user_ids = parse_id_list(request)
+        if user_ids is None:
+            return Response({'error': 'ids must be a comma separated list of at most %d user ids' % batch_max_ids()}, status=400)
+
+        followed = await afollowed_ids(request.user, user_ids)
+        return Response({'follows': {user_id: user_id in followed for user_id in user_ids}}, status=200)
+
+
+class AsyncUserSearchView(AsyncAPIView):
+    async def get(self, request):
+        paginator = RankedPagination()
+        users = search.ranked_users(request.query_params.get('query', ''), request.user)
+        page = await paginator.apaginate_queryset(users, request, view=self)
+        context = {
+            'request': request,
+            'format': self.format_kwarg,
+            'view': self,
+            'followed_ids': {user.id for user in page if user.viewer_follows},
+        }
+        return paginator.get_paginated_response(instrumentation.serialized(UserSerializer(page, many=True, context=context)))
+
+
+class AsyncContentSearchView(AsyncAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request):
+        kind = ContentToken.COMMENT if request.query_params.get('type') == 'comments' else ContentToken.POST
+        terms = search.query_terms(request.query_params.get('q', ''))
+        if not terms:
+            return Response({'next': None, 'results': []}, status=200)
+
+        backend = search.get_content_backend()
+        paginator = SearchPagination()
+        weights = paginator.get_cursor_weights(request, terms) or await backend.aweights(kind, terms)
+        page = await paginator.apaginate_queryset(backend.search(kind, terms, weights), request, view=self, weights=weights)
+        ids = [row['object_id'] for row in page]
+
+        if kind == ContentToken.POST:
+            posts = await sync_to_async(sharding.for_posts)(Post.objects.all(), ids)
+            objects = {post.id: post async for post in prefetch_post_page(request, posts)}
+            results = [objects[object_id] for object_id in ids if object_id in objects]
+            context = await apost_page_context(request, results)
+            data = instrumentation.serialized(post_serializer_class(request)(results, many=True, context=context))
+        else:
+            comments = await sync_to_async(sharding.for_comments)(Comment.objects.all(), ids)
+            objects = {comment.id: comment async for comment in prefetch_comments(comments)}
+            results = [objects[object_id] for object_id in ids if object_id in objects]
+            context = {
+                'request': request,
+                'followed_ids': await afollowed_ids(request.user, {comment.user_id for comment in results}),
+            }
+            data = instrumentation.serialized(CommentSerializer(results, many=True, context=context))
+        return paginator.get_paginated_response(data)
+
+
+async def event_stream(request):
+    # Stream SSE con los eventos del usuario. EventSource no permite cabeceras, así que además
+    # del token de acceso se acepta ?ticket= con un ticket de events/ticket/
+    if not isinstance(request, ASGIRequest):
+        # Con WSGI cada stream abierto ocuparía un hilo del servidor mientras dure la conexión
+        return JsonResponse({'error': 'The event stream is only served over ASGI'}, status=501)
+    authentication = ClaimsJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token:
+        try:
+            user = await sync_to_async(authentication.get_user)(authentication.get_validated_token(raw_token))
+        except (InvalidToken, AuthenticationFailed):
+            return JsonResponse({'detail': 'Given token not valid for any token type'}, status=401)
+        user_id = user.id
+    elif request.GET.get('ticket'):
+        user_id = events.ticket_user_id(request.GET['ticket'])
+        if user_id is None:
+            return JsonResponse({'detail': 'Invalid or expired ticket'}, status=401)
+    else:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    subscription = events.get_broker().subscribe(user_id)
+    keepalive = getattr(settings, 'SOCIAL_EVENT_KEEPALIVE', 15)
+
+    async def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await subscription.get(timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'  # Evita que proxies cierren la conexión inactiva
+                    continue
+                yield events.format_sse(event)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,124 @@
+# Contadores desnormalizados (likes/comentarios por post, seguidores/seguidos/posts por usuario).
+# Siempre se actualizan con F() para que la suma sea atómica en la base de datos.
+
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.db import connections, router
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from . import sharding
+from .models import Comment, Follow, Like, Notification, Post, UserStats
+
+
+def _deltas(deltas):
+    # Greatest evita que un contador desajustado baje de cero
+    return {field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()}
+
+
+def bump_post(post_id, **deltas):
+    return Post.objects.using(sharding.shard_for_post(post_id)).filter(id=post_id).update(**_deltas(deltas))
+
+
+def bump_post_returning(post_id, field, delta):
+    # Como bump_post para un contador, devolviendo (autor, valor nuevo) o None si el post no
+    # existe. En PostgreSQL y SQLite es un solo UPDATE ... RETURNING; MySQL no lo tiene y se
+    # relee la fila, que el UPDATE deja bloqueada hasta el final de la transacción
+    alias = sharding.shard_for_post(post_id) or router.db_for_write(Post)
+    connection = connections[alias]
+    if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+        quote = connection.ops.quote_name
+        column = quote(Post._meta.get_field(field).column)
+        greatest = 'MAX' if connection.vendor == 'sqlite' else 'GREATEST'
+        sql = (
+            f'UPDATE {quote(Post._meta.db_table)} SET {column} = {greatest}({column} + %s, 0) '
+            f'WHERE {quote(Post._meta.pk.column)} = %s RETURNING {quote(Post.user.field.column)}, {column}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [delta, post_id])
+            return cursor.fetchone()
+    posts = Post.objects.using(alias).filter(id=post_id)
+    if not posts.update(**_deltas({field: delta})):
+        return None
+    return posts.values_list('user_id', field).first()
+
+
+def bump_user(user_id, **deltas):
+    updated = UserStats.objects.filter(user_id=user_id).update(**_deltas(deltas))
+    if not updated:
+        # Usuario sin fila de stats (creado antes de los contadores): se calcula de cero
+        reconcile_user(user_id)
+    return updated
+
+
+def get_user_stats(user_id):
+    try:
+        return UserStats.objects.get(user_id=user_id)
+    except UserStats.DoesNotExist:
+        return reconcile_user(user_id)
+
+
+async def aget_user_stats(user_id):
+    stats = await UserStats.objects.filter(user_id=user_id).afirst()
+    if stats is None:
+        stats = await sync_to_async(reconcile_user)(user_id)
+    return stats
+
+
+def reconcile_user(user_id):
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'follower_count': Follow.objects.filter(following_id=user_id).count(),
+            'following_count': Follow.objects.filter(follower_id=user_id).count(),
+            'post_count': sharding.posts_of(user_id).count(),
+        },
+    )
+    return stats
+
+
+def count_of(queryset, field):
+    # Subconsulta COUNT(*) correlacionada con la fila exterior
+    counted = queryset.filter(**{field: OuterRef('pk')}).values(field).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def post_counters():
+    return {
+        'like_count': count_of(Like.objects.all(), 'post'),
+        'comment_count': count_of(Comment.objects.all(), 'post'),
+    }
+
+
+def user_counters():
+    counters = {
+        'follower_count': count_of(Follow.objects.all(), 'following'),
+        'following_count': count_of(Follow.objects.all(), 'follower'),
+        'post_count': count_of(Post.objects.all(), 'user'),
+        'unread_notifications': count_of(Notification.objects.filter(is_read=False), 'recipient'),
+    }
+    if sharding.enabled():
+        del counters['post_count']  # Los posts están en los shards: ver sharded_post_counts
+    return counters
+
+
+def sharded_post_counts():
+    # {user_id: posts} sumando lo que tiene cada shard
+    counts = defaultdict(int)
+    for user_id, posts in sharding.everywhere(Post.objects.order_by().values_list('user_id').annotate(n=Count('*'))):
+        counts[user_id] += posts
+    return counts
+
+
+def recount_posts(post_ids, *fields):
+    # Recalcula en un solo UPDATE los contadores de muchos posts tras una escritura en lote;
+    # al contar las filas reales no importa qué elementos del lote ya existían
+    expressions = post_counters()
+    return sharding.for_posts(Post.objects.all(), post_ids).update(**{field: expressions[field] for field in fields})
+
+
+def recount_users(user_ids, *fields):
+    UserStats.objects.bulk_create([UserStats(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+    expressions = user_counters()
+    return UserStats.objects.filter(user_id__in=user_ids).update(**{field: expressions[field] for field in fields})
@@ -0,0 +1,213 @@
+# Lecturas en réplicas y escrituras en el primario.
+#
+# ReplicaRoutingMiddleware marca las peticiones GET/HEAD/OPTIONS como aptas para leer de una
+# réplica (SOCIAL_DB_REPLICAS); el resto de peticiones, los comandos y las tareas leen siempre
+# del primario. Dentro de una petición apta se vuelve al primario en cuanto se escribe algo o
+# si hay una transacción abierta en el primario, y todas sus lecturas van a la misma réplica.
+#
+# Read-your-writes: cuando una petición escribe, su usuario queda fijado al primario durante
+# SOCIAL_REPLICA_PIN_SECONDS con una marca en la caché compartida. El usuario sale del JWT sin
+# ir a la base de datos, así que la marca sirve para cualquier proceso que atienda su siguiente
+# petición y ve sus propios likes y comentarios aunque la réplica vaya por detrás.
+#
+# Salud: cada réplica se comprueba como mucho cada SOCIAL_REPLICA_CHECK_INTERVAL segundos
+# (conexión y retraso de replicación). Si falla o va más de SOCIAL_REPLICA_MAX_LAG segundos por
+# detrás no se usa hasta la siguiente comprobación; sin réplicas sanas se lee del primario.
+
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from . import sharding
+from .response_cache import get_cache
+from .tokens import ClaimsJWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = DEFAULT_DB_ALIAS
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replicas():
+    return list(getattr(settings, 'SOCIAL_DB_REPLICAS', []))
+
+
+def pin_seconds():
+    return getattr(settings, 'SOCIAL_REPLICA_PIN_SECONDS', 10)
+
+
+def max_lag():
+    return getattr(settings, 'SOCIAL_REPLICA_MAX_LAG', 5)
+
+
+def check_interval():
+    return getattr(settings, 'SOCIAL_REPLICA_CHECK_INTERVAL', 5)
+
+
+class RoutingState:
+    # Una por petición
+    def __init__(self, use_replicas):
+        self.use_replicas = use_replicas
+        self.replica = None
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('social_db_routing', default=None)
+
+
+def replica_lag(alias):
+    # Segundos de retraso de la réplica; 0 si el motor no lo expone (SQLite en los tests)
+    connection = connections[alias]
+    connection.ensure_connection()
+    if connection.vendor != 'mysql':
+        return 0
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute('SHOW REPLICA STATUS')
+        except DatabaseError:
+            cursor.execute('SHOW SLAVE STATUS')  # MySQL anterior a 8.0.22
+        row = cursor.fetchone()
+        if row is None:
+            return 0
+        status = dict(zip([column[0] for column in cursor.description], row))
+    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    return float('inf') if lag is None else float(lag)  # None: la replicación está parada
+
+
+class ReplicaHealth:
+    # Estado por proceso de cada réplica, con la hora de la última comprobación
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}  # alias -> (monotonic, sana)
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._checked.get(alias)
+        if entry is not None and now - entry[0] < check_interval():
+            return entry[1]
+        try:
+            lag = replica_lag(alias)
+        except Exception:
+            logger.warning('Réplica %s no disponible; se lee del primario', alias, exc_info=True)
+            healthy = False
+        else:
+            healthy = lag <= max_lag()
+            if not healthy:
+                logger.warning('Réplica %s con %s s de retraso; se lee del primario', alias, lag)
+        with self._lock:
+            self._checked[alias] = (now, healthy)
+        return healthy
+
+    def reset(self):
+        with self._lock:
+            self._checked.clear()
+
+
+health = ReplicaHealth()
+
+
+def pin_key(user_id):
+    return f'social:db:pin:{user_id}'
+
+
+def pin_user(user_id):
+    get_cache().set(pin_key(user_id), True, pin_seconds())
+
+
+def is_pinned(user_id):
+    return get_cache().get(pin_key(user_id)) is not None
+
+
+def token_user_id(request):
+    # Id del usuario del JWT, solo validando la firma (sin query)
+    authentication = ClaimsJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        return authentication.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+    except (InvalidToken, TokenError):
+        return None
+
+
+class ReplicaRouter:
+    # Los posts, likes y comentarios con sharding los enruta después sharding.ShardRouter
+
+    def db_for_read(self, model, **hints):
+        if sharding.is_sharded(model):
+            return None
+        state = _state.get()
+        if state is None or not state.use_replicas or state.wrote:
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY  # Lo leído dentro de una transacción tiene que ser coherente con ella
+        if state.replica is None or (state.replica != PRIMARY and not health.is_healthy(state.replica)):
+            healthy = [alias for alias in replicas() if health.is_healthy(alias)]
+            state.replica = random.choice(healthy) if healthy else PRIMARY  # Resto de la petición
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return None if sharding.is_sharded(model) else PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Todas las bases tienen los mismos datos
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas()  # Las réplicas reciben el esquema por replicación
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.finish(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.finish(request, state)
+        return response
+
+    def start(self, request):
+        use_replicas = bool(replicas()) and request.method in SAFE_METHODS
+        if use_replicas:
+            user_id = token_user_id(request)
+            use_replicas = user_id is None or not is_pinned(user_id)
+        state = RoutingState(use_replicas)
+        return state, _state.set(state)
+
+    def finish(self, request, state):
+        if state.wrote and replicas():
+            user_id = token_user_id(request)
+            if user_id is not None:
+                pin_user(user_id)
@@ -0,0 +1,167 @@
+# Eventos en tiempo real (nuevo post, like, comentario, follow) para los clientes conectados
+# al stream SSE de events/, en lugar de tener que sondear home-posts/, like-status/, etc.
+#
+# Cada usuario tiene un canal. Las vistas publican al confirmar la transacción y el broker
+# entrega el evento a las conexiones abiertas de esos usuarios. El broker es intercambiable
+# (SOCIAL_EVENT_BROKER): InMemoryBroker sirve para un único proceso y para los tests; con
+# varios procesos hace falta uno respaldado por un servicio compartido (Redis pub/sub, etc.).
+
+import asyncio
+import itertools
+import json
+import threading
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Follow
+
+NEW_POST = 'post'
+LIKE = 'like'
+COMMENT = 'comment'
+FOLLOW = 'follow'
+
+TICKET_SALT = 'social.events.stream'
+
+
+def queue_size():
+    return getattr(settings, 'SOCIAL_EVENT_QUEUE_SIZE', 100)
+
+
+def ticket_ttl():
+    return getattr(settings, 'SOCIAL_EVENT_TICKET_TTL', 30)
+
+
+def issue_ticket(user_id):
+    # EventSource no permite cabeceras y la URL acaba en los logs de acceso: en vez del JWT,
+    # que vale para toda la API, se pasa un ticket firmado que solo abre el stream y caduca enseguida
+    return signing.TimestampSigner(salt=TICKET_SALT).sign(str(user_id))
+
+
+def ticket_user_id(ticket):
+    # Usuario del ticket, o None si es falso o ha caducado
+    try:
+        return int(signing.TimestampSigner(salt=TICKET_SALT).unsign(ticket, max_age=ticket_ttl()))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+class Subscription:
+    # Conexión abierta de un usuario; los eventos llegan por una asyncio.Queue de su loop
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size())
+
+    def deliver(self, event):
+        # Se llama desde cualquier hilo; la cola solo se toca desde su propio loop
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass  # Cliente demasiado lento: se pierde el evento, volverá a sondear al reconectar
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class BaseBroker:
+    def subscribe(self, user_id):
+        # Debe llamarse desde el event loop de la conexión
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, user_ids, event):
+        raise NotImplementedError
+
+
+class InMemoryBroker(BaseBroker):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # user_id -> set de Subscription
+        self._ids = itertools.count(1)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_ids, event):
+        event = {**event, 'id': next(self._ids)}
+        with self._lock:
+            targets = [sub for user_id in set(user_ids) for sub in self._subscriptions.get(user_id, ())]
+        for subscription in targets:
+            subscription.deliver(event)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'SOCIAL_EVENT_BROKER', 'social.events.InMemoryBroker'))()
+        return _broker
+
+
+def reset_broker():
+    # Para los tests
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def publish(user_ids, event_type, data):
+    # Se publica solo si la escritura se confirma
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if user_ids:
+        event = {'type': event_type, 'data': data}
+        transaction.on_commit(lambda: get_broker().publish(user_ids, event))
+
+
+def post_created(post):
+    follower_ids = Follow.objects.filter(following_id=post.user_id).values_list('follower_id', flat=True)
+    publish(list(follower_ids), NEW_POST, {'post_id': post.id, 'user_id': post.user_id})
+
+
+def post_liked(post_id, owner_id, user):
+    if owner_id != user.id:
+        publish([owner_id], LIKE, {'post_id': post_id, 'user_id': user.id, 'username': user.username})
+
+
+def comment_created(comment, post_owner_id):
+    if post_owner_id != comment.user_id:
+        publish([post_owner_id], COMMENT, {
+            'post_id': comment.post_id,
+            'comment_id': comment.id,
+            'user_id': comment.user_id,
+        })
+
+
+def user_followed(follower, following_id):
+    publish([following_id], FOLLOW, {'user_id': follower.id, 'username': follower.username})
+
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
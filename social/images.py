@@ -0,0 +1,144 @@
+# Procesado de imágenes de los posts fuera de la petición.
+#
+# Al crear un post con imagen se encola su procesado en un pool de hilos: se generan
+# variantes redimensionadas en WebP y JPEG, un placeholder diminuto difuminado y se
+# quitan los metadatos EXIF del original. El feed sirve las variantes en vez del original.
+
+import base64
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageFilter, ImageOps
+
+from . import response_cache, sharding
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+PLACEHOLDER_WIDTH = 16
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_widths():
+    return getattr(settings, 'SOCIAL_IMAGE_VARIANT_WIDTHS', (320, 640, 1080))
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'SOCIAL_IMAGE_WORKERS', 2)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='post-images')
+        return _executor
+
+
+def schedule(post):
+    if not post.image:
+        return
+    if getattr(settings, 'SOCIAL_IMAGE_PIPELINE_SYNC', False):
+        process_post_image(post.id)
+        return
+    post_id = post.id
+    transaction.on_commit(lambda: get_executor().submit(_run, post_id))
+
+
+def _run(post_id):
+    # Los hilos del pool abren su propia conexión; se cierra al terminar cada tarea
+    close_old_connections()
+    try:
+        process_post_image(post_id)
+    except Exception:
+        logger.exception('Error procesando la imagen del post %s', post_id)
+    finally:
+        close_old_connections()
+
+
+def _encode(image, pil_format, **options):
+    buffer = BytesIO()
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    # Sin pasar exif= Pillow no copia los metadatos originales
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def _placeholder(image):
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.resize((PLACEHOLDER_WIDTH, height)).filter(ImageFilter.GaussianBlur(1))
+    data = _encode(tiny, 'JPEG', quality=40)
+    return 'data:image/jpeg;base64,' + base64.b64encode(data).decode()
+
+
+def process_post_image(post_id):
+    posts = Post.objects.using(sharding.shard_for_post(post_id))
+    post = posts.filter(id=post_id).first()
+    if post is None or not post.image:
+        return None
+    storage = post.image.storage
+
+    with storage.open(post.image.name) as original:
+        source = Image.open(original)
+        source_format = source.format
+        has_exif = bool(source.getexif())
+        image = ImageOps.exif_transpose(source)  # Aplica la orientación antes de descartar el EXIF
+        image.load()
+
+    saved = []
+    image_name = post.image.name
+    if has_exif and source_format in ('JPEG', 'PNG', 'WEBP'):
+        options = {'quality': 95} if source_format in ('JPEG', 'WEBP') else {}
+        stripped = _encode(image, source_format, **options)
+        image_name = storage.save(post.image.name, ContentFile(stripped))
+        saved.append(image_name)
+
+    variants = {'width': image.width, 'height': image.height}
+    base = f'posts/variants/{post.id}'
+    for fmt in FORMATS:
+        variants[fmt] = {}
+        for target in variant_widths():
+            width = min(target, image.width)  # No se amplían imágenes pequeñas
+            if str(width) in variants[fmt]:
+                continue
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            name = storage.save(f'{base}/{width}.{fmt}', ContentFile(_encode(resized, FORMATS[fmt], quality=80)))
+            saved.append(name)
+            variants[fmt][str(width)] = name
+
+    updated = posts.filter(id=post.id).update(
+        image=image_name,
+        image_variants=variants,
+        image_placeholder=_placeholder(image),
+    )
+    if not updated:
+        # El post se borró mientras se procesaba
+        for name in saved:
+            storage.delete(name)
+        return None
+
+    if image_name != post.image.name:
+        storage.delete(post.image.name)
+    # Las variantes de un procesado anterior (process_post_images --all): cada save de arriba
+    # sumó una referencia aunque el contenido no haya cambiado
+    for name in variant_names(post):
+        storage.delete(name)
+    response_cache.post_changed(post.id, post.user_id)
+    return variants
+
+
+def variant_names(post):
+    return [name for fmt in FORMATS for name in (post.image_variants or {}).get(fmt, {}).values()]
+
+
+def delete_variants(post):
+    storage = post.image.storage
+    for name in variant_names(post):
+        storage.delete(name)
@@ -0,0 +1,308 @@
+# Instrumentación de cada petición: número de queries, tiempo en base de datos, tiempo de
+# serialización (serializer.data y render JSON) y tiempo total por ruta.
+#
+# - InstrumentationMiddleware abre unas métricas por petición en un ContextVar (que asgiref
+#   copia a los hilos de sync_to_async, así que también cubre las vistas async) y al terminar
+#   añade la cabecera Server-Timing y lo acumula en histogramas por ruta.
+# - db_execute_wrapper se instala en cada conexión al crearse (connection_created) y mide cada
+#   query; las que superan SOCIAL_SLOW_QUERY_MS se registran con su huella (SQL sin literales)
+#   y la ruta que la lanzó.
+# - La serialización se mide una vez por respuesta: serializer.data en las vistas (serialized()
+#   y TimedListMixin) y el render en TimedJSONRenderer. Las queries que se lanzan dentro
+#   (relaciones sin precargar) ya cuentan como base de datos y se descuentan.
+# - metrics_view expone los histogramas en formato de texto de Prometheus. Son por proceso:
+#   Prometheus suma los de todos los workers.
+# - Con SOCIAL_PROFILE_SAMPLE_RATE > 0 una fracción de las peticiones síncronas se ejecuta
+#   bajo cProfile y se registran las funciones más costosas.
+
+import cProfile
+import contextlib
+import contextvars
+import hmac
+import io
+import logging
+import pstats
+import random
+import re
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseNotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+profile_logger = logging.getLogger('social.profile')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def slow_query_ms():
+    return getattr(settings, 'SOCIAL_SLOW_QUERY_MS', 100)
+
+
+def server_timing_enabled():
+    return getattr(settings, 'SOCIAL_SERVER_TIMING', True)
+
+
+def profile_sample_rate():
+    return getattr(settings, 'SOCIAL_PROFILE_SAMPLE_RATE', 0.0)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.route = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+
+
+_current = contextvars.ContextVar('social_request_metrics', default=None)
+
+
+def current_metrics():
+    return _current.get()
+
+
+# Huella de una query: literales por ?, listas IN colapsadas y espacios normalizados, para que
+# la misma query con distintos parámetros se agrupe en el log
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:\?|%s)\s*,?)+\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    metrics = current_metrics()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        # Fuera de una petición (comandos, shell) no se mide
+        if metrics is not None:
+            elapsed = time.perf_counter() - started
+            metrics.queries += 1
+            metrics.db_time += elapsed
+            if elapsed * 1000 >= slow_query_ms():
+                route = metrics.route or '<unmatched>'
+                registry.slow_query(route)
+                logger.warning('Query lenta (%.1f ms) en %s: %s', elapsed * 1000, route, fingerprint(sql))
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+connection_created.connect(install_execute_wrapper, dispatch_uid='social.instrumentation')
+
+
+@contextlib.contextmanager
+def timed_serialization():
+    # Suma el bloque al tiempo de serialización, menos el tiempo de las queries que lance. Los
+    # bloques anidados ya están dentro del que los contiene y no se cuentan otra vez
+    metrics = current_metrics()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    started = time.perf_counter()
+    db_time = metrics.db_time
+    try:
+        yield
+    finally:
+        metrics.serializing = False
+        elapsed = time.perf_counter() - started - (metrics.db_time - db_time)
+        metrics.serialize_time += max(elapsed, 0)
+
+
+def serialized(serializer):
+    # serializer.data contado como serialización
+    with timed_serialization():
+        return serializer.data
+
+
+class TimedListMixin:
+    # ListModelMixin.list con serializer.data medido, para los ListAPIView
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialized(self.get_serializer(page, many=True)))
+        return Response(serialized(self.get_serializer(queryset, many=True)))
+
+
+class TimedJSONRenderer(JSONRenderer):
+    # El render de las respuestas de DRF cuenta como tiempo de serialización
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed_serialization():
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    METRICS = (
+        ('social_request_duration_seconds', 'Tiempo total de la petición', DURATION_BUCKETS),
+        ('social_request_db_seconds', 'Tiempo en base de datos por petición', DURATION_BUCKETS),
+        ('social_request_serialize_seconds', 'Tiempo de serialización de la respuesta', DURATION_BUCKETS),
+        ('social_request_queries', 'Queries SQL por petición', QUERY_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}  # (métrica, ruta, método) -> Histogram
+            self._slow_queries = {}  # ruta -> total
+
+    def observe(self, route, method, total, metrics):
+        values = (total, metrics.db_time, metrics.serialize_time, metrics.queries)
+        with self._lock:
+            for (name, _, buckets), value in zip(self.METRICS, values):
+                key = (name, route, method)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram(buckets)
+                self._histograms[key].observe(value)
+
+    def slow_query(self, route):
+        with self._lock:
+            self._slow_queries[route] = self._slow_queries.get(route, 0) + 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, description, _ in self.METRICS:
+                lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+                for (metric, route, method), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    labels = f'route="{escape_label(route)}",method="{method}"'
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.total}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.total}')
+            lines += ['# HELP social_slow_queries_total Queries que superan SOCIAL_SLOW_QUERY_MS',
+                      '# TYPE social_slow_queries_total counter']
+            for route, count in sorted(self._slow_queries.items()):
+                lines.append(f'social_slow_queries_total{{route="{escape_label(route)}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else '<unmatched>'
+
+
+def server_timing(total, metrics):
+    return ', '.join([
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+        f'serialize;dur={metrics.serialize_time * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ])
+
+
+class InstrumentationMiddleware:
+    # Debe ir el primero de MIDDLEWARE para medir también al resto de middlewares
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token, started = self.start()
+        try:
+            if profile_sample_rate() and random.random() < profile_sample_rate():
+                response = self.profile(request)
+            else:
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        # Las peticiones async no se perfilan: cProfile mezclaría las corrutinas concurrentes
+        metrics, token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # La ruta ya está resuelta: así las queries lentas saben qué vista las lanza
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.route = route_of(request)
+
+    def start(self):
+        metrics = RequestMetrics()
+        return metrics, _current.set(metrics), time.perf_counter()
+
+    def finish(self, request, response, metrics, started):
+        total = time.perf_counter() - started
+        metrics.route = route_of(request)
+        registry.observe(metrics.route, request.method, total, metrics)
+        if server_timing_enabled():
+            response['Server-Timing'] = server_timing(total, metrics)
+        return response
+
+    def profile(self, request):
+        profiler = cProfile.Profile()
+        response = profiler.runcall(self.get_response, request)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(25)
+        profile_logger.info('Perfil de %s %s\n%s', request.method, request.path, output.getvalue())
+        return response
+
+
+def metrics_view(request):
+    # Con SOCIAL_METRICS_TOKEN hay que enviarlo como "Authorization: Bearer <token>"; sin él
+    # solo se sirve con DEBUG
+    token = getattr(settings, 'SOCIAL_METRICS_TOKEN', None)
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    elif not settings.DEBUG:
+        return HttpResponseNotFound()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,39 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from social import ranking
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia de la puntuación del feed ordenado (p50/p99) con candidatos sintéticos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--runs', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        weights = ranking.weights()
+        now = time.time()
+        mode = 'NumPy' if ranking.np is not None else 'Python'
+        self.stdout.write(f'{"candidatos":>10} {"p50 ms":>9} {"p99 ms":>9}  ({mode})')
+        for size in options['sizes']:
+            post_ids = list(range(size))
+            created = [now - rng.expovariate(1 / 86400) for _ in post_ids]
+            likes = [int(rng.paretovariate(1.2)) for _ in post_ids]
+            comments = [int(rng.paretovariate(1.5)) for _ in post_ids]
+            social = [rng.randint(0, 3) for _ in post_ids]
+            affinity = [rng.randint(0, 10) for _ in post_ids]
+
+            timings = []
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                ranking.rank(post_ids, ranking.score(created, likes, comments, social, affinity, now, weights))
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+            self.stdout.write(f'{size:>10} {statistics.median(timings):>9.2f} {p99:>9.2f}')
@@ -0,0 +1,244 @@
+import json
+import statistics
+import time
+from collections import Counter
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from social.management.commands.compare_view_stacks import api_urlconf, percentile
+from social.models import Comment, Follow, Like, Post, UserStats
+from social.tokens import add_claims
+from social.urls import build_urlpatterns
+
+User = get_user_model()
+
+# Rutas que no se pueden medir petición a petición
+SKIPPED = {'events/': 'stream SSE abierto indefinidamente'}
+
+
+def token_for(user):
+    return add_claims(RefreshToken.for_user(user), user)
+
+
+class Command(BaseCommand):
+    help = (
+        'Recorre todas las rutas de social/urls.py con el cliente de test (WSGI) o el async (ASGI) y '
+        'mide queries, latencia p50/p95/p99 y tamaño de la respuesta. Las escrituras se deshacen '
+        'con un rollback. El resultado se guarda en JSON para comparar ejecuciones (--baseline)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Usuario que hace las peticiones (por defecto el que más cuentas sigue)')
+        parser.add_argument('--password', default='seed-password', help='Contraseña del usuario, para login/')
+        parser.add_argument('--requests', type=int, default=30, help='Peticiones medidas por ruta')
+        parser.add_argument('--warmup', type=int, default=3, help='Peticiones previas sin medir')
+        parser.add_argument('--stack', choices=['sync', 'async', 'both'], default='sync')
+        parser.add_argument('--user-query', default='seed', help='Texto para search-users/')
+        parser.add_argument('--query', default='playa', help='Texto para search/')
+        parser.add_argument('--output', help='Fichero JSON con los resultados')
+        parser.add_argument('--baseline', help='JSON de una ejecución anterior con el que comparar')
+        parser.add_argument('--threshold', type=float, default=20, help='% de empeoramiento del p50 que cuenta como regresión')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        viewer = self.get_viewer(options['user'])
+        specs = self.route_specs(viewer, options)
+        patterns = [str(pattern.pattern) for pattern in build_urlpatterns()]
+        undefined = [pattern for pattern in patterns if pattern not in specs and pattern not in SKIPPED]
+        stacks = ['sync', 'async'] if options['stack'] == 'both' else [options['stack']]
+        headers = {'Authorization': f'Bearer {token_for(viewer).access_token}'}
+
+        routes = {}
+        self.stdout.write(
+            f'{"ruta":<44} {"queries":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"bytes":>8} {"errores":>7}'
+        )
+        for stack in stacks:
+            urlconf = api_urlconf(stack == 'async')
+            with override_settings(ROOT_URLCONF=urlconf, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                client = AsyncClient() if stack == 'async' else Client()
+                for pattern in patterns:
+                    for label, method, url, data in specs.get(pattern, ()):
+                        key = f'{stack} {method} {label}'
+                        routes[key] = result = self.measure(client, stack, method, url, data, headers, options)
+                        self.stdout.write(
+                            f'{key:<44} {result["queries"]:>7} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} '
+                            f'{result["p99_ms"]:>8.2f} {result["bytes"]:>8} {result["errors"]:>7}'
+                        )
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'viewer': viewer.username,
+            'requests': options['requests'],
+            'dataset': {
+                'users': User.objects.count(),
+                'follows': Follow.objects.count(),
+                'posts': Post.objects.count(),
+                'likes': Like.objects.count(),
+                'comments': Comment.objects.count(),
+            },
+            'routes': routes,
+            'skipped': {**SKIPPED, **{pattern: 'sin petición definida en benchmark_routes' for pattern in undefined}},
+        }
+        for pattern, reason in report['skipped'].items():
+            self.stdout.write(self.style.WARNING(f'Sin medir: {pattern} ({reason})'))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {options["output"]}'))
+        if options['baseline']:
+            self.compare(report, options)
+
+    def get_viewer(self, username):
+        if username:
+            viewer = User.objects.filter(username=username).first()
+            if viewer is None:
+                raise CommandError('User does not exist')
+            return viewer
+        # El caso caro: la home de quien más cuentas sigue
+        stats = UserStats.objects.filter(post_count__gt=0).order_by('-following_count', 'user_id').first()
+        if stats is None:
+            raise CommandError('No hay datos: ejecuta antes seed_data')
+        return stats.user
+
+    def route_specs(self, viewer, options):
+        # patrón de la URL -> [(etiqueta, método, url, datos)]; los datos pueden ser una función
+        # que se evalúa antes de cada petición (fuera de la medida)
+        popular = list(
+            UserStats.objects.exclude(user_id=viewer.id).order_by('-follower_count', 'user_id').values_list('user_id', flat=True)[:50]
+        )
+        top_posts = list(Post.objects.order_by('-like_count', '-id').values_list('id', flat=True)[:50])
+        first = lambda values: values[0] if values else 0  # noqa: E731 - con id 0 la ruta responde 404
+        popular_user, top_post = first(popular), first(top_posts)
+        commented_post = Post.objects.order_by('-comment_count', '-id').values_list('id', flat=True).first() or 0
+        own_post = Post.objects.filter(user=viewer).order_by('-id').values_list('id', flat=True).first() or 0
+        own_comment = Comment.objects.filter(user=viewer).order_by('-id').values_list('id', flat=True).first() or 0
+        liked_post = Like.objects.filter(user=viewer).values_list('post_id', flat=True).first() or top_post
+        followed_user = Follow.objects.filter(follower=viewer).values_list('following_id', flat=True).first() or popular_user
+        not_followed = (
+            User.objects.exclude(id=viewer.id).exclude(followers__follower=viewer)
+            .annotate(n=Count('followers')).order_by('-n', 'id').values_list('id', flat=True).first() or 0
+        )
+        ids = lambda values: ','.join(map(str, values))  # noqa: E731
+
+        return {
+            'register/': [('register/', 'POST', '/api/register/', {
+                'username': 'benchmark_register', 'email': 'benchmark@example.com', 'password': 'Bench-passw0rd!',
+            })],
+            'login/': [('login/', 'POST', '/api/login/', {'username': viewer.username, 'password': options['password']})],
+            'token/refresh/': [('token/refresh/', 'POST', '/api/token/refresh/', lambda: {'refresh': str(token_for(viewer))})],
+            'update_user/': [('update_user/', 'PUT', '/api/update_user/', {'email': viewer.email})],
+            'user_details/': [('user_details/', 'GET', '/api/user_details/', None)],
+            'create-post/': [('create-post/', 'POST', '/api/create-post/', {'content': 'benchmark'})],
+            'user-posts/': [('user-posts/', 'GET', '/api/user-posts/', None)],
+            'all-posts/': [('all-posts/', 'GET', '/api/all-posts/', None)],
+            'like/': [('like/', 'POST', '/api/like/', {'post_id': top_post})],
+            'unlike/': [('unlike/', 'DELETE', '/api/unlike/', {'post_id': liked_post})],
+            'likes/bulk/': [('likes/bulk/', 'POST', '/api/likes/bulk/', {'post_ids': top_posts[:20]})],
+            'follows/bulk/': [('follows/bulk/', 'POST', '/api/follows/bulk/', {'user_ids': popular[:20]})],
+            'comments/bulk/': [('comments/bulk/', 'POST', '/api/comments/bulk/', {
+                'comments': [{'post_id': post_id, 'content': 'benchmark'} for post_id in top_posts[:5]],
+            })],
+            'comments/': [('comments/', 'POST', '/api/comments/', {'post_id': top_post, 'content': 'benchmark'})],
+            'comments/<int:comment_id>/': [('comments/<id>/', 'DELETE', f'/api/comments/{own_comment}/', None)],
+            'posts/<int:post_id>/comments/': [('posts/<id>/comments/', 'GET', f'/api/posts/{commented_post}/comments/', None)],
+            'users/<int:user_id>/follow/': [('users/<id>/follow/', 'POST', f'/api/users/{not_followed}/follow/', None)],
+            'users/<int:user_id>/unfollow/': [('users/<id>/unfollow/', 'POST', f'/api/users/{followed_user}/unfollow/', None)],
+            'users/<int:user_id>/followers/': [('users/<id>/followers/', 'GET', f'/api/users/{popular_user}/followers/', None)],
+            'users/<int:user_id>/following/': [('users/<id>/following/', 'GET', f'/api/users/{viewer.id}/following/', None)],
+            'home-posts/': [
+                ('home-posts/', 'GET', '/api/home-posts/', None),
+                ('home-posts/?fields=compact', 'GET', '/api/home-posts/?fields=compact', None),
+                ('home-posts/?mode=ranked', 'GET', '/api/home-posts/?mode=ranked', None),
+            ],
+            'search-users/': [('search-users/', 'GET', f'/api/search-users/?query={options["user_query"]}', None)],
+            'suggestions/': [('suggestions/', 'GET', '/api/suggestions/', None)],
+            'search/': [('search/', 'GET', f'/api/search/?q={options["query"]}', None)],
+            'user/': [('user/', 'GET', '/api/user/', None)],
+            'posts/<int:post_id>/delete/': [('posts/<id>/delete/', 'DELETE', f'/api/posts/{own_post}/delete/', None)],
+            'like-status/<int:post_id>/': [('like-status/<id>/', 'GET', f'/api/like-status/{top_post}/', None)],
+            'post/<int:post_id>/likes-count/': [('post/<id>/likes-count/', 'GET', f'/api/post/{top_post}/likes-count/', None)],
+            'follow-status/<int:user_id>/': [('follow-status/<id>/', 'GET', f'/api/follow-status/{popular_user}/', None)],
+            'like-status/': [('like-status/?ids=', 'GET', f'/api/like-status/?ids={ids(top_posts)}', None)],
+            'follow-status/': [('follow-status/?ids=', 'GET', f'/api/follow-status/?ids={ids(popular)}', None)],
+            'events/ticket/': [('events/ticket/', 'POST', '/api/events/ticket/', {})],
+            'notifications/': [('notifications/', 'GET', '/api/notifications/', None)],
+            'notifications/unread-count/': [('notifications/unread-count/', 'GET', '/api/notifications/unread-count/', None)],
+            'notifications/read/': [('notifications/read/', 'POST', '/api/notifications/read/', {})],
+            'users/<int:user_id>/': [('users/<id>/', 'GET', f'/api/users/{popular_user}/', None)],
+        }
+
+    def measure(self, client, stack, method, url, data, headers, options):
+        def send():
+            payload = data() if callable(data) else data
+            kwargs = {'headers': headers}
+            if payload is not None:
+                kwargs.update(data=json.dumps(payload), content_type='application/json')
+            if stack == 'async':
+                async def request():
+                    return await client.generic(method, url, **kwargs)
+                return async_to_sync(request)()
+            return client.generic(method, url, **kwargs)
+
+        samples = []
+        for index in range(options['warmup'] + options['requests']):
+            connection.queries_log.clear()  # Solo interesa el recuento de esta petición
+            # Las escrituras se deshacen para que todas las peticiones vean los mismos datos
+            with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = send()
+                elapsed = time.perf_counter() - started
+                transaction.set_rollback(True)
+            if index >= options['warmup']:
+                samples.append((elapsed * 1000, len(queries), response.status_code, len(response.content)))
+
+        latencies = [sample[0] for sample in samples]
+        return {
+            'method': method,
+            'url': url,
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'queries': int(statistics.median(sample[1] for sample in samples)),
+            'max_queries': max(sample[1] for sample in samples),
+            'bytes': int(statistics.median(sample[3] for sample in samples)),
+            'errors': sum(1 for sample in samples if sample[2] >= 400),
+            'status': dict(Counter(str(sample[2]) for sample in samples)),
+        }
+
+    def compare(self, report, options):
+        with open(options['baseline']) as baseline_file:
+            baseline = json.load(baseline_file)['routes']
+        threshold = options['threshold'] / 100
+        regressions = []
+        self.stdout.write(f'\n{"ruta":<44} {"p50 antes":>10} {"p50 ahora":>10} {"queries":>9}')
+        for key, result in report['routes'].items():
+            before = baseline.get(key)
+            if before is None:
+                continue
+            slower = result['p50_ms'] > before['p50_ms'] * (1 + threshold)
+            more_queries = result['queries'] > before['queries']
+            line = (
+                f'{key:<44} {before["p50_ms"]:>10.2f} {result["p50_ms"]:>10.2f} '
+                f'{before["queries"]:>4}->{result["queries"]:<4}'
+            )
+            if slower or more_queries:
+                regressions.append(key)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if regressions:
+            message = f'{len(regressions)} rutas empeoran respecto a {options["baseline"]}'
+            if options['fail_on_regression']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('Sin regresiones respecto a la ejecución anterior'))
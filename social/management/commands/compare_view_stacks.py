@@ -0,0 +1,108 @@
+import asyncio
+import statistics
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import include, path
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from social.models import Post
+from social.tokens import add_claims
+from social.urls import build_urlpatterns
+
+User = get_user_model()
+
+
+def api_urlconf(use_async):
+    module = types.ModuleType('async_urls' if use_async else 'sync_urls')
+    module.urlpatterns = [path('api/', include(build_urlpatterns(use_async)))]
+    return module
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara las vistas de lectura síncronas (WSGI, un hilo por petición) con las async '
+        '(ASGI) lanzando peticiones concurrentes en el propio proceso'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Usuario con el que se autentican las peticiones')
+        parser.add_argument('--requests', type=int, default=200, help='Peticiones por ruta y pila')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--query', default='a', help='Texto para search-users/ y search/')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError('User does not exist')
+        headers = {'Authorization': f'Bearer {add_claims(RefreshToken.for_user(user), user).access_token}'}
+        post_id = Post.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        query = options['query']
+        urls = {
+            'home': '/api/home-posts/',
+            'profile': f'/api/users/{user.id}/',
+            'comments': f'/api/posts/{post_id}/comments/',
+            'like-status': f'/api/like-status/{post_id}/',
+            'follow-status': f'/api/follow-status/{user.id}/',
+            'search-users': f'/api/search-users/?query={query}',
+            'search': f'/api/search/?q={query}',
+        }
+
+        self.stdout.write(f'{"ruta":<14} {"pila":<6} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"errores":>8}')
+        for name, url in urls.items():
+            for stack, run in (('sync', self.run_sync), ('async', self.run_async)):
+                urlconf = api_urlconf(stack == 'async')
+                with override_settings(ROOT_URLCONF=urlconf, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                    started = time.perf_counter()
+                    results = run(url, headers, options['requests'], options['concurrency'])
+                    elapsed = time.perf_counter() - started
+                latencies = [latency for latency, _ in results]
+                errors = sum(1 for _, code in results if code >= 400)
+                self.stdout.write(
+                    f'{name:<14} {stack:<6} {len(results) / elapsed:>8.1f} '
+                    f'{statistics.median(latencies) * 1000:>8.1f} {percentile(latencies, 0.95) * 1000:>8.1f} {errors:>8}'
+                )
+
+    def run_sync(self, url, headers, total, concurrency):
+        def worker(count):
+            client = Client()
+            results = []
+            try:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    response = client.get(url, headers=headers)
+                    results.append((time.perf_counter() - started, response.status_code))
+            finally:
+                close_old_connections()
+            return results
+
+        counts = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return [result for chunk in pool.map(worker, counts) for result in chunk]
+
+    def run_async(self, url, headers, total, concurrency):
+        async def main():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one():
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.get(url, headers=headers)
+                    return time.perf_counter() - started, response.status_code
+
+            return await asyncio.gather(*(one() for _ in range(total)))
+
+        return async_to_sync(main)()
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from social import suggestions
+
+
+class Command(BaseCommand):
+    help = 'Recalcula las sugerencias de a quién seguir de todos los usuarios a partir del grafo de Follow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--top-k', type=int, default=None, help='Sugerencias guardadas por usuario')
+
+    def handle(self, *args, **options):
+        total = suggestions.rebuild_all(batch_size=options['batch_size'], limit=options['top_k'])
+        mode = 'NumPy' if suggestions.np is not None else 'Python'
+        self.stdout.write(self.style.SUCCESS(f'Sugerencias de {total} usuarios recalculadas ({mode})'))
@@ -0,0 +1,28 @@
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+
+from social import sharding
+from social.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Mueve las imágenes de posts anteriores al almacenamiento por contenido, guardando cada fichero una sola vez'
+
+    def handle(self, *args, **options):
+        legacy = FileSystemStorage()
+        moved = 0
+        for alias in sharding.each_shard():
+            posts = Post.objects.using(alias).exclude(image='').exclude(image__isnull=True).exclude(image__startswith='blobs/')
+            for post in posts.iterator():
+                old_name = post.image.name
+                if not legacy.exists(old_name):
+                    self.stderr.write(f'No existe {old_name} (post {post.id})')
+                    continue
+                with legacy.open(old_name) as original:
+                    new_name = post.image.storage.save(old_name, original)
+                Post.objects.using(alias).filter(id=post.id).update(image=new_name)
+                # El mismo fichero puede estar en posts de otros shards
+                if not sharding.everywhere(Post.objects.filter(image=old_name)).exists():
+                    legacy.delete(old_name)
+                moved += 1
+        self.stdout.write(self.style.SUCCESS(f'{moved} imágenes movidas'))
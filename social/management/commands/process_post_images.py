@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from social import sharding
+from social.images import process_post_image
+from social.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Genera las variantes y el placeholder de las imágenes de posts que aún no los tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocesar también las que ya tienen variantes')
+
+    def handle(self, *args, **options):
+        processed = 0
+        for alias in sharding.each_shard():
+            posts = Post.objects.using(alias).exclude(image='').exclude(image__isnull=True)
+            if not options['all']:
+                posts = posts.filter(image_variants={})
+            for post_id in posts.values_list('id', flat=True).iterator():
+                if process_post_image(post_id) is not None:
+                    processed += 1
+        self.stdout.write(self.style.SUCCESS(f'{processed} imágenes procesadas'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from social import search
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye por lotes el índice de búsqueda de posts y comentarios'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = search.get_content_backend().rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{total} posts y comentarios indexados'))
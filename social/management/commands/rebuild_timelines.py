@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from social import timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los timelines materializados de la home a partir de los posts y los follows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='Solo estos usuarios')
+        parser.add_argument(
+            '--trim', action='store_true',
+            help='Solo recortar a SOCIAL_TIMELINE_MAX_ENTRIES los que pasan del margen (para ejecutar periódicamente)',
+        )
+
+    def handle(self, *args, **options):
+        if options['trim']:
+            trimmed = timeline.trim_timelines()
+            self.stdout.write(self.style.SUCCESS(f'{trimmed} timelines recortados'))
+            return
+        user_ids = options['user_ids'] or User.objects.values_list('id', flat=True).iterator()
+        total = 0
+        for user_id in user_ids:
+            timeline.rebuild(user_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'{total} timelines reconstruidos'))
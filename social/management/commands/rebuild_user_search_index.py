@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from social import search
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de trigramas de la búsqueda de usuarios'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = search.rebuild_user_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{total} usuarios indexados'))
@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from social import sharding
+from social.counters import post_counters, sharded_post_counts, user_counters
+from social.models import Post, UserStats
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores desnormalizados de posts y usuarios y corrige los que se hayan desajustado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fixed_posts = sum(
+            self.reconcile(Post.objects.using(alias), post_counters(), batch_size) for alias in sharding.each_shard()
+        )
+
+        # Usuarios sin fila de stats (anteriores a los contadores)
+        missing = User.objects.filter(stats__isnull=True).values_list('id', flat=True)
+        UserStats.objects.bulk_create([UserStats(user_id=user_id) for user_id in missing], batch_size=batch_size)
+
+        fixed_users = self.reconcile(UserStats.objects.all(), user_counters(), batch_size)
+        if sharding.enabled():
+            fixed_users += self.reconcile_post_counts(batch_size)
+        self.stdout.write(self.style.SUCCESS(f'{fixed_posts} posts y {fixed_users} usuarios corregidos'))
+
+    def reconcile(self, queryset, counters, batch_size):
+        fields = list(counters)
+        real = {f'real_{field}': expression for field, expression in counters.items()}
+        fixed = 0
+        last_pk = None
+        while True:
+            batch = queryset.order_by('pk')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            batch = list(batch.annotate(**real)[:batch_size])
+            if not batch:
+                return fixed
+            last_pk = batch[-1].pk
+
+            changed = []
+            for obj in batch:
+                drift = False
+                for field in fields:
+                    value = getattr(obj, f'real_{field}')
+                    if getattr(obj, field) != value:
+                        setattr(obj, field, value)
+                        drift = True
+                if drift:
+                    changed.append(obj)
+            queryset.bulk_update(changed, fields)
+            fixed += len(changed)
+
+    def reconcile_post_counts(self, batch_size):
+        # Con sharding post_count no se puede calcular con una subconsulta: se suma por shard
+        counts = sharded_post_counts()
+        changed = []
+        for stats in UserStats.objects.only('user_id', 'post_count').iterator(chunk_size=batch_size):
+            if stats.post_count != counts.get(stats.user_id, 0):
+                stats.post_count = counts.get(stats.user_id, 0)
+                changed.append(stats)
+        UserStats.objects.bulk_update(changed, ['post_count'], batch_size=batch_size)
+        return len(changed)
@@ -0,0 +1,189 @@
+# Reparte los posts, likes y comentarios entre los shards (ver social/sharding.py).
+#
+# Cada usuario va al shard que le da el hash sobre la lista --shards; solo se puede añadir
+# shards al final de la lista actual, así que solo se mueve la parte de usuarios que le toca a
+# los nuevos. Para activar el sharding sobre una base de datos existente:
+#
+#   1. reshard --shards default (con SOCIAL_SHARDS vacío): apunta los posts y comentarios
+#      existentes en PostLocation/CommentLocation y deja margen de ids para los que se creen
+#      hasta el siguiente paso.
+#   2. Desplegar con SOCIAL_SHARDS = ['default'] (todo sigue en 'default').
+#   3. Crear y migrar las bases de datos nuevas (migrate --database <alias>) y añadirlas a
+#      DATABASES. reshard --shards default,shard1,... quita de todas ellas las claves foráneas
+#      que cruzan shards (sharding.CROSS_SHARD_FOREIGN_KEYS; sin sharding se mantienen), copia a
+#      su shard a los usuarios que cambian de sitio y los apunta en UserShard, que manda sobre
+#      el hash.
+#   4. Desplegar con la lista nueva en SOCIAL_SHARDS y repetir reshard con la misma lista para
+#      mover lo que se haya escrito entretanto. reshard --prune borra las filas de UserShard
+#      que ya coinciden con el hash.
+#
+# Mientras se copia un usuario sus posts se siguen leyendo del shard de origen, pero las
+# escrituras responden 503 (sharding.UserMoving). Las marcas y la ubicación de cada usuario
+# están en la caché compartida (SOCIAL_CACHE_ALIAS): con una caché por proceso los demás
+# workers no las verían.
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from social import sharding
+from social.models import Comment, CommentLocation, Like, Post, PostLocation, UserShard
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Apunta la ubicación de posts y comentarios y mueve a cada usuario al shard que le corresponde'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', help='Lista de shards separada por comas (la actual más los nuevos al final)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Usuarios movidos a la vez')
+        parser.add_argument('--grace', type=float, default=5, help='Segundos de espera a las escrituras en curso')
+        parser.add_argument('--id-headroom', type=int, default=1000000, help='Ids reservados para lo creado antes de activar el sharding')
+        parser.add_argument('--dry-run', action='store_true', help='Solo contar lo que se movería')
+        parser.add_argument('--prune', action='store_true', help='Borrar las filas de UserShard que coinciden con el hash')
+
+    def handle(self, *args, **options):
+        if options['prune']:
+            return self.prune()
+        if not options['shards']:
+            raise CommandError('--shards is required')
+
+        target = [alias.strip() for alias in options['shards'].split(',') if alias.strip()]
+        current = sharding.shards() or [DEFAULT_DB_ALIAS]
+        unknown = [alias for alias in target if alias not in connections.settings]
+        if unknown:
+            raise CommandError(f'Unknown database aliases: {", ".join(unknown)}')
+        if target[:len(current)] != current:
+            raise CommandError(f'Shards can only be appended to the current list ({",".join(current)})')
+        if not sharding.enabled() and target != [DEFAULT_DB_ALIAS]:
+            raise CommandError("Enable SOCIAL_SHARDS = ['default'] before moving users to other shards")
+
+        if options['dry_run']:
+            for (source, destination), user_ids in sorted(self.plan(current, target).items()):
+                self.stdout.write(f'{source} -> {destination}: {len(user_ids)} usuarios')
+            return
+
+        if target != [DEFAULT_DB_ALIAS]:
+            relaxed = sum(sharding.set_foreign_keys(alias, False) for alias in target)
+            if relaxed:
+                self.stdout.write(f'{relaxed} claves foráneas quitadas')
+
+        indexed = self.index(current, options['id_headroom'])
+        moved = 0
+        for (source, destination), user_ids in sorted(self.plan(current, target).items()):
+            for start in range(0, len(user_ids), options['batch_size']):
+                batch = user_ids[start:start + options['batch_size']]
+                self.move(batch, source, destination, options['grace'])
+                moved += len(batch)
+                self.stdout.write(f'{source} -> {destination}: {moved} usuarios movidos')
+        self.stdout.write(self.style.SUCCESS(f'{indexed} posts y comentarios apuntados, {moved} usuarios movidos'))
+
+    def index(self, aliases, headroom):
+        # Ubicación de lo que no la tiene (creado antes del sharding). Es idempotente
+        total = 0
+        for alias in aliases:
+            total += self.index_rows(PostLocation, Post.objects.using(alias).values_list('id', 'user_id'))
+            total += self.index_rows(CommentLocation, Comment.objects.using(alias).values_list('id', 'post__user_id'))
+        if not sharding.enabled():
+            # Los posts que se creen hasta activar el sharding usan ids propios de 'default':
+            # los que se reserven después tienen que empezar más arriba
+            for model in (PostLocation, CommentLocation):
+                self.reserve_ids(model, headroom)
+        return total
+
+    def index_rows(self, model, rows, chunk_size=5000):
+        total = 0
+        batch = []
+        for object_id, owner_id in rows.order_by('id').iterator(chunk_size=chunk_size):
+            batch.append(model(id=object_id, owner_id=owner_id))
+            if len(batch) >= chunk_size:
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+                total += len(batch)
+                batch = []
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+        return total + len(batch)
+
+    def reserve_ids(self, model, headroom):
+        # Una fila con el id más alto más el margen, que se borra después: MySQL y SQLite no
+        # bajan el autoincremento y en PostgreSQL se ajusta la secuencia antes de borrarla
+        owner_id = User.objects.order_by('pk').values_list('pk', flat=True).first()
+        highest = model.objects.order_by('-id').values_list('id', flat=True).first()
+        if owner_id is None or highest is None:
+            return
+        connection = connections[DEFAULT_DB_ALIAS]
+        with transaction.atomic():
+            marker = model.objects.create(id=highest + headroom, owner_id=owner_id)
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+                    cursor.execute(sql)
+            marker.delete()
+
+    def plan(self, current, target):
+        # {(origen, destino): [usuarios]} según dónde están sus posts de verdad, así que volver a
+        # ejecutarlo mueve también lo escrito mientras tanto
+        plan = {}
+        for source in dict.fromkeys(current + target):
+            owners = Post.objects.using(source).order_by('user_id').values_list('user_id', flat=True).distinct()
+            for user_id in owners.iterator():
+                destination = sharding.hashed_shard(user_id, target)
+                if destination != source:
+                    plan.setdefault((source, destination), []).append(user_id)
+        return plan
+
+    def move(self, user_ids, source, destination, grace):
+        sharding.mark_moving(user_ids)
+        try:
+            time.sleep(grace)  # Las escrituras que empezaron antes de la marca terminan
+            posts = list(Post.objects.using(source).filter(user_id__in=user_ids))
+            post_ids = [post.id for post in posts]
+            likes = list(Like.objects.using(source).filter(post_id__in=post_ids))
+            comments = list(Comment.objects.using(source).filter(post_id__in=post_ids))
+
+            # Posts y comentarios conservan su id global; los likes no se buscan por id
+            for like in likes:
+                like.pk = None
+            with transaction.atomic(using=destination):
+                Post.objects.using(destination).bulk_create(posts, batch_size=1000, ignore_conflicts=True)
+                Like.objects.using(destination).bulk_create(likes, batch_size=1000, ignore_conflicts=True)
+                Comment.objects.using(destination).bulk_create(comments, batch_size=1000, ignore_conflicts=True)
+
+            owners = {post.id: post.user_id for post in posts}
+            PostLocation.objects.bulk_create(
+                [PostLocation(id=post.id, owner_id=post.user_id) for post in posts], ignore_conflicts=True
+            )
+            CommentLocation.objects.bulk_create(
+                [CommentLocation(id=comment.id, owner_id=owners[comment.post_id]) for comment in comments], ignore_conflicts=True
+            )
+            with transaction.atomic():
+                UserShard.objects.filter(user_id__in=user_ids).delete()
+                UserShard.objects.bulk_create(
+                    [UserShard(user_id=user_id, shard=destination, moved_at=timezone.now()) for user_id in user_ids]
+                )
+            sharding.get_cache().set_many(
+                {sharding.user_key(user_id): destination for user_id in user_ids}, sharding.placement_ttl()
+            )
+
+            # Sin señales: borrar el post no debe borrar su ubicación ni sus avisos
+            with transaction.atomic(using=source):
+                Like.objects.using(source).filter(post_id__in=post_ids)._raw_delete(source)
+                Comment.objects.using(source).filter(post_id__in=post_ids)._raw_delete(source)
+                Post.objects.using(source).filter(id__in=post_ids)._raw_delete(source)
+        finally:
+            sharding.clear_moving(user_ids)
+
+    def prune(self):
+        aliases = sharding.shards() or [DEFAULT_DB_ALIAS]
+        redundant = [
+            user_id
+            for user_id, shard in UserShard.objects.values_list('user_id', 'shard').iterator()
+            if shard == sharding.hashed_shard(user_id, aliases)
+        ]
+        for start in range(0, len(redundant), 1000):
+            UserShard.objects.filter(user_id__in=redundant[start:start + 1000]).delete()
+        sharding.get_cache().delete_many([sharding.user_key(user_id) for user_id in redundant])
+        self.stdout.write(self.style.SUCCESS(f'{len(redundant)} filas de UserShard borradas'))
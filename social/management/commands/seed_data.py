@@ -0,0 +1,189 @@
+import bisect
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from social import sharding
+from social.models import Comment, Follow, Like, Post
+
+User = get_user_model()
+
+WORDS = (
+    'hoy café playa música fútbol viaje libro serie foto amigos trabajo lunes proyecto ciudad '
+    'montaña lluvia sol concierto receta perro gato película código partido tarde noche'
+).split()
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+class PowerLaw:
+    # Muestreo de índices 0..n-1 con probabilidad proporcional a 1 / (rango ^ alpha): pocos
+    # elementos concentran la mayoría de los follows, likes y comentarios
+    def __init__(self, size, alpha, rng):
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(1 / (rank ** alpha) for rank in range(1, size + 1)))
+
+    def sample(self):
+        return bisect.bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+    def distinct(self, count, exclude=None):
+        # Hasta count índices distintos (menos si la distribución está muy concentrada)
+        chosen = set()
+        for _ in range(count * 3):
+            if len(chosen) >= count:
+                break
+            index = self.sample()
+            if index != exclude:
+                chosen.add(index)
+        return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera datos sintéticos con distribución de ley de potencias (usuarios, follows, posts, '
+        'likes y comentarios) con bulk_create por lotes, y recalcula los datos derivados'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--follows', type=float, default=30, help='Follows medios por usuario')
+        parser.add_argument('--posts', type=float, default=10, help='Posts medios por usuario')
+        parser.add_argument('--likes', type=float, default=40, help='Likes medios por usuario')
+        parser.add_argument('--comments', type=float, default=5, help='Comentarios medios por usuario')
+        parser.add_argument('--alpha', type=float, default=1.1, help='Exponente de la ley de potencias')
+        parser.add_argument('--days', type=int, default=30, help='Antigüedad máxima de los posts')
+        parser.add_argument('--prefix', default='seed', help='Prefijo de los nombres de usuario')
+        parser.add_argument('--password', default='seed-password')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--skip-derived', action='store_true', help='No recalcular contadores, timelines, índices ni sugerencias')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix, batch_size = options['prefix'], options['batch_size']
+        self.prefix = prefix
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'Ya hay usuarios con el prefijo {prefix}_; usa otro --prefix')
+        if set(sharding.shards()) - {'default'}:
+            # bulk_create no pasa por pre_save: genera los datos sin sharding y repártelos con reshard
+            raise CommandError('seed_data no admite SOCIAL_SHARDS; genera los datos sin sharding y usa reshard')
+
+        user_ids = self.create_users(options['users'], prefix, options['password'], batch_size)
+        popularity = PowerLaw(len(user_ids), options['alpha'], rng)
+
+        follows = self.create_follows(user_ids, popularity, options['follows'], rng, batch_size)
+        post_ids, post_authors = self.create_posts(user_ids, options['posts'], options['days'], rng, batch_size)
+        # Los posts de las cuentas populares reciben más interacción
+        rank_of = {user_id: rank for rank, user_id in enumerate(user_ids)}
+        post_ids.sort(key=lambda post_id: (rank_of[post_authors[post_id]], -post_id))
+        engagement = PowerLaw(len(post_ids), options['alpha'], rng)
+
+        likes = self.create_likes(user_ids, post_ids, engagement, options['likes'], rng, batch_size)
+        comments = self.create_comments(user_ids, post_ids, engagement, options['comments'], rng, batch_size)
+        self.stdout.write(
+            f'{len(user_ids)} usuarios, {follows} follows, {len(post_ids)} posts, {likes} likes, {comments} comentarios'
+        )
+
+        if not options['skip_derived']:
+            for command in ('reconcile_counters', 'rebuild_timelines', 'rebuild_user_search_index',
+                            'rebuild_search_index', 'compute_suggestions'):
+                call_command(command, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Datos generados'))
+
+    def sizes(self, count, mean, rng):
+        # Tamaños con cola larga (Pareto) y media aproximada `mean`
+        shape = 1.5
+        scale = mean * (shape - 1) / shape
+        return [int(scale * rng.paretovariate(shape)) for _ in range(count)]
+
+    def create_users(self, count, prefix, password, batch_size):
+        hashed = make_password(password)  # Un solo hash para todos: hashear es lo más lento
+        users = (
+            User(username=f'{prefix}_{index}', email=f'{prefix}_{index}@example.com', password=hashed)
+            for index in range(count)
+        )
+        for chunk in chunks(users, batch_size):
+            User.objects.bulk_create(chunk)
+        # MySQL no devuelve los ids de bulk_create; el orden de inserción es el de popularidad
+        return list(User.objects.filter(username__startswith=f'{prefix}_').order_by('id').values_list('id', flat=True))
+
+    def create_follows(self, user_ids, popularity, mean, rng, batch_size):
+        def rows():
+            for index, (follower_id, size) in enumerate(zip(user_ids, self.sizes(len(user_ids), mean, rng))):
+                for target in popularity.distinct(min(size, len(user_ids) - 1), exclude=index):
+                    yield Follow(follower_id=follower_id, following_id=user_ids[target])
+
+        total = 0
+        for chunk in chunks(rows(), batch_size):
+            Follow.objects.bulk_create(chunk, ignore_conflicts=True)
+            total += len(chunk)
+        return total
+
+    def create_posts(self, user_ids, mean, days, rng, batch_size):
+        now = timezone.now()
+
+        def rows():
+            for user_id, size in zip(user_ids, self.sizes(len(user_ids), mean, rng)):
+                for _ in range(size):
+                    yield Post(
+                        user_id=user_id,
+                        content=' '.join(rng.choices(WORDS, k=rng.randint(3, 30))),
+                        created_at=now - timedelta(seconds=rng.uniform(0, days * 86400)),
+                    )
+
+        for chunk in chunks(rows(), batch_size):
+            Post.objects.bulk_create(chunk)
+        posts = list(
+            Post.objects.filter(user__username__startswith=f'{self.prefix}_').values_list('id', 'user_id', 'created_at')
+        )
+        self.post_created = {post_id: created_at for post_id, _, created_at in posts}
+        authors = {post_id: user_id for post_id, user_id, _ in posts}
+        return list(authors), authors
+
+    def create_likes(self, user_ids, post_ids, engagement, mean, rng, batch_size):
+        if not post_ids:
+            return 0
+
+        def rows():
+            for user_id, size in zip(user_ids, self.sizes(len(user_ids), mean, rng)):
+                for index in engagement.distinct(min(size, len(post_ids))):
+                    yield Like(user_id=user_id, post_id=post_ids[index])
+
+        total = 0
+        for chunk in chunks(rows(), batch_size):
+            Like.objects.bulk_create(chunk, ignore_conflicts=True)
+            total += len(chunk)
+        return total
+
+    def create_comments(self, user_ids, post_ids, engagement, mean, rng, batch_size):
+        if not post_ids:
+            return 0
+        now = timezone.now()
+
+        def rows():
+            for user_id, size in zip(user_ids, self.sizes(len(user_ids), mean, rng)):
+                for _ in range(size):
+                    post_id = post_ids[engagement.sample()]
+                    created = self.post_created[post_id]
+                    yield Comment(
+                        user_id=user_id,
+                        post_id=post_id,
+                        content=' '.join(rng.choices(WORDS, k=rng.randint(2, 15))),
+                        created_at=created + (now - created) * rng.random(),  # Siempre después del post
+                    )
+
+        total = 0
+        for chunk in chunks(rows(), batch_size):
+            Comment.objects.bulk_create(chunk)
+            total += len(chunk)
+        return total
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0014_user_search_grams'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('kind', models.CharField(choices=[('post', 'Post'), ('comment', 'Comment')], max_length=7)),
+                ('object_id', models.BigIntegerField()),
+                ('frequency', models.PositiveIntegerField(default=1)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='social.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'object_id'], name='contenttoken_object_idx')],
+                'unique_together': {('token', 'kind', 'object_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:31
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def merge_m2m_follows(apps, schema_editor):
+    # Pasa las filas de la M2M social.User.followers a Follow. Los usuarios de la app son los de
+    # AUTH_USER_MODEL, así que se emparejan por username; las filas sin pareja se descartan.
+    # Después conviene ejecutar rebuild_timelines para que las homes incluyan los nuevos follows.
+    SocialUser = apps.get_model('social', 'User')
+    AuthUser = apps.get_model(settings.AUTH_USER_MODEL)
+    Follow = apps.get_model('social', 'Follow')
+    UserStats = apps.get_model('social', 'UserStats')
+    through = SocialUser.followers.through
+
+    usernames = dict(SocialUser.objects.values_list('id', 'username'))
+    if not usernames:
+        return
+    auth_ids = dict(AuthUser.objects.filter(username__in=usernames.values()).values_list('username', 'id'))
+
+    rows = []
+    for from_id, to_id in through.objects.values_list('from_user_id', 'to_user_id').iterator():
+        # to_user está en from_user.followers: to_user sigue a from_user
+        follower_id = auth_ids.get(usernames.get(to_id))
+        following_id = auth_ids.get(usernames.get(from_id))
+        if follower_id and following_id and follower_id != following_id:
+            rows.append(Follow(follower_id=follower_id, following_id=following_id))
+    Follow.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+    # Mismo recuento que counters.user_counters(), con los modelos históricos
+    touched = {row.follower_id for row in rows} | {row.following_id for row in rows}
+    UserStats.objects.bulk_create([UserStats(user_id=user_id) for user_id in touched], ignore_conflicts=True)
+
+    def count_of(field):
+        counted = Follow.objects.filter(**{field: OuterRef('pk')}).values(field).annotate(n=Count('*')).values('n')
+        return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+    UserStats.objects.filter(user_id__in=touched).update(
+        follower_count=count_of('following'),
+        following_count=count_of('follower'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0017_user_suggestions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_m2m_follows, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='user',
+            name='followers',
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following', 'follower', 'created_at'], name='follow_following_cover_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following', '-created_at', '-id'], name='follow_followers_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', '-created_at', '-id'], name='follow_following_recent_idx'),
+        ),
+    ]
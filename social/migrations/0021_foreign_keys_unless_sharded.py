@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class AlterFieldUnlessSharded(migrations.AlterField):
+    # Recupera las FK que 0020 quitaba siempre. Con SOCIAL_SHARDS la base de datos se queda sin
+    # ellas (el post o el usuario puede estar en otra); al activar el sharding sobre una base que
+    # ya las tiene las quita reshard (sharding.set_foreign_keys)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if not getattr(settings, 'SOCIAL_SHARDS', []):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if not getattr(settings, 'SOCIAL_SHARDS', []):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0020_sharding'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AlterFieldUnlessSharded(
+            model_name='comment',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        AlterFieldUnlessSharded(
+            model_name='contenttoken',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='social.post'),
+        ),
+        AlterFieldUnlessSharded(
+            model_name='like',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        AlterFieldUnlessSharded(
+            model_name='notification',
+            name='post',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='social.post'),
+        ),
+        AlterFieldUnlessSharded(
+            model_name='post',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='posts', to=settings.AUTH_USER_MODEL),
+        ),
+        AlterFieldUnlessSharded(
+            model_name='timelineentry',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='social.post'),
+        ),
+    ]
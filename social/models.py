@@ -4,18 +4,33 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
+from .storage import post_image_storage
 
 class Post(models.Model):
+    # Con sharding la FK se quita de la base de datos: el post puede estar en otra (ver sharding.py)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     content = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
-    image = models.ImageField(upload_to='posts/', null=True, blank=True)
+    image = models.ImageField(upload_to='posts/', storage=post_image_storage, null=True, blank=True)
+    # Variantes redimensionadas y placeholder generados en segundo plano (ver images.py)
+    image_variants = models.JSONField(default=dict, blank=True)
+    image_placeholder = models.TextField(blank=True, default='')
+    # Contadores desnormalizados, se actualizan con F() al dar like/comentar (ver counters.py)
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Paginación por cursor de los posts de un usuario y de la home
+            models.Index(fields=['user', '-created_at', '-id'], name='post_user_recent_idx'),
+            models.Index(fields=['-created_at', '-id'], name='post_recent_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} - {self.created_at}'
 
 class Like(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)  # Vive en el shard del post
     post = models.ForeignKey(Post, related_name='likes', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -26,11 +41,16 @@ class Like(models.Model):
         return f'{self.user.username} liked {self.post.id}'
     
 class Comment(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)  # Vive en el shard del post
     post = models.ForeignKey(Post, related_name='comments', on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx'),
+        ]
+
     def __str__(self):
         return f'Comment by {self.user.username} on {self.post.id}'
     
@@ -40,14 +60,161 @@ class Follow(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        unique_together = ('follower', 'following')
+        unique_together = ('follower', 'following')  # También sirve de índice (follower, following)
+        indexes = [
+            # "¿Quién sigue a X?" (fan-out, avisos, seguidos en común) se resuelve solo con el índice
+            models.Index(fields=['following', 'follower', 'created_at'], name='follow_following_cover_idx'),
+            # Listados paginados por cursor de seguidores y seguidos
+            models.Index(fields=['following', '-created_at', '-id'], name='follow_followers_recent_idx'),
+            models.Index(fields=['follower', '-created_at', '-id'], name='follow_following_recent_idx'),
+        ]
     
     def __str__(self):
         return f'{self.follower.username} follows {self.following.username}'
     
+class MediaBlob(models.Model):
+    # Fichero guardado por contenido (ver storage.py) y cuántas referencias lo usan
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.ref_count} refs)'
+
+class UserStats(models.Model):
+    # Contadores desnormalizados del usuario para no hacer COUNT(*) en cada perfil
+    user = models.OneToOneField(User, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0)
+    unread_notifications = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['-follower_count'], name='stats_follower_count_idx')]
+
+    def __str__(self):
+        return f'Stats of {self.user_id}'
+
+class UserSearchGram(models.Model):
+    # Índice de trigramas del nombre de usuario para búsquedas por subcadena (ver search.py)
+    gram = models.CharField(max_length=3)
+    user = models.ForeignKey(User, related_name='search_grams', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('gram', 'user')
+
+    def __str__(self):
+        return f'{self.gram} -> {self.user_id}'
+
+class ContentToken(models.Model):
+    # Índice invertido del contenido de posts y comentarios (ver search.TokenTableBackend)
+    POST = 'post'
+    COMMENT = 'comment'
+    KIND_CHOICES = [(POST, 'Post'), (COMMENT, 'Comment')]
+
+    token = models.CharField(max_length=64)
+    kind = models.CharField(max_length=7, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    # El post o el post del comentario; con sharding puede estar en otro shard
+    post = models.ForeignKey(Post, related_name='+', on_delete=models.CASCADE)
+    frequency = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('token', 'kind', 'object_id')
+        indexes = [models.Index(fields=['kind', 'object_id'], name='contenttoken_object_idx')]
+
+    def __str__(self):
+        return f'{self.token} in {self.kind} {self.object_id}'
+
+class Notification(models.Model):
+    # Aviso agregado: los eventos iguales sin leer (mismo tipo y post) se acumulan en una sola
+    # fila, "A y 12 más dieron like a tu post" (ver notifications.py)
+    LIKE = 'like'
+    COMMENT = 'comment'
+    FOLLOW = 'follow'
+    VERB_CHOICES = [(LIKE, 'Like'), (COMMENT, 'Comment'), (FOLLOW, 'Follow')]
+
+    recipient = models.ForeignKey(User, related_name='notifications', on_delete=models.CASCADE)
+    verb = models.CharField(max_length=7, choices=VERB_CHOICES)
+    post = models.ForeignKey(Post, related_name='+', null=True, blank=True, on_delete=models.CASCADE)
+    actor_count = models.PositiveIntegerField(default=1)
+    latest_actors = models.JSONField(default=list)  # Los últimos usuarios, [{id, username}]
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', '-updated_at', '-id'], name='notification_inbox_idx'),
+            models.Index(fields=['recipient', 'verb', 'post', 'is_read'], name='notification_group_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.verb} x{self.actor_count} for {self.recipient_id}'
+
+class UserSuggestions(models.Model):
+    # Sugerencias de a quién seguir precalculadas (ver suggestions.py): [[user_id, seguidos en común], ...]
+    user = models.OneToOneField(User, primary_key=True, related_name='follow_suggestions', on_delete=models.CASCADE)
+    items = models.JSONField(default=list)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'Suggestions for {self.user_id}'
+
+class TimelineEntry(models.Model):
+    # Timeline materializado (fan-out on write): una fila por post y por usuario que lo ve en su home
+    owner = models.ForeignKey(User, related_name='timeline_entries', on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name='timeline_entries', on_delete=models.CASCADE)
+    author = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    created_at = models.DateTimeField()  # Copia de post.created_at para ordenar sin join
+
+    class Meta:
+        unique_together = ('owner', 'post')
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_recent_idx'),
+            models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} in timeline of {self.owner_id}'
+
+class PostLocation(models.Model):
+    # Con sharding (ver sharding.py) el id de cada post se reserva aquí, en 'default', antes de
+    # guardarlo en su shard: los ids son únicos entre shards y el post se localiza por su dueño
+    owner = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f'Post {self.id} of {self.owner_id}'
+
+class CommentLocation(models.Model):
+    # Igual para los comentarios; el dueño es el autor del post, con el que vive el comentario
+    owner = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f'Comment {self.id} in shard of {self.owner_id}'
+
+class UserShard(models.Model):
+    # Usuarios que el comando reshard ha movido a un shard distinto del que les da el hash
+    user = models.OneToOneField(User, primary_key=True, related_name='+', on_delete=models.CASCADE)
+    shard = models.CharField(max_length=64)
+    moved_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.shard}'
+
+class ClaimsUser(User):
+    # Usuario construido con los claims del access token (ver tokens.py), sin leer su fila.
+    # Sirve para filtrar y asignar claves foráneas; para modificarlo hay que cargar la fila real
+    class Meta:
+        proxy = True
+
+    def save(self, *args, **kwargs):
+        raise TypeError('ClaimsUser only carries token claims; load the User row to modify it')
+
 class User(AbstractUser):
-    # Relación para los seguidores
-    followers = models.ManyToManyField('self', related_name='following', symmetrical=False)
+    # Los seguidores viven solo en Follow (la antigua M2M followers se fusionó en la migración 0018)
 
     # Cambiar el related_name de los grupos y permisos para evitar conflictos
     groups = models.ManyToManyField(
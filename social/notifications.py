@@ -0,0 +1,69 @@
+# Bandeja de avisos (likes, comentarios y follows recibidos).
+#
+# Los avisos se agregan al escribir: mientras haya uno sin leer del mismo tipo sobre el mismo
+# post (o de follow), los nuevos se suman a esa fila en vez de crear otra, guardando cuántos
+# usuarios son y los últimos. El número de avisos sin leer está en UserStats y se mantiene con
+# F(), así que la bandeja no necesita un COUNT(*) en cada carga.
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import counters
+from .models import Notification
+
+
+def latest_actors_size():
+    return getattr(settings, 'SOCIAL_NOTIFICATION_ACTORS', 3)
+
+
+def notify(recipient_id, verb, actor, post_id=None):
+    if recipient_id == actor.id:
+        return None  # Nadie recibe avisos de sus propias acciones
+    entry = {'id': actor.id, 'username': actor.username}
+    with transaction.atomic():
+        # El bloqueo evita que dos likes a la vez abran dos grupos o pierdan un actor
+        group = (
+            Notification.objects.select_for_update()
+            .filter(recipient_id=recipient_id, verb=verb, post_id=post_id, is_read=False)
+            .order_by('-updated_at', '-id')
+            .first()
+        )
+        if group is None:
+            counters.bump_user(recipient_id, unread_notifications=1)
+            return Notification.objects.create(recipient_id=recipient_id, verb=verb, post_id=post_id, latest_actors=[entry])
+
+        others = [other for other in group.latest_actors if other['id'] != actor.id]
+        if len(others) == len(group.latest_actors):
+            group.actor_count += 1  # Usuario nuevo en el grupo
+        group.latest_actors = [entry] + others[:latest_actors_size() - 1]
+        group.updated_at = timezone.now()
+        group.save(update_fields=['actor_count', 'latest_actors', 'updated_at'])
+        return group
+
+
+def mark_read(user_id, ids=None):
+    unread = Notification.objects.filter(recipient_id=user_id, is_read=False)
+    if ids is not None:
+        unread = unread.filter(id__in=ids)
+    marked = unread.update(is_read=True)
+    if marked:
+        counters.bump_user(user_id, unread_notifications=-marked)
+    return marked
+
+
+def discard_for_post(post_id):
+    # Al borrar un post: sus avisos se borran aquí y no por el CASCADE, para restar los que no
+    # se habían leído del contador de cada destinatario (y porque con sharding los avisos
+    # están en 'default', no en el shard del post que recorre el CASCADE)
+    with transaction.atomic(using=router.db_for_write(Notification)):
+        groups = Notification.objects.filter(post_id=post_id)
+        unread = list(groups.filter(is_read=False).order_by().values_list('recipient_id').annotate(n=Count('*')))
+        groups.delete()
+        for recipient_id, count in unread:
+            counters.bump_user(recipient_id, unread_notifications=-count)
+
+
+def unread_count(user_id):
+    return counters.get_user_stats(user_id).unread_notifications
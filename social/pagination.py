@@ -0,0 +1,238 @@
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    # Paginación por cursor opaco sobre (created_at, id): cada página cuesta lo mismo
+    # sin importar lo lejos que haya llegado el cliente, a diferencia de OFFSET.
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        default = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 20
+        maximum = getattr(settings, 'SOCIAL_MAX_PAGE_SIZE', 100)
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, default))
+        except (TypeError, ValueError):
+            size = default
+        return max(1, min(size, maximum))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # Versión para vistas async: la página se lee con iteración asíncrona del ORM
+        page = self.page_queryset(queryset, request)
+        if isinstance(page, list):
+            return self.finish_page(page)  # Listas ya calculadas (resultados ordenados)
+        return self.finish_page([obj async for obj in page])
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position))
+
+        # Se pide una fila de más para saber si hay página siguiente
+        return queryset[:self.page_size + 1]
+
+    def get_window(self, request):
+        # (posición del cursor, filas a pedir) para acotar una consulta antes de pasarla a
+        # page_queryset (ver timeline.home_feed). Las fechas de la posición ya van como datetime
+        position = self.decode_cursor(request)
+        if position is not None:
+            position = [
+                parse_datetime(value) if field.lstrip('-').endswith('_at') else value
+                for field, value in zip(self.ordering, position)
+            ]
+        return position, self.get_page_size(request) + 1
+
+    def finish_page(self, results):
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.next_position = self.get_position(results[-1]) if self.has_next else None
+        return results
+
+    def keyset_filter(self, position):
+        # (a, b) < (x, y)  ==>  a < x OR (a = x AND b < y), respetando el sentido de cada campo
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def get_position(self, instance):
+        return [getattr(instance, field.lstrip('-')) for field in self.ordering]
+
+    def encode_cursor(self, position):
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in position]
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            position = json.loads(raw)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        self.check_position(position)
+        return position
+
+    def check_position(self, position):
+        # Cada valor tiene que ser del tipo de su campo: con otro el ORM fallaría con un 500
+        for field, value in zip(self.ordering, position):
+            if field.lstrip('-').endswith('_at'):
+                try:
+                    valid = isinstance(value, str) and parse_datetime(value) is not None
+                except ValueError:  # Con formato de fecha pero imposible (mes 13)
+                    valid = False
+            else:
+                valid = isinstance(value, int) and not isinstance(value, bool)
+            if not valid:
+                raise NotFound(self.invalid_cursor_message)
+
+    def get_next_cursor(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_next_link(self):
+        cursor = self.get_next_cursor()
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class PostPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class CommentPagination(KeysetPagination):
+    # Los comentarios se leen en orden cronológico
+    ordering = ('created_at', 'id')
+
+
+class NotificationPagination(KeysetPagination):
+    # Un aviso agregado vuelve arriba al sumar actores
+    ordering = ('-updated_at', '-id')
+
+
+class FollowPagination(KeysetPagination):
+    # Listas de seguidores y seguidos, primero los follows más recientes
+    ordering = ('-created_at', '-id')
+
+
+class RankedPagination(KeysetPagination):
+    # Para resultados ya ordenados por relevancia y limitados (búsquedas): el cursor
+    # guarda la posición dentro de esa lista acotada
+    ordering = ('offset',)
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        self.offset = position[0] if position is not None else 0
+        if not isinstance(self.offset, int) or self.offset < 0:
+            raise NotFound(self.invalid_cursor_message)
+        return queryset[self.offset:self.offset + self.page_size + 1]
+
+    def finish_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.next_position = [self.offset + self.page_size] if self.has_next else None
+        return results[:self.page_size]
+
+
+class SearchPagination(KeysetPagination):
+    # Resultados de búsqueda por relevancia. El cursor lleva también los pesos de los
+    # términos de la primera página, para que las puntuaciones no cambien entre páginas.
+    # Va firmado: el cliente no puede cambiar los pesos ni la posición
+    ordering = ('-matched', '-score', '-object_id')
+    signing_salt = 'social.pagination.search'
+    max_weight = 100000  # Muy por encima de cualquier idf real (ver TokenTableBackend.weights)
+
+    def get_position(self, row):
+        return [row[field.lstrip('-')] for field in self.ordering]
+
+    def get_cursor_weights(self, request, terms):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        weights = self.decode_payload(encoded).get('weights')
+        # Los pesos son los de la consulta del cursor: con otra q el cursor no vale
+        if not isinstance(weights, dict) or set(weights) != set(terms):
+            raise NotFound(self.invalid_cursor_message)
+        for weight in weights.values():
+            if not isinstance(weight, int) or isinstance(weight, bool) or not 0 <= weight <= self.max_weight:
+                raise NotFound(self.invalid_cursor_message)
+        return weights
+
+    def decode_payload(self, encoded):
+        try:
+            payload = signing.loads(encoded, salt=self.signing_salt)
+        except signing.BadSignature:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(payload, dict):
+            raise NotFound(self.invalid_cursor_message)
+        return payload
+
+    def paginate_queryset(self, queryset, request, view=None, weights=None):
+        self.weights = weights
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None, weights=None):
+        self.weights = weights
+        return await super().apaginate_queryset(queryset, request, view)
+
+    def encode_cursor(self, position):
+        return signing.dumps({'position': position, 'weights': self.weights}, salt=self.signing_salt, compress=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        position = self.decode_payload(encoded).get('position')
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        self.check_position(position)
+        return position
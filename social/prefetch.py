@@ -0,0 +1,99 @@
+# Carga en lote de todo lo que necesitan los serializers, para que una página
+# cueste un número fijo de queries en vez de varias por post o por comentario.
+
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+
+from . import sharding
+from .models import Comment, Follow, Like
+from .serializers import latest_comments_size, requested_fields
+
+
+def prefetch_comments(queryset):
+    return sharding.select_user(queryset)
+
+
+def prefetch_posts(queryset):
+    return sharding.select_user(queryset).prefetch_related(
+        'likes',
+        Prefetch('comments', queryset=prefetch_comments(Comment.objects.order_by('created_at', 'id'))),
+    )
+
+
+def prefetch_compact_posts(queryset):
+    # Sin lista de likes y solo los últimos N comentarios de cada post
+    latest = prefetch_comments(Comment.objects.order_by('-created_at', '-id'))[:latest_comments_size()]
+    return sharding.select_user(queryset).prefetch_related(
+        Prefetch('comments', queryset=latest, to_attr='latest_comments'),
+    )
+
+
+def prefetch_post_page(request, queryset):
+    compact, _ = requested_fields(request)
+    return prefetch_compact_posts(queryset) if compact else prefetch_posts(queryset)
+
+
+def liked_post_ids(viewer, post_ids):
+    post_ids = set(post_ids)
+    if viewer is None or not viewer.is_authenticated or not post_ids:
+        return set()
+    # Con sharding, los likes están en el shard de cada post
+    likes = sharding.for_posts(Like.objects.filter(user_id=viewer.id), post_ids, 'post_id')
+    return set(likes.values_list('post_id', flat=True))
+
+
+def followed_ids(viewer, user_ids):
+    # Ids (dentro de user_ids) que sigue el usuario en sesión, en una sola query
+    user_ids = set(user_ids)
+    if viewer is None or not viewer.is_authenticated or not user_ids:
+        return set()
+    return set(
+        Follow.objects.filter(follower_id=viewer.id, following_id__in=user_ids).values_list('following_id', flat=True)
+    )
+
+
+async def aliked_post_ids(viewer, post_ids):
+    post_ids = set(post_ids)
+    if viewer is None or not viewer.is_authenticated or not post_ids:
+        return set()
+    likes = await sync_to_async(sharding.for_posts)(Like.objects.filter(user_id=viewer.id), post_ids, 'post_id')
+    return {post_id async for post_id in likes.values_list('post_id', flat=True)}
+
+
+async def afollowed_ids(viewer, user_ids):
+    user_ids = set(user_ids)
+    if viewer is None or not viewer.is_authenticated or not user_ids:
+        return set()
+    return {
+        user_id
+        async for user_id in Follow.objects.filter(follower_id=viewer.id, following_id__in=user_ids).values_list('following_id', flat=True)
+    }
+
+
+def comment_author_ids(posts):
+    return {comment.user_id for post in posts for comment in post.comments.all()}
+
+
+def post_page_context(request, posts, viewer_fields=True):
+    compact, fields = requested_fields(request)
+    context = {'request': request, 'fields': fields}
+    if not viewer_fields:
+        # Representación independiente del usuario en sesión (para la caché de respuestas)
+        context['followed_ids'] = context['liked_post_ids'] = frozenset()
+    elif compact:
+        context['liked_post_ids'] = liked_post_ids(request.user, [post.id for post in posts])
+    else:
+        context['followed_ids'] = followed_ids(request.user, comment_author_ids(posts))
+    return context
+
+
+async def apost_page_context(request, posts, viewer_fields=True):
+    compact, fields = requested_fields(request)
+    context = {'request': request, 'fields': fields}
+    if not viewer_fields:
+        context['followed_ids'] = context['liked_post_ids'] = frozenset()
+    elif compact:
+        context['liked_post_ids'] = await aliked_post_ids(request.user, [post.id for post in posts])
+    else:
+        context['followed_ids'] = await afollowed_ids(request.user, comment_author_ids(posts))
+    return context
@@ -0,0 +1,194 @@
+# Home ordenada por relevancia ("Para ti", home-posts/?mode=ranked).
+#
+# Candidatos: los posts del timeline del usuario y los que han recibido likes de los
+# usuarios que sigue, hasta SOCIAL_RANKED_FEED_CANDIDATES. Cada candidato se puntúa con la
+# antigüedad (decae a la mitad cada half_life horas), la velocidad de likes y comentarios, la
+# afinidad con el autor (likes previos del usuario a sus posts) y cuántos seguidos le han dado
+# like. La puntuación se calcula de una vez sobre arrays de NumPy (o en Python si no está).
+#
+# Cada fase comprueba el presupuesto de tiempo (SOCIAL_RANKED_FEED_BUDGET_MS): si se agota,
+# se omiten las fuentes opcionales y se ordena con lo que haya. La lista ordenada se guarda en
+# la caché unos minutos para que las páginas siguientes no la recalculen ni cambien de orden.
+
+import logging
+import math
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+from django.utils import timezone
+
+from . import sharding, timeline
+from .models import Follow, Like, Post
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEIGHTS = {
+    'recency': 1.0,
+    'velocity': 0.6,
+    'affinity': 0.8,
+    'social': 0.5,
+}
+HALF_LIFE_HOURS = 12.0
+VELOCITY_GRAVITY = 1.5
+ENGAGEMENT_WINDOW = timedelta(days=3)
+AFFINITY_WINDOW = timedelta(days=30)
+
+
+def candidate_cap():
+    return getattr(settings, 'SOCIAL_RANKED_FEED_CANDIDATES', 1000)
+
+
+def budget_ms():
+    return getattr(settings, 'SOCIAL_RANKED_FEED_BUDGET_MS', 150)
+
+
+def cache_timeout():
+    return getattr(settings, 'SOCIAL_RANKED_FEED_CACHE_TIMEOUT', 300)
+
+
+def weights():
+    return {**DEFAULT_WEIGHTS, **getattr(settings, 'SOCIAL_RANKED_FEED_WEIGHTS', {})}
+
+
+class Candidates:
+    # Columnas paralelas, una posición por post candidato
+    def __init__(self):
+        self.post_ids, self.author_ids, self.created, self.likes, self.comments, self.social = [], [], [], [], [], []
+        self.position = {}
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    def add(self, post_id, author_id, created_at, likes, comments, social=0):
+        if post_id in self.position:
+            return
+        self.position[post_id] = len(self.post_ids)
+        self.post_ids.append(post_id)
+        self.author_ids.append(author_id)
+        self.created.append(created_at.timestamp())
+        self.likes.append(likes)
+        self.comments.append(comments)
+        self.social.append(social)
+
+
+POST_COLUMNS = ('id', 'user_id', 'created_at', 'like_count', 'comment_count')
+
+
+def gather(user, cap, deadline):
+    # Devuelve (candidatos, afinidad por autor, degradado)
+    candidates = Candidates()
+    for row in timeline.home_feed(user, limit=cap).values_list(*POST_COLUMNS)[:cap]:
+        candidates.add(*row)
+
+    degraded = time.monotonic() >= deadline
+    if not degraded and len(candidates) < cap:
+        # Posts con likes recientes de los usuarios que sigue (aunque no siga a su autor)
+        following_ids = Follow.objects.filter(follower_id=user.id).values('following_id')
+        if sharding.enabled():
+            following_ids = list(following_ids.values_list('following_id', flat=True))  # Follow está en 'default'
+        engaged = (
+            Like.objects.filter(user_id__in=following_ids, created_at__gte=timezone.now() - ENGAGEMENT_WINDOW)
+            .exclude(post__user_id=user.id)
+            .values('post_id')
+            .annotate(n=Count('*'))
+            .order_by('-n', '-post_id')
+            .values_list('post_id', 'n')
+        )
+        # Cada post está en un solo shard, así que su recuento también
+        engaged = dict(sharding.everywhere(engaged)[:cap])
+        for post_id, social in engaged.items():
+            if post_id in candidates.position:
+                candidates.social[candidates.position[post_id]] = social
+        missing = [post_id for post_id in engaged if post_id not in candidates.position][:cap - len(candidates)]
+        for row in sharding.for_posts(Post.objects.all(), missing).values_list(*POST_COLUMNS):
+            candidates.add(*row, social=engaged[row[0]])
+
+    affinity = {}
+    if time.monotonic() >= deadline:
+        degraded = True
+    elif len(candidates):
+        # Los likes del usuario a un autor están en el shard de ese autor
+        likes = Like.objects.filter(user_id=user.id, created_at__gte=timezone.now() - AFFINITY_WINDOW)
+        affinity = dict(
+            sharding.for_users(likes, set(candidates.author_ids), 'post__user_id')
+            .values('post__user_id')
+            .annotate(n=Count('*'))
+            .values_list('post__user_id', 'n')
+        )
+    return candidates, affinity, degraded
+
+
+def score(created, likes, comments, social, affinity, now, weights):
+    # Todas las entradas son secuencias paralelas; devuelve la puntuación de cada candidato
+    if np is None:
+        return [
+            _score_one(c, l, m, s, a, now, weights)
+            for c, l, m, s, a in zip(created, likes, comments, social, affinity)
+        ]
+    age_hours = np.maximum(now - np.asarray(created, dtype=np.float64), 0) / 3600
+    recency = np.exp2(-age_hours / HALF_LIFE_HOURS)
+    engagement = np.asarray(likes, dtype=np.float64) + 2 * np.asarray(comments, dtype=np.float64)
+    velocity = np.log1p(engagement / np.power(age_hours + 2, VELOCITY_GRAVITY))
+    return (
+        weights['recency'] * recency
+        + weights['velocity'] * velocity
+        + weights['affinity'] * np.log1p(np.asarray(affinity, dtype=np.float64))
+        + weights['social'] * np.log1p(np.asarray(social, dtype=np.float64))
+    )
+
+
+def _score_one(created, likes, comments, social, affinity, now, weights):
+    age_hours = max(now - created, 0) / 3600
+    return (
+        weights['recency'] * 2 ** (-age_hours / HALF_LIFE_HOURS)
+        + weights['velocity'] * math.log1p((likes + 2 * comments) / (age_hours + 2) ** VELOCITY_GRAVITY)
+        + weights['affinity'] * math.log1p(affinity)
+        + weights['social'] * math.log1p(social)
+    )
+
+
+def rank(post_ids, scores):
+    # Mayor puntuación primero; a igualdad, el post más nuevo (id mayor)
+    if np is None:
+        return [post_id for _, post_id in sorted(zip(scores, post_ids), key=lambda item: (-item[0], -item[1]))]
+    ids = np.asarray(post_ids, dtype=np.int64)
+    return ids[np.lexsort((-ids, -np.asarray(scores)))].tolist()
+
+
+def ranked_post_ids(user):
+    started = time.monotonic()
+    deadline = started + budget_ms() / 1000
+    candidates, affinity, degraded = gather(user, candidate_cap(), deadline)
+    author_affinity = [affinity.get(author_id, 0) for author_id in candidates.author_ids]
+    scores = score(
+        candidates.created, candidates.likes, candidates.comments, candidates.social, author_affinity,
+        timezone.now().timestamp(), weights(),
+    )
+    ranked = rank(candidates.post_ids, scores)
+    elapsed_ms = (time.monotonic() - started) * 1000
+    if degraded:
+        logger.info('Feed ordenado degradado para %s: %d candidatos en %.1f ms', user.id, len(candidates), elapsed_ms)
+    return ranked
+
+
+def ranked_key(user_id):
+    return f'feed:ranked:{user_id}'
+
+
+def cached_ranked_post_ids(user, refresh):
+    # La primera página recalcula; las siguientes reutilizan la misma ordenación
+    key = ranked_key(user.id)
+    cache = caches[getattr(settings, 'SOCIAL_CACHE_ALIAS', 'default')]
+    ranked = None if refresh else cache.get(key)
+    if ranked is None:
+        ranked = ranked_post_ids(user)
+        cache.set(key, ranked, cache_timeout())
+    return ranked
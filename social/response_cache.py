@@ -0,0 +1,236 @@
+# Caché de respuestas de perfil y listados de posts con invalidación exacta.
+#
+# Cada usuario y cada post tienen un número de versión en la caché. Las claves de las
+# respuestas incluyen las versiones de lo que contienen, así que al escribir basta con
+# subir la versión: las entradas antiguas dejan de usarse y caducan solas.
+# Lo que depende de quién mira (is_followed, viewer_has_liked) no se guarda en la caché,
+# se recalcula en cada petición con apply_viewer_fields.
+#
+# Las mismas versiones sirven de validadores para los GET condicionales (Validators): el ETag
+# resume las versiones de lo que contiene la respuesta. Entre ellas va la versión del usuario
+# en sesión, que sube al seguir o dejar de seguir, así que también cubren is_followed;
+# viewer_has_liked cambia con la versión del post. Si el cliente ya tiene esa versión recibe
+# un 304 sin construir la respuesta. No se envía Last-Modified: con resolución de segundos,
+# un cambio en el mismo segundo que el anterior daría un 304 con datos viejos.
+
+import hashlib
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from .prefetch import afollowed_ids, aliked_post_ids, followed_ids, liked_post_ids
+
+
+def get_cache():
+    return caches[getattr(settings, 'SOCIAL_CACHE_ALIAS', 'default')]
+
+
+def cache_timeout():
+    return getattr(settings, 'SOCIAL_CACHE_TIMEOUT', 600)
+
+
+def version_key(kind, obj_id):
+    return f'social:v:{kind}:{obj_id}'
+
+
+def get_versions(kind, obj_ids):
+    cache = get_cache()
+    keys = {version_key(kind, obj_id): obj_id for obj_id in obj_ids}
+    found = cache.get_many(list(keys))
+    versions = {keys[key]: value for key, value in found.items()}
+    missing = [obj_id for obj_id in keys.values() if obj_id not in versions]
+    if missing:
+        # Si la versión se ha perdido (desalojo, reinicio) se parte de la hora actual, así
+        # nunca coincide con una versión anterior que pudiera seguir en la caché
+        now = int(time.time() * 1000)
+        for obj_id in missing:
+            cache.add(version_key(kind, obj_id), now, None)
+        found = cache.get_many([version_key(kind, obj_id) for obj_id in missing])
+        for obj_id in missing:
+            versions[obj_id] = found.get(version_key(kind, obj_id), now)
+    return versions
+
+
+def get_version(kind, obj_id):
+    return get_versions(kind, [obj_id])[obj_id]
+
+
+async def aget_versions(kind, obj_ids):
+    cache = get_cache()
+    keys = {version_key(kind, obj_id): obj_id for obj_id in obj_ids}
+    found = await cache.aget_many(list(keys))
+    versions = {keys[key]: value for key, value in found.items()}
+    missing = [obj_id for obj_id in keys.values() if obj_id not in versions]
+    if missing:
+        now = int(time.time() * 1000)
+        for obj_id in missing:
+            await cache.aadd(version_key(kind, obj_id), now, None)
+        found = await cache.aget_many([version_key(kind, obj_id) for obj_id in missing])
+        for obj_id in missing:
+            versions[obj_id] = found.get(version_key(kind, obj_id), now)
+    return versions
+
+
+async def aget_version(kind, obj_id):
+    return (await aget_versions(kind, [obj_id]))[obj_id]
+
+
+def _bump(kind, obj_id):
+    cache = get_cache()
+    key = version_key(kind, obj_id)
+    current = cache.get(key) or 0
+    cache.set(key, max(int(time.time() * 1000), current + 1), None)
+
+
+def bump(kind, *obj_ids):
+    # Se sube la versión cuando la transacción ya está confirmada, para que nadie pueda
+    # guardar en la caché datos antiguos con la versión nueva
+    for obj_id in set(obj_ids):
+        if obj_id is not None:
+            transaction.on_commit(lambda obj_id=obj_id: _bump(kind, obj_id))
+
+
+def bump_user(*user_ids):
+    bump('user', *user_ids)
+
+
+def bump_post(*post_ids):
+    bump('post', *post_ids)
+
+
+def post_changed(post_id, author_id):
+    # Un cambio en un post (like, comentario, imagen) también cambia el perfil de su autor
+    bump_post(post_id)
+    bump_user(author_id)
+
+
+# Datos de cada usuario: se pueden guardar en el navegador, nunca en cachés compartidas, y
+# siempre se revalidan
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+
+
+def group_dependencies(dependencies):
+    by_kind = defaultdict(set)
+    for kind, obj_id in dependencies:
+        by_kind[kind].add(obj_id)
+    return by_kind
+
+
+def dependency_versions(dependencies):
+    # {(kind, id): versión}, con una lectura de la caché por tipo
+    versions = {}
+    for kind, obj_ids in group_dependencies(dependencies).items():
+        versions.update({(kind, obj_id): version for obj_id, version in get_versions(kind, obj_ids).items()})
+    return versions
+
+
+async def adependency_versions(dependencies):
+    versions = {}
+    for kind, obj_ids in group_dependencies(dependencies).items():
+        versions.update({(kind, obj_id): version for obj_id, version in (await aget_versions(kind, obj_ids)).items()})
+    return versions
+
+
+class Validators:
+    # ETag de una respuesta. Se calcula antes de construirla: si algo cambia mientras tanto el
+    # ETag queda por detrás de los datos y la siguiente petición los recibe
+    def __init__(self, versions):
+        digest = hashlib.md5(repr(sorted(versions.items())).encode()).hexdigest()
+        self.etag = f'W/"{digest}"'  # Débil: el mismo contenido, no necesariamente los mismos bytes
+
+    def not_modified(self, request):
+        # 304 si el cliente ya tiene esta versión (o 412 si pide otra con If-Match);
+        # If-Modified-Since no se tiene en cuenta
+        response = get_conditional_response(request, etag=self.etag)
+        return self.apply(response) if response is not None else None
+
+    def apply(self, response):
+        if 200 <= response.status_code < 300 or isinstance(response, HttpResponseNotModified):
+            response['ETag'] = self.etag
+        response['Cache-Control'] = PRIVATE_CACHE_CONTROL
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+
+def validators_for(dependencies):
+    return Validators(dependency_versions(dependencies))
+
+
+async def avalidators_for(dependencies):
+    return Validators(await adependency_versions(dependencies))
+
+
+def response_key(namespace, versions, request):
+    # Las versiones van en la clave; los parámetros (cursor, page_size, fields) y el host
+    # (las URLs de imagen son absolutas) se resumen en un hash
+    params = sorted((key, value) for key, values in request.query_params.lists() for value in values)
+    digest = hashlib.md5(repr((request.get_host(), params)).encode()).hexdigest()
+    parts = ':'.join(f'{kind}{obj_id}.{version}' for (kind, obj_id), version in versions)
+    return f'social:r:{namespace}:{parts}:{digest}'
+
+
+def cached_data(namespace, dependencies, request, build):
+    # dependencies: lista de (kind, id) de los que depende la respuesta
+    versions = [((kind, obj_id), get_version(kind, obj_id)) for kind, obj_id in dependencies]
+    key = response_key(namespace, versions, request)
+    cache = get_cache()
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, cache_timeout())
+    return data
+
+
+async def acached_data(namespace, dependencies, request, build):
+    # Igual que cached_data, con build asíncrono
+    versions = [((kind, obj_id), await aget_version(kind, obj_id)) for kind, obj_id in dependencies]
+    key = response_key(namespace, versions, request)
+    cache = get_cache()
+    data = await cache.aget(key)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, cache_timeout())
+    return data
+
+
+def apply_viewer_fields(request, posts):
+    # Rellena los campos que dependen del usuario en sesión sobre posts ya serializados
+    comment_users = [
+        comment['user']
+        for post in posts
+        for comment in post.get('comments', [])
+        if isinstance(comment.get('user'), dict)
+    ]
+    if comment_users:
+        followed = followed_ids(request.user, [user['id'] for user in comment_users])
+        for user in comment_users:
+            user['is_followed'] = user['id'] in followed
+
+    flagged = [post for post in posts if 'viewer_has_liked' in post]
+    if flagged:
+        liked = liked_post_ids(request.user, [post['id'] for post in flagged])
+        for post in flagged:
+            post['viewer_has_liked'] = post['id'] in liked
+    return posts
+
+
+async def aapply_viewer_fields(request, posts):
+    comment_users = [
+        comment['user']
+        for post in posts
+        for comment in post.get('comments', [])
+        if isinstance(comment.get('user'), dict)
+    ]
+    flagged = [post for post in posts if 'viewer_has_liked' in post]
+    followed = await afollowed_ids(request.user, [user['id'] for user in comment_users])
+    liked = await aliked_post_ids(request.user, [post['id'] for post in flagged])
+    for user in comment_users:
+        user['is_followed'] = user['id'] in followed
+    for post in flagged:
+        post['viewer_has_liked'] = post['id'] in liked
+    return posts
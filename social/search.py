@@ -0,0 +1,221 @@
+# Búsqueda de usuarios y de contenido (posts y comentarios).
+#
+# Usuarios:
+# Las consultas de 3 o más caracteres usan un índice de trigramas (UserSearchGram) que se
+# mantiene al crear o renombrar usuarios: solo se comprueba la subcadena sobre los usuarios
+# que contienen todos los trigramas de la consulta. Las más cortas buscan por prefijo, que
+# aprovecha el índice único de username. Los resultados se ordenan por coincidencia exacta,
+# prefijo, si el usuario en sesión ya lo sigue y número de seguidores, y se limitan.
+#
+# Contenido: índice invertido detrás de una interfaz común (BaseContentSearchBackend) para
+# poder cambiarlo por FTS5 o FULLTEXT. TokenTableBackend guarda los términos de cada post y
+# comentario en ContentToken al crearlos y los borra al borrarlos.
+
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils.module_loading import import_string
+
+from . import sharding
+from .models import Comment, ContentToken, Follow, Post, UserSearchGram
+
+User = get_user_model()
+
+GRAM_SIZE = 3
+
+
+def user_search_limit():
+    return getattr(settings, 'SOCIAL_USER_SEARCH_LIMIT', 50)
+
+
+def grams(text):
+    text = text.lower()
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def index_user(user):
+    UserSearchGram.objects.filter(user_id=user.id).delete()
+    UserSearchGram.objects.bulk_create([UserSearchGram(gram=gram, user_id=user.id) for gram in grams(user.username)])
+
+
+def rebuild_user_index(batch_size=1000):
+    UserSearchGram.objects.all().delete()
+    batch = []
+    total = 0
+    for user_id, username in User.objects.values_list('id', 'username').iterator():
+        batch += [UserSearchGram(gram=gram, user_id=user_id) for gram in grams(username)]
+        total += 1
+        if len(batch) >= batch_size:
+            UserSearchGram.objects.bulk_create(batch)
+            batch = []
+    UserSearchGram.objects.bulk_create(batch)
+    return total
+
+
+def candidates(query):
+    query_grams = grams(query)
+    if not query_grams:
+        # Consulta corta: solo prefijo
+        return User.objects.filter(username__istartswith=query)
+    matching = (
+        UserSearchGram.objects.filter(gram__in=query_grams)
+        .values('user_id')
+        .annotate(matched=Count('gram'))
+        .filter(matched=len(query_grams))
+        .values('user_id')
+    )
+    # Los trigramas no garantizan el orden: se confirma la subcadena sobre los candidatos
+    return User.objects.filter(id__in=matching, username__icontains=query)
+
+
+def search_users(query, viewer):
+    # Lista ordenada y limitada de usuarios; cada uno lleva viewer_follows anotado
+    return list(ranked_users(query, viewer))
+
+
+def ranked_users(query, viewer):
+    query = query.strip()
+    if not query:
+        return User.objects.none()
+    if viewer is not None and viewer.is_authenticated:
+        follows = Exists(Follow.objects.filter(follower_id=viewer.id, following_id=OuterRef('pk')))
+    else:
+        follows = Value(False)
+    ranked = candidates(query).annotate(
+        exact=Case(When(username__iexact=query, then=Value(1)), default=Value(0), output_field=IntegerField()),
+        prefix=Case(When(username__istartswith=query, then=Value(1)), default=Value(0), output_field=IntegerField()),
+        viewer_follows=follows,
+        follower_total=Coalesce('stats__follower_count', 0),
+    )
+    return ranked.order_by('-exact', '-prefix', '-viewer_follows', '-follower_total', 'username', 'id')[:user_search_limit()]
+
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TOKEN_LENGTH = 64
+MAX_QUERY_TERMS = 10
+
+
+def tokenize(text):
+    # Minúsculas y sin tildes: "Canción" y "cancion" son el mismo término
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [token[:MAX_TOKEN_LENGTH] for token in TOKEN_RE.findall(text) if len(token) > 1]
+
+
+class BaseContentSearchBackend:
+    def index(self, kind, obj):
+        raise NotImplementedError
+
+    def remove(self, kind, object_id):
+        raise NotImplementedError
+
+    def rebuild(self, batch_size=1000):
+        raise NotImplementedError
+
+    def weights(self, kind, terms):
+        # Peso de cada término (idf entero, para que la puntuación sea exacta y estable)
+        raise NotImplementedError
+
+    def search(self, kind, terms, weights):
+        # Queryset de dicts con object_id, matched y score, sin ordenar
+        raise NotImplementedError
+
+    async def aweights(self, kind, terms):
+        # Los backends que tengan un cliente asíncrono pueden sobrescribirlo
+        return await sync_to_async(self.weights)(kind, terms)
+
+
+class TokenTableBackend(BaseContentSearchBackend):
+    def _tokens(self, kind, obj):
+        post_id = obj.id if kind == ContentToken.POST else obj.post_id
+        return [
+            ContentToken(token=token, kind=kind, object_id=obj.id, post_id=post_id, frequency=frequency)
+            for token, frequency in Counter(tokenize(obj.content)).items()
+        ]
+
+    def index(self, kind, obj):
+        with transaction.atomic():
+            self.remove(kind, obj.id)
+            ContentToken.objects.bulk_create(self._tokens(kind, obj))
+
+    def remove(self, kind, object_id):
+        ContentToken.objects.filter(kind=kind, object_id=object_id).delete()
+
+    def rebuild(self, batch_size=1000):
+        ContentToken.objects.all().delete()
+        total = 0
+        for kind, model in ((ContentToken.POST, Post), (ContentToken.COMMENT, Comment)):
+            for alias in sharding.each_shard():
+                last_id = 0
+                while True:
+                    batch = list(model.objects.using(alias).filter(id__gt=last_id).order_by('id')[:batch_size])
+                    if not batch:
+                        break
+                    last_id = batch[-1].id
+                    tokens = [token for obj in batch for token in self._tokens(kind, obj)]
+                    ContentToken.objects.bulk_create(tokens, batch_size=batch_size)
+                    total += len(batch)
+        return total
+
+    def document_count(self, kind):
+        key = f'search:documents:{kind}'
+        cache = caches[getattr(settings, 'SOCIAL_CACHE_ALIAS', 'default')]
+        count = cache.get(key)
+        if count is None:
+            model = Post if kind == ContentToken.POST else Comment
+            count = sharding.everywhere(model.objects.all()).count()
+            cache.set(key, count, 600)
+        return count
+
+    def weights(self, kind, terms):
+        documents = self.document_count(kind)
+        frequencies = dict(
+            ContentToken.objects.filter(kind=kind, token__in=terms)
+            .values('token')
+            .annotate(df=Count('*'))
+            .values_list('token', 'df')
+        )
+        return {
+            term: round(1000 * math.log(1 + max(documents, 1) / frequencies.get(term, 1)))
+            for term in terms
+        }
+
+    def search(self, kind, terms, weights):
+        score = Sum(
+            Case(
+                *[When(token=term, then=F('frequency') * weights.get(term, 0)) for term in terms],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+        return (
+            ContentToken.objects.filter(kind=kind, token__in=terms)
+            .values('object_id')
+            .annotate(matched=Count('token'), score=score)
+        )
+
+
+def get_content_backend():
+    backend = getattr(settings, 'SOCIAL_CONTENT_SEARCH_BACKEND', 'social.search.TokenTableBackend')
+    return import_string(backend)()
+
+
+def query_terms(query):
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+def index_content(kind, obj):
+    get_content_backend().index(kind, obj)
+
+
+def remove_content(kind, object_id):
+    get_content_backend().remove(kind, object_id)
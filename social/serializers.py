@@ -1,7 +1,36 @@
 from rest_framework import serializers
-from .models import Post, Like, User, Comment, Follow
+from .models import Post, Like, User, Comment, Follow, Notification
+from . import sharding
 from django.core.exceptions import ValidationError
 from django.contrib.auth.password_validation import validate_password
+from django.conf import settings
+
+
+def requested_fields(request):
+    # ?fields=compact, ?fields=id,content o combinados: ?fields=compact,id,like_count
+    raw = request.query_params.get('fields', '') if request is not None else ''
+    names = {name.strip() for name in raw.split(',') if name.strip()}
+    compact = 'compact' in names
+    names.discard('compact')
+    return compact, names or None
+
+
+def latest_comments_size():
+    return getattr(settings, 'SOCIAL_COMPACT_LATEST_COMMENTS', 3)
+
+
+class SparseFieldsMixin:
+    # Devuelve solo los campos pedidos en context['fields'] (solo en el serializer de primer nivel)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.context.get('fields')
+        parent = self.parent
+        top_level = parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+        if requested and top_level:
+            # El id se mantiene siempre para poder identificar cada objeto
+            fields = {name: field for name, field in fields.items() if name in requested or name == 'id'}
+        return fields
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -16,7 +45,8 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id','username', 'email', 'password', 'new_password', 'confirm_password', 'current_password', 'is_followed')  # Incluye solo los campos del modelo User
 
     def validate(self, data):
-        user = self.context['request'].user
+        # La instancia es la fila real; request.user puede llevar solo los claims del token
+        user = self.instance if self.instance is not None else self.context['request'].user
         
         if 'new_password' in data:
             if not user.check_password(data.get('current_password')):
@@ -32,9 +62,13 @@ class UserSerializer(serializers.ModelSerializer):
     
     def get_is_followed(self, obj):
         # Devuelve True si el usuario autenticado sigue a este usuario
+        followed_ids = self.context.get('followed_ids')
+        if followed_ids is not None:
+            # Calculado una sola vez para toda la página (ver prefetch.followed_ids)
+            return obj.id in followed_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.followers.filter(id=request.user.id).exists()
+            return Follow.objects.filter(follower_id=request.user.id, following_id=obj.id).exists()
         return False
     
     def create(self, validated_data):
@@ -71,20 +105,38 @@ class CommentSerializer(serializers.ModelSerializer):
         validated_data['user'] = user  # Asigna el usuario actual al comentario
         return super().create(validated_data)
 
-class PostSerializer(serializers.ModelSerializer):
+class ImageVariantsMixin:
+    # URLs absolutas de las variantes generadas por images.py: {'webp': {'320': url, ...}, ...}
+
+    def get_image_variants(self, obj):
+        variants = obj.image_variants or {}
+        if not variants or not obj.image:
+            return None
+        request = self.context.get('request')
+        storage = obj.image.storage
+        data = {'width': variants.get('width'), 'height': variants.get('height')}
+        for fmt in ('webp', 'jpeg'):
+            urls = {width: storage.url(name) for width, name in variants.get(fmt, {}).items()}
+            if request is not None:
+                urls = {width: request.build_absolute_uri(url) for width, url in urls.items()}
+            data[fmt] = urls
+        return data
+
+class PostSerializer(ImageVariantsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     likes = serializers.SerializerMethodField()
     username = serializers.CharField(source='user.username', read_only=True)  # Campo de solo lectura
     comments = CommentSerializer(many=True, read_only=True)  # Incluye los comentarios
     image = serializers.ImageField(max_length=None, use_url=True, required=False)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = ('id', 'username', 'content', 'created_at', 'image', 'user', 'likes', 'comments')  # Incluye 'likes'
+        fields = ('id', 'username', 'content', 'created_at', 'image', 'image_variants', 'image_placeholder', 'user', 'likes', 'like_count', 'comments', 'comment_count')  # Incluye 'likes'
+        read_only_fields = ('like_count', 'comment_count', 'image_placeholder')
 
     def get_likes(self, obj):
-        from .serializers import LikeSerializer  # Local import to avoid circular dependency
-        likes = Like.objects.filter(post=obj)
-        return LikeSerializer(likes, many=True).data
+        # obj.likes.all() usa el prefetch de prefetch_posts si lo hay
+        return LikeSerializer(obj.likes.all(), many=True).data
     
     def get_image_url(self, obj):
         request = self.context.get('request')
@@ -92,6 +144,44 @@ class PostSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.image.url)
         return None
     
+class CompactCommentSerializer(serializers.ModelSerializer):
+    user_id = serializers.IntegerField(read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ('id', 'content', 'created_at', 'user_id', 'username')
+
+class CompactPostSerializer(ImageVariantsMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    # Representación ligera del feed (?fields=compact): contadores y flag del usuario en
+    # vez de la lista de likes, y solo los últimos comentarios
+    username = serializers.CharField(source='user.username', read_only=True)
+    image = serializers.ImageField(use_url=True, read_only=True)
+    image_variants = serializers.SerializerMethodField()
+    viewer_has_liked = serializers.SerializerMethodField()
+    latest_comments = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Post
+        fields = ('id', 'user', 'username', 'content', 'created_at', 'image', 'image_variants', 'image_placeholder', 'like_count', 'comment_count', 'viewer_has_liked', 'latest_comments')
+        read_only_fields = fields
+
+    def get_viewer_has_liked(self, obj):
+        liked_post_ids = self.context.get('liked_post_ids')
+        if liked_post_ids is not None:
+            return obj.id in liked_post_ids
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            return Like.objects.using(sharding.shard_for_post(obj.id)).filter(user_id=request.user.id, post_id=obj.id).exists()
+        return False
+
+    def get_latest_comments(self, obj):
+        comments = getattr(obj, 'latest_comments', None)  # Prefetch de prefetch_compact_posts
+        if comments is None:
+            comments = sharding.select_user(obj.comments.order_by('-created_at', '-id'))[:latest_comments_size()]
+        # Se devuelven en orden cronológico, igual que el listado de comentarios
+        return CompactCommentSerializer(reversed(list(comments)), many=True).data
+
 class FollowSerializer(serializers.ModelSerializer):
     class Meta:
         model = Follow
@@ -109,4 +199,33 @@ class FollowSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("No puedes seguirte a ti mismo.")
         return data
     
-    
\ No newline at end of file
+    
+
+class FollowerSerializer(serializers.ModelSerializer):
+    # Una fila de la lista de seguidores de un usuario (el lado follower del Follow)
+    side = 'follower'
+    id = serializers.IntegerField(source='follower_id')
+    username = serializers.CharField(source='follower.username')
+    followed_at = serializers.DateTimeField(source='created_at')
+    is_followed = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Follow
+        fields = ('id', 'username', 'followed_at', 'is_followed')
+
+    def get_is_followed(self, obj):
+        # followed_ids se calcula una vez para toda la página
+        return getattr(obj, f'{self.side}_id') in self.context.get('followed_ids', ())
+
+
+class FollowingSerializer(FollowerSerializer):
+    # Lista de seguidos: el lado following del Follow
+    side = 'following'
+    id = serializers.IntegerField(source='following_id')
+    username = serializers.CharField(source='following.username')
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ['id', 'verb', 'post', 'actor_count', 'latest_actors', 'is_read', 'created_at', 'updated_at']
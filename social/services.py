@@ -0,0 +1,244 @@
+# Escrituras de like y follow idempotentes y sin carreras.
+#
+# En lugar de comprobar si la fila existe y luego insertarla (dos dobles clics a la vez
+# pasaban la comprobación y uno acababa en IntegrityError), se inserta directamente y la
+# restricción unique_together decide: si salta, la relación ya existía. Los borrados son un
+# único DELETE cuyo número de filas dice si había algo que borrar. Los contadores solo se
+# tocan cuando la fila cambia de verdad, y se devuelve el estado y el contador nuevos.
+#
+# Lo que acompaña a la escritura (timeline, avisos) va en la misma transacción: si algo falla
+# no queda nada guardado y el reintento del cliente lo hace todo, en vez de encontrarse la
+# fila ya creada y saltarse el resto. La caché y los eventos se publican en on_commit.
+
+from contextlib import ExitStack
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, router, transaction
+
+from . import counters, events, notifications, response_cache, sharding, timeline
+from .models import Comment, Follow, Like, Notification, Post, UserStats
+
+User = get_user_model()
+
+
+def atomic_for(model):
+    # Transacción en la base de datos en la que se escribe model (con sharding, el shard fijado)
+    return transaction.atomic(using=router.db_for_write(model))
+
+
+def insert_once(model, **fields):
+    # True si se ha insertado, False si la restricción única dice que ya existía
+    try:
+        with atomic_for(model):
+            model.objects.create(**fields)
+    except IntegrityError:
+        return False
+    return True
+
+
+def post_likes(post_id):
+    # (autor, likes) del post, o None si no existe
+    return Post.objects.using(sharding.shard_for_post(post_id)).filter(id=post_id).values_list('user_id', 'like_count').first()
+
+
+def follower_count(user_id):
+    return UserStats.objects.values_list('follower_count', flat=True).filter(user_id=user_id).first() or 0
+
+
+def like_post(user, post_id):
+    # Devuelve (creado, likes del post); Post.DoesNotExist si el post no existe. El INSERT y el
+    # UPDATE del contador (que devuelve el autor y el valor nuevo) son todo el trabajo; solo
+    # un like repetido relee el post. Con sharding el aviso (en 'default') se confirma antes
+    # que el like: si falla el shard, el reintento vuelve a sumar al mismo aviso sin duplicarlo
+    with sharding.on_post(post_id), atomic_for(Like), transaction.atomic():
+        created = insert_once(Like, user_id=user.id, post_id=post_id)
+        row = counters.bump_post_returning(post_id, 'like_count', 1) if created else post_likes(post_id)
+        if row is None:
+            raise Post.DoesNotExist  # Deshace el like (SQLite comprueba la clave foránea al confirmar)
+        owner_id, likes = row
+        if created:
+            response_cache.post_changed(post_id, owner_id)
+            events.post_liked(post_id, owner_id, user)
+            notifications.notify(owner_id, Notification.LIKE, user, post_id)
+    return created, likes
+
+
+def unlike_post(user, post_id):
+    # Devuelve (borrado, likes del post)
+    with sharding.on_post(post_id), atomic_for(Like):
+        deleted, _ = Like.objects.filter(user_id=user.id, post_id=post_id).delete()
+        row = counters.bump_post_returning(post_id, 'like_count', -1) if deleted else post_likes(post_id)
+    if row is None:
+        raise Post.DoesNotExist
+    owner_id, likes = row
+    if deleted:
+        response_cache.post_changed(post_id, owner_id)
+    return bool(deleted), likes
+
+
+def follow_user(follower, following_id):
+    # Devuelve (creado, seguidores del usuario seguido); User.DoesNotExist si no existe
+    if not User.objects.filter(id=following_id).exists():
+        raise User.DoesNotExist
+    with transaction.atomic():
+        created = insert_once(Follow, follower_id=follower.id, following_id=following_id)
+        if created:
+            counters.bump_user(follower.id, following_count=1)
+            counters.bump_user(following_id, follower_count=1)
+            response_cache.bump_user(follower.id, following_id)
+            timeline.on_follow(follower.id, following_id)
+            events.user_followed(follower, following_id)
+            notifications.notify(following_id, Notification.FOLLOW, follower)
+        return created, follower_count(following_id)
+
+
+def unfollow_user(follower, following_id):
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(follower_id=follower.id, following_id=following_id).delete()
+        if deleted:
+            counters.bump_user(follower.id, following_count=-1)
+            counters.bump_user(following_id, follower_count=-1)
+            response_cache.bump_user(follower.id, following_id)
+            timeline.on_unfollow(follower.id, following_id)
+            timeline.on_followers_lost(following_id, follower_count(following_id))
+    if not deleted and not User.objects.filter(id=following_id).exists():
+        raise User.DoesNotExist
+    return bool(deleted), follower_count(following_id)
+
+
+# Escrituras en lote (importaciones, "sigue a estas 50 cuentas"): una transacción por lote,
+# bulk_create(ignore_conflicts=True) o un DELETE con __in, y los contadores de las filas
+# afectadas se recalculan en un solo UPDATE. Devuelven el resultado de cada elemento.
+
+BULK_BATCH_SIZE = 1000
+
+LIKED, ALREADY_LIKED, UNLIKED, NOT_LIKED = 'liked', 'already_liked', 'unliked', 'not_liked'
+FOLLOWING, ALREADY_FOLLOWING, UNFOLLOWED, NOT_FOLLOWING = 'following', 'already_following', 'unfollowed', 'not_following'
+NOT_FOUND, SELF = 'not_found', 'self'
+
+
+def bulk_like(user, post_ids):
+    owners = dict(sharding.for_posts(Post.objects.all(), post_ids).values_list('id', 'user_id'))
+    existing, new_ids = set(), []
+    # Una transacción por shard (sin sharding, una sola)
+    for alias, ids in sharding.group_posts(owners).items():
+        with sharding.use_shard(alias), atomic_for(Like):
+            found = set(Like.objects.filter(user_id=user.id, post_id__in=ids).values_list('post_id', flat=True))
+            created = [post_id for post_id in ids if post_id not in found]
+            Like.objects.bulk_create(
+                [Like(user_id=user.id, post_id=post_id) for post_id in created],
+                batch_size=BULK_BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+            counters.recount_posts(created, 'like_count')
+        existing |= found
+        new_ids += created
+
+    response_cache.bump_post(*new_ids)
+    response_cache.bump_user(*(owners[post_id] for post_id in new_ids))
+    for post_id in new_ids:
+        events.post_liked(post_id, owners[post_id], user)
+        notifications.notify(owners[post_id], Notification.LIKE, user, post_id)
+    return {
+        post_id: NOT_FOUND if post_id not in owners else ALREADY_LIKED if post_id in existing else LIKED
+        for post_id in post_ids
+    }
+
+
+def bulk_unlike(user, post_ids):
+    liked = set()
+    for alias, ids in sharding.group_posts(post_ids).items():
+        with sharding.use_shard(alias), atomic_for(Like):
+            found = set(Like.objects.filter(user_id=user.id, post_id__in=ids).values_list('post_id', flat=True))
+            Like.objects.filter(user_id=user.id, post_id__in=found).delete()
+            counters.recount_posts(found, 'like_count')
+        liked |= found
+
+    response_cache.bump_post(*liked)
+    response_cache.bump_user(*sharding.for_posts(Post.objects.all(), liked).values_list('user_id', flat=True))
+    return {post_id: UNLIKED if post_id in liked else NOT_LIKED for post_id in post_ids}
+
+
+def bulk_follow(follower, user_ids):
+    found = set(User.objects.filter(id__in=user_ids).exclude(id=follower.id).values_list('id', flat=True))
+    with transaction.atomic():
+        existing = set(
+            Follow.objects.filter(follower_id=follower.id, following_id__in=found).values_list('following_id', flat=True)
+        )
+        new_ids = [user_id for user_id in user_ids if user_id in found and user_id not in existing]
+        Follow.objects.bulk_create(
+            [Follow(follower_id=follower.id, following_id=user_id) for user_id in new_ids],
+            batch_size=BULK_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        counters.recount_users(new_ids, 'follower_count')
+        counters.recount_users([follower.id], 'following_count')
+
+    response_cache.bump_user(follower.id, *new_ids)
+    timeline.on_follow_many(follower.id, new_ids)
+    for user_id in new_ids:
+        events.user_followed(follower, user_id)
+        notifications.notify(user_id, Notification.FOLLOW, follower)
+
+    def result(user_id):
+        if user_id == follower.id:
+            return SELF
+        if user_id not in found:
+            return NOT_FOUND
+        return ALREADY_FOLLOWING if user_id in existing else FOLLOWING
+    return {user_id: result(user_id) for user_id in user_ids}
+
+
+def bulk_unfollow(follower, user_ids):
+    with transaction.atomic():
+        followed = set(
+            Follow.objects.filter(follower_id=follower.id, following_id__in=user_ids).values_list('following_id', flat=True)
+        )
+        Follow.objects.filter(follower_id=follower.id, following_id__in=followed).delete()
+        counters.recount_users(followed, 'follower_count')
+        counters.recount_users([follower.id], 'following_count')
+        timeline.on_unfollow_many(follower.id, followed)
+        for user_id, count in UserStats.objects.filter(user_id__in=followed).values_list('user_id', 'follower_count'):
+            timeline.on_followers_lost(user_id, count)
+
+    response_cache.bump_user(follower.id, *followed)
+    return {user_id: UNFOLLOWED if user_id in followed else NOT_FOLLOWING for user_id in user_ids}
+
+
+def is_id(value):
+    # bool es subclase de int: true en el JSON no es el post 1
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def bulk_comment(user, items):
+    # items: [{'post_id': ..., 'content': ...}]. Los comentarios se insertan de uno en uno dentro
+    # de la transacción porque hacen falta sus ids (MySQL no los devuelve en bulk_create) y las
+    # señales que los indexan para la búsqueda
+    post_ids = {item.get('post_id') for item in items}
+    owners = dict(
+        sharding.for_posts(Post.objects.all(), [post_id for post_id in post_ids if is_id(post_id)]).values_list('id', 'user_id')
+    )
+    results, created = [], []
+    with ExitStack() as stack:
+        # Una transacción en cada shard con comentarios nuevos (no es atómico entre shards)
+        for alias in sharding.group_posts(owners):
+            stack.enter_context(transaction.atomic(using=alias or router.db_for_write(Comment)))
+        for item in items:
+            post_id, content = item.get('post_id'), item.get('content')
+            if not is_id(post_id) or post_id not in owners:
+                results.append({'post_id': post_id, 'error': NOT_FOUND})
+            elif not isinstance(content, str) or not content.strip():
+                results.append({'post_id': post_id, 'error': 'content is required'})
+            else:
+                comment = Comment.objects.create(user_id=user.id, post_id=post_id, content=content)
+                created.append(comment)
+                results.append({'post_id': post_id, 'id': comment.id})
+        commented = {comment.post_id for comment in created}
+        counters.recount_posts(commented, 'comment_count')
+
+    response_cache.bump_post(*commented)
+    response_cache.bump_user(*(owners[post_id] for post_id in commented))
+    for comment in created:
+        events.comment_created(comment, owners[comment.post_id])
+        notifications.notify(owners[comment.post_id], Notification.COMMENT, user, comment.post_id)
+    return results
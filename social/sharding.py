@@ -0,0 +1,517 @@
+# Sharding horizontal de posts, likes y comentarios.
+#
+# Con SOCIAL_SHARDS (alias de DATABASES) los posts de cada usuario, y los likes y comentarios
+# de esos posts, viven en uno de los shards, elegido con jump consistent hash sobre el id del
+# usuario: al añadir un shard al final de la lista solo cambia de sitio 1/n de los usuarios. Los
+# que mueve el comando reshard quedan apuntados en UserShard. El resto de tablas (usuarios,
+# follows, timelines, avisos, búsqueda...) sigue en 'default', que puede ser también uno de los
+# shards. Sin SOCIAL_SHARDS todo queda en 'default' y nada de esto interviene.
+#
+# - Los ids de posts y comentarios son globales: se reservan en PostLocation/CommentLocation
+#   (en 'default'), que dicen además de qué usuario es cada uno, así que un post o un
+#   comentario se localiza por su id sin preguntar a todos los shards.
+# - ShardRouter enruta las consultas con instancia (save, delete, relaciones y prefetch) por
+#   el dueño del post. Las que no la tienen, incluido objects.create(), van al shard fijado con
+#   on_post()/on_user()/on_comment(), o se reparten explícitamente con posts_of(),
+#   for_posts(), for_users() o everywhere().
+# - ShardedQuerySet lanza la misma consulta en varios shards y mezcla los resultados, que cada
+#   shard devuelve ya ordenados (scatter-gather): la home, los lotes de ids, los recuentos.
+# - Entre shards no hay claves foráneas en la base de datos ni joins: el usuario de un post o
+#   comentario se trae con prefetch_related (select_user()) y no con select_related. Las FK que
+#   cruzan shards (CROSS_SHARD_FOREIGN_KEYS) solo se quitan con sharding: migrate no las crea
+#   si SOCIAL_SHARDS está definido y reshard las quita de las bases que ya las tienen
+#   (set_foreign_keys()). Sin ellas la base de datos no impide filas huérfanas: los borrados
+#   en cascada que cruzan shards dependen del ORM y de las señales (forget_post).
+#
+# Dónde está cada usuario y de quién es cada post se cachea en la caché compartida
+# (SOCIAL_CACHE_ALIAS), igual que las marcas de las réplicas, para que reshard pueda cambiarlo
+# para todos los procesos al mover a alguien.
+
+import contextvars
+import copy
+import functools
+import heapq
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.query import FlatValuesListIterable, ModelIterable, ValuesIterable
+from django.db.models.signals import post_delete, pre_save
+from rest_framework.exceptions import APIException
+
+from .models import (
+    Comment, CommentLocation, ContentToken, Like, Notification, Post, PostLocation, TimelineEntry, UserShard,
+)
+
+SHARDED_MODELS = (Post, Like, Comment)
+LOCATION_TIMEOUT = 24 * 3600  # El dueño de un post o de un comentario no cambia
+MOVING_TIMEOUT = 600  # Por si reshard se interrumpe con usuarios marcados
+
+
+def shards():
+    return list(getattr(settings, 'SOCIAL_SHARDS', []))
+
+
+def enabled():
+    return bool(shards())
+
+
+def is_sharded(model):
+    return enabled() and issubclass(model, SHARDED_MODELS)
+
+
+def placement_ttl():
+    return getattr(settings, 'SOCIAL_SHARD_PLACEMENT_TTL', 300)
+
+
+def get_cache():
+    # La misma que response_cache.get_cache (importarlo aquí crearía un ciclo con prefetch)
+    return caches[getattr(settings, 'SOCIAL_CACHE_ALIAS', 'default')]
+
+
+def jump_hash(key, buckets):
+    # Jump consistent hash (Lamping y Veach): con un shard más solo cambia el de 1/n claves
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def hashed_shard(user_id, aliases):
+    return aliases[jump_hash(int(user_id), len(aliases))]
+
+
+def user_key(user_id):
+    return f'social:shard:user:{user_id}'
+
+
+def post_key(post_id):
+    return f'social:shard:post:{post_id}'
+
+
+def comment_key(comment_id):
+    return f'social:shard:comment:{comment_id}'
+
+
+def moving_key(user_id):
+    return f'social:shard:moving:{user_id}'
+
+
+def moved_shards(user_ids):
+    # {user_id: alias} de los usuarios apuntados en UserShard ('' si sigue el hash)
+    cache = get_cache()
+    keys = {user_key(user_id): user_id for user_id in user_ids}
+    found = {keys[key]: alias for key, alias in cache.get_many(list(keys)).items()}
+    missing = [user_id for user_id in keys.values() if user_id not in found]
+    if missing:
+        moved = dict(UserShard.objects.filter(user_id__in=missing).values_list('user_id', 'shard'))
+        fetched = {user_id: moved.get(user_id, '') for user_id in missing}
+        cache.set_many({user_key(user_id): alias for user_id, alias in fetched.items()}, placement_ttl())
+        found.update(fetched)
+    return found
+
+
+def shards_for_users(user_ids):
+    # {user_id: alias}; sin sharding, None para todos
+    user_ids = set(user_ids)
+    if not enabled():
+        return dict.fromkeys(user_ids)
+    aliases = shards()
+    moved = moved_shards(user_ids)
+    return {user_id: moved[user_id] or hashed_shard(user_id, aliases) for user_id in user_ids}
+
+
+def shard_for_user(user_id):
+    if user_id is None or not enabled():
+        return None
+    return shards_for_users([user_id])[user_id]
+
+
+def location_owners(model, key, object_ids):
+    cache = get_cache()
+    keys = {key(object_id): object_id for object_id in object_ids}
+    found = {keys[cache_key]: owner for cache_key, owner in cache.get_many(list(keys)).items()}
+    missing = [object_id for object_id in keys.values() if object_id not in found]
+    if missing:
+        fetched = dict(model.objects.filter(id__in=missing).values_list('id', 'owner_id'))
+        cache.set_many({key(object_id): owner for object_id, owner in fetched.items()}, LOCATION_TIMEOUT)
+        found.update(fetched)
+    return found
+
+
+def post_owners(post_ids):
+    # {post_id: dueño}; los posts sin PostLocation (anteriores al sharding) no aparecen
+    return location_owners(PostLocation, post_key, post_ids)
+
+
+def comment_owners(comment_ids):
+    return location_owners(CommentLocation, comment_key, comment_ids)
+
+
+def group_by_owner(object_ids, owners):
+    # {alias: [ids]}. Lo que no tiene ubicación (anterior al sharding, o no existe) está en 'default'
+    placement = shards_for_users(set(owners.values()))
+    groups = defaultdict(list)
+    for object_id in object_ids:
+        owner_id = owners.get(object_id)
+        groups[placement[owner_id] if owner_id is not None else DEFAULT_DB_ALIAS].append(object_id)
+    return dict(groups)
+
+
+def group_posts(post_ids):
+    post_ids = list(post_ids)
+    if not enabled():
+        return {None: post_ids}
+    return group_by_owner(post_ids, post_owners(post_ids))
+
+
+def group_comments(comment_ids):
+    comment_ids = list(comment_ids)
+    if not enabled():
+        return {None: comment_ids}
+    return group_by_owner(comment_ids, comment_owners(comment_ids))
+
+
+def group_users(user_ids):
+    user_ids = list(user_ids)
+    if not enabled():
+        return {None: user_ids}
+    groups = defaultdict(list)
+    for user_id, alias in shards_for_users(user_ids).items():
+        groups[alias].append(user_id)
+    return dict(groups)
+
+
+def shard_for_post(post_id):
+    return next(iter(group_posts([post_id])))
+
+
+def shard_for_comment(comment_id):
+    return next(iter(group_comments([comment_id])))
+
+
+class UserMoving(APIException):
+    status_code = 503
+    default_detail = "This user's posts are being moved to another shard, try again in a few seconds."
+    default_code = 'user_moving'
+
+
+def mark_moving(user_ids):
+    get_cache().set_many({moving_key(user_id): True for user_id in user_ids}, MOVING_TIMEOUT)
+
+
+def clear_moving(user_ids):
+    get_cache().delete_many([moving_key(user_id) for user_id in user_ids])
+
+
+def is_moving(user_id):
+    return get_cache().get(moving_key(user_id)) is not None
+
+
+class Route:
+    def __init__(self, alias, owner_id):
+        self.alias = alias
+        self.owner_id = owner_id
+
+
+_route = contextvars.ContextVar('social_shard_route', default=None)
+
+
+@contextmanager
+def use_shard(alias, owner_id=None):
+    # Las consultas sin instancia de Post, Like y Comment del bloque van a este shard
+    if alias is None:
+        yield None
+        return
+    token = _route.set(Route(alias, owner_id))
+    try:
+        yield alias
+    finally:
+        _route.reset(token)
+
+
+def on_user(user_id):
+    return use_shard(shard_for_user(user_id), user_id)
+
+
+def on_post(post_id):
+    if not enabled():
+        return use_shard(None)
+    owner_id = post_owners([post_id]).get(post_id)
+    return use_shard(shard_for_user(owner_id) or DEFAULT_DB_ALIAS, owner_id)
+
+
+def on_comment(comment_id):
+    if not enabled():
+        return use_shard(None)
+    owner_id = comment_owners([comment_id]).get(comment_id)
+    return use_shard(shard_for_user(owner_id) or DEFAULT_DB_ALIAS, owner_id)
+
+
+class ShardRouter:
+    # Va después de ReplicaRouter, que deja pasar los modelos con sharding (ver db_router.py)
+
+    def owner_of(self, model, instance):
+        if isinstance(instance, Post):
+            return instance.user_id
+        if isinstance(instance, (Like, Comment)):
+            return post_owners([instance.post_id]).get(instance.post_id)
+        if model is Post and isinstance(instance, Post.user.field.related_model):
+            return instance.pk  # user.posts
+        return None
+
+    def route(self, model, hints, write):
+        if not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        owner_id = self.owner_of(model, instance) if instance is not None else None
+        if owner_id is not None:
+            alias = shard_for_user(owner_id)
+        else:
+            route = _route.get()
+            if route is None:
+                return None
+            alias, owner_id = route.alias, route.owner_id
+        if write and owner_id is not None and is_moving(owner_id):
+            raise UserMoving()
+        return alias
+
+    def db_for_read(self, model, **hints):
+        return self.route(model, hints, write=False)
+
+    def db_for_write(self, model, **hints):
+        return self.route(model, hints, write=True)
+
+
+async def _alist(queryset):
+    return [row async for row in queryset]
+
+
+class ShardedQuerySet:
+    # La misma consulta en varios shards ({alias: queryset}). Los métodos encadenables se
+    # aplican a cada parte; al evaluar, cada shard devuelve sus filas ya ordenadas y se
+    # mezclan con el orden de la consulta, así que [:n] pide solo n filas a cada shard. Como en
+    # un QuerySet, cortar no evalúa nada: el resultado se recorre después con for o async for
+    CHAINABLE = (
+        'all', 'filter', 'exclude', 'order_by', 'select_related', 'prefetch_related', 'only', 'defer',
+        'annotate', 'values', 'values_list', 'distinct',
+    )
+
+    def __init__(self, parts, window=None):
+        self.parts = parts
+        self.window = window  # (inicio, fin) sobre el resultado ya mezclado
+
+    def __getattr__(self, name):
+        if name not in self.CHAINABLE:
+            raise AttributeError(name)
+
+        def chain(*args, **kwargs):
+            return ShardedQuerySet({alias: getattr(queryset, name)(*args, **kwargs) for alias, queryset in self.parts.items()})
+        return chain
+
+    def comparator(self):
+        queryset = next(iter(self.parts.values()), None)
+        if queryset is None or not queryset.query.order_by:
+            return None  # Sin orden: se concatenan
+        fields = list(queryset._fields or ())
+        iterable = queryset._iterable_class
+
+        def getter(name):
+            if iterable is ModelIterable:
+                return lambda row: getattr(row, name)
+            if iterable is ValuesIterable:
+                return lambda row: row[name]
+            if name not in fields:
+                raise ValueError(f'Cannot merge shards by {name}: it is not among the selected fields')
+            if iterable is FlatValuesListIterable:
+                return lambda row: row
+            index = fields.index(name)
+            return lambda row: row[index]
+
+        keys = [(getter(field.lstrip('-')), field.startswith('-')) for field in queryset.query.order_by]
+
+        def compare(a, b):
+            for get, descending in keys:
+                x, y = get(a), get(b)
+                if x != y:
+                    return (x < y) - (x > y) if descending else (x > y) - (x < y)
+            return 0
+        return compare
+
+    def merge(self, results):
+        compare = self.comparator()
+        if compare is None:
+            rows = [row for rows in results for row in rows]
+        else:
+            rows = list(heapq.merge(*results, key=functools.cmp_to_key(compare)))
+        if self.window is not None:
+            rows = rows[self.window[0]:self.window[1]]
+        return rows
+
+    def fetch(self):
+        return self.merge([list(queryset) for queryset in self.parts.values()])
+
+    def __iter__(self):
+        return iter(self.fetch())
+
+    def __aiter__(self):
+        return self.aiterate()
+
+    async def aiterate(self):
+        # Un shard tras otro: el ORM async ejecuta las consultas en un único hilo (sync_to_async
+        # con thread_sensitive), así que lanzarlas con asyncio.gather no las solaparía
+        results = [await _alist(queryset) for queryset in self.parts.values()]
+        for row in self.merge(results):
+            yield row
+
+    def __len__(self):
+        return len(self.fetch())
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1].fetch()[0]
+        if self.window is not None:
+            raise TypeError('Cannot slice a sharded queryset twice')
+        if item.step is not None or (item.start or 0) < 0 or (item.stop is not None and item.stop < 0):
+            raise ValueError('Only forward slices without step are supported across shards')
+        parts = self.parts if item.stop is None else {alias: queryset[:item.stop] for alias, queryset in self.parts.items()}
+        return ShardedQuerySet(parts, (item.start or 0, item.stop))
+
+    def first(self):
+        rows = self[:1].fetch()
+        return rows[0] if rows else None
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.parts.values())
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self.parts.values())
+
+    def update(self, **kwargs):
+        return sum(queryset.update(**kwargs) for queryset in self.parts.values())
+
+    def in_bulk(self, id_list=None):
+        merged = {}
+        for queryset in self.parts.values():
+            merged.update(queryset.in_bulk(id_list))
+        return merged
+
+
+def split(queryset, groups, field):
+    if None in groups:
+        return queryset.filter(**{f'{field}__in': groups[None]})  # Sin sharding
+    return ShardedQuerySet({alias: queryset.using(alias).filter(**{f'{field}__in': ids}) for alias, ids in groups.items()})
+
+
+def for_posts(queryset, post_ids, field='id'):
+    # queryset (de Post, Like o Comment) de esos posts, cada parte en el shard de sus posts
+    if not enabled():
+        return queryset.filter(**{f'{field}__in': post_ids})  # Admite subconsultas
+    return split(queryset, group_posts(post_ids), field)
+
+
+def for_comments(queryset, comment_ids, field='id'):
+    if not enabled():
+        return queryset.filter(**{f'{field}__in': comment_ids})
+    return split(queryset, group_comments(comment_ids), field)
+
+
+def for_users(queryset, user_ids, field='user_id'):
+    # Posts (o sus likes y comentarios) de esos autores, cada parte en el shard de sus autores
+    if not enabled():
+        return queryset.filter(**{f'{field}__in': user_ids})
+    return split(queryset, group_users(user_ids), field)
+
+
+def everywhere(queryset):
+    if not enabled():
+        return queryset
+    return ShardedQuerySet({alias: queryset.using(alias) for alias in shards()})
+
+
+# Claves foráneas que apuntan a otra base de datos cuando los posts están repartidos
+CROSS_SHARD_FOREIGN_KEYS = [
+    (Post, 'user'), (Like, 'user'), (Comment, 'user'),
+    (TimelineEntry, 'post'), (ContentToken, 'post'), (Notification, 'post'),
+]
+
+
+def foreign_keys(alias):
+    # Campos de CROSS_SHARD_FOREIGN_KEYS que tienen la FK en la base de datos alias
+    connection = connections[alias]
+    found = []
+    with connection.cursor() as cursor:
+        for model, name in CROSS_SHARD_FOREIGN_KEYS:
+            column = model._meta.get_field(name).column
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+            if any(c['foreign_key'] and c['columns'] == [column] for c in constraints.values()):
+                found.append((model, name))
+    return found
+
+
+def set_foreign_keys(alias, enabled):
+    # Crea (o quita) en alias las FK que cruzan shards; devuelve cuántas cambian
+    found = foreign_keys(alias)
+    changing = [key for key in CROSS_SHARD_FOREIGN_KEYS if (key in found) != enabled]
+    with connections[alias].schema_editor() as editor:
+        for model, name in changing:
+            field = model._meta.get_field(name)
+            relaxed = copy.copy(field)
+            relaxed.db_constraint = False
+            editor.alter_field(model, *((relaxed, field) if enabled else (field, relaxed)))
+    return len(changing)
+
+
+def posts_of(user_id):
+    return Post.objects.using(shard_for_user(user_id)).filter(user_id=user_id)
+
+
+def each_shard():
+    # Alias sobre los que recorrer los posts; [None] (el router decide) sin sharding
+    return shards() or [None]
+
+
+def select_user(queryset):
+    # El autor está en 'default': con sharding se trae en una segunda consulta en vez de un join
+    return queryset.prefetch_related('user') if enabled() else queryset.select_related('user')
+
+
+def allocate_post_id(sender, instance, raw=False, **kwargs):
+    if instance.pk is None and not raw and enabled():
+        # Si la transacción del shard se deshace, el id reservado queda sin usar
+        instance.pk = PostLocation.objects.create(owner_id=instance.user_id).pk
+        get_cache().set(post_key(instance.pk), instance.user_id, LOCATION_TIMEOUT)
+
+
+def allocate_comment_id(sender, instance, raw=False, using=None, **kwargs):
+    if instance.pk is None and not raw and enabled():
+        owner_id = post_owners([instance.post_id]).get(instance.post_id)
+        if owner_id is None:
+            # Post anterior al sharding, sin ubicación
+            owner_id = Post.objects.using(using).filter(id=instance.post_id).values_list('user_id', flat=True).first()
+        if owner_id is not None:
+            instance.pk = CommentLocation.objects.create(owner_id=owner_id).pk
+            get_cache().set(comment_key(instance.pk), owner_id, LOCATION_TIMEOUT)
+
+
+def forget_post(sender, instance, **kwargs):
+    if enabled():
+        PostLocation.objects.filter(id=instance.id).delete()
+        # Sin FK entre bases de datos, el borrado del post no llega en cascada a 'default'
+        Notification.objects.filter(post_id=instance.id).delete()
+
+
+def forget_comment(sender, instance, **kwargs):
+    if enabled():
+        CommentLocation.objects.filter(id=instance.id).delete()
+
+
+pre_save.connect(allocate_post_id, sender=Post, dispatch_uid='social.sharding.post')
+pre_save.connect(allocate_comment_id, sender=Comment, dispatch_uid='social.sharding.comment')
+post_delete.connect(forget_post, sender=Post, dispatch_uid='social.sharding.post')
+post_delete.connect(forget_comment, sender=Comment, dispatch_uid='social.sharding.comment')
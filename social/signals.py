@@ -0,0 +1,57 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import notifications, response_cache, search, sharding
+from .models import Comment, ContentToken, Like, Post, UserStats
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, **kwargs):
+    # Cada usuario nuevo empieza con sus contadores a cero
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+    update_fields = kwargs.get('update_fields')
+    if created or update_fields is None or 'username' in update_fields:
+        # El login solo guarda last_login: no hace falta reindexar
+        search.index_user(instance)
+
+
+@receiver(pre_delete, sender=User)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    # Sus likes y comentarios se borran en cascada de los posts de otros usuarios, que también
+    # cambian. Se leen antes del borrado; las versiones suben al confirmar la transacción
+    response_cache.bump_user(instance.id)
+    for model in (Like, Comment):
+        touched = sharding.everywhere(model.objects.filter(user=instance).values_list('post_id', 'post__user_id').distinct())
+        for post_id, author_id in touched:
+            response_cache.post_changed(post_id, author_id)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'content' in update_fields:
+        search.index_content(ContentToken.POST, instance)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'content' in update_fields:
+        search.index_content(ContentToken.COMMENT, instance)
+
+
+@receiver(pre_delete, sender=Post)
+def discard_post_notifications(sender, instance, **kwargs):
+    notifications.discard_for_post(instance.id)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_content(ContentToken.POST, instance.id)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    search.remove_content(ContentToken.COMMENT, instance.id)
@@ -0,0 +1,103 @@
+# Almacenamiento de imágenes direccionado por contenido.
+#
+# Cada fichero se guarda una sola vez bajo blobs/ab/cd/<sha256>.<ext>, calculando el hash
+# mientras se copia la subida. MediaBlob lleva la cuenta de cuántas referencias tiene cada
+# blob y el fichero solo se borra cuando deja de usarse. Como el nombre depende del
+# contenido, las URLs nunca cambian de contenido y se pueden cachear para siempre.
+
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import transaction
+from django.db.models import F
+from django.views.static import serve
+
+BLOB_PREFIX = 'blobs'
+BLOB_NAME_RE = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(\.\w+)?$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # El nombre sale del contenido: dos subidas iguales comparten fichero
+        return name
+
+    def blob_name(self, digest, ext):
+        return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+    def digest_from_name(self, name):
+        match = BLOB_NAME_RE.match(name or '')
+        return match.group('digest') if match else None
+
+    def _spool(self, content):
+        # Copia la subida a un temporal calculando el sha256 por el camino
+        os.makedirs(self.location, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        handle, tmp_path = tempfile.mkstemp(dir=self.location, prefix='.upload-')
+        try:
+            with os.fdopen(handle, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest(), size
+
+    def _save(self, name, content):
+        from .models import MediaBlob
+
+        tmp_path, digest, size = self._spool(content)
+        ext = os.path.splitext(name)[1].lower()
+        blob_name = self.blob_name(digest, ext)
+        try:
+            with transaction.atomic():
+                # El bloqueo de la fila serializa altas y bajas del mismo blob
+                blob, created = MediaBlob.objects.select_for_update().get_or_create(
+                    sha256=digest, defaults={'name': blob_name, 'size': size, 'ref_count': 0}
+                )
+                path = self.path(blob.name)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp_path, path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(path, self.file_permissions_mode)
+                MediaBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return blob.name
+
+    def delete(self, name):
+        from .models import MediaBlob
+
+        digest = self.digest_from_name(name)
+        if digest is None:
+            # Ficheros anteriores al almacenamiento por contenido
+            return super().delete(name)
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(sha256=digest).first()
+            if blob is not None and blob.ref_count > 1:
+                MediaBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') - 1)
+                return
+            if blob is not None:
+                blob.delete()
+            super().delete(name)
+
+
+def post_image_storage():
+    return storages['post_images']
+
+
+def serve_blob(request, path, document_root=None):
+    # Solo para desarrollo (DEBUG); en producción los sirve el servidor web con la misma cabecera
+    response = serve(request, path, document_root=document_root)
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
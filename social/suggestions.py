@@ -0,0 +1,184 @@
+# Sugerencias de a quién seguir a partir del grafo de Follow.
+#
+# Un proceso offline (compute_suggestions) carga el grafo una vez en arrays de adyacencia
+# compactos (CSR: indptr/indices) y, para cada usuario, cuenta cuántos de sus seguidos siguen
+# a cada candidato ("amigos de amigos"). Se guardan los K mejores por usuario en
+# UserSuggestions, completados con las cuentas más seguidas, de modo que la petición es una
+# sola lectura. Con NumPy el conteo está vectorizado; sin NumPy se usa array y Counter.
+#
+# Si el usuario aún no tiene fila, refresh_user la calcula en la propia petición contando solo
+# a partir de sus últimos SOCIAL_SUGGESTIONS_REFRESH_FOLLOWEES seguidos, para que el coste no
+# crezca con los que sigue; el siguiente compute_suggestions la sustituye por la completa.
+
+from array import array
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Follow, UserStats, UserSuggestions
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+User = get_user_model()
+
+GRAPH_CHUNK_SIZE = 10000
+
+
+def top_k():
+    return getattr(settings, 'SOCIAL_SUGGESTIONS_TOP_K', 50)
+
+
+def refresh_followees():
+    return getattr(settings, 'SOCIAL_SUGGESTIONS_REFRESH_FOLLOWEES', 100)
+
+
+class FollowGraph:
+    # Grafo dirigido follower -> following en formato CSR sobre índices densos 0..n-1
+
+    def __init__(self, user_ids, edges):
+        # user_ids ordenados; edges iterable de (follower_id, following_id) ordenado por follower
+        self.user_ids = array('q', user_ids)
+        self.position = {user_id: index for index, user_id in enumerate(self.user_ids)}
+        sources, targets = array('q'), array('q')
+        for follower_id, following_id in edges:
+            if follower_id in self.position and following_id in self.position:
+                sources.append(self.position[follower_id])
+                targets.append(self.position[following_id])
+
+        size = len(self.user_ids)
+        degree = array('q', [0]) * (size + 1)
+        for source in sources:
+            degree[source + 1] += 1
+        for index in range(size):
+            degree[index + 1] += degree[index]
+        self.indptr = degree
+        self.indices = targets  # Ya vienen agrupados por follower
+        if np is not None:
+            self.indptr = np.frombuffer(self.indptr, dtype=np.int64)
+            self.indices = np.frombuffer(self.indices, dtype=np.int64)
+
+    @classmethod
+    def load(cls):
+        user_ids = User.objects.order_by('id').values_list('id', flat=True)
+        edges = (
+            Follow.objects.order_by('follower_id', 'following_id')
+            .values_list('follower_id', 'following_id')
+            .iterator(chunk_size=GRAPH_CHUNK_SIZE)
+        )
+        return cls(list(user_ids), edges)
+
+    def followees(self, index):
+        return self.indices[self.indptr[index]:self.indptr[index + 1]]
+
+    def mutual_counts(self, index):
+        # (índices de candidatos, número de seguidos en común) excluyendo al propio usuario y a
+        # los que ya sigue
+        followees = self.followees(index)
+        if np is None:
+            counts = Counter(target for followee in followees for target in self.followees(followee))
+            for excluded in (index, *followees):
+                counts.pop(excluded, None)
+            return list(counts), [counts[candidate] for candidate in counts]
+
+        if not len(followees):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # Concatena las listas de adyacencia de todos los seguidos sin bucle en Python
+        starts, ends = self.indptr[followees], self.indptr[followees + 1]
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        reached = self.indices[offsets + np.arange(lengths.sum())]
+        candidates, counts = np.unique(reached, return_counts=True)
+        keep = ~np.isin(candidates, followees) & (candidates != index)
+        return candidates[keep], counts[keep]
+
+    def top(self, index, limit):
+        candidates, counts = self.mutual_counts(index)
+        if np is None:
+            ranked = sorted(zip(counts, candidates), key=lambda item: (-item[0], self.user_ids[item[1]]))[:limit]
+            return [(self.user_ids[candidate], count) for count, candidate in ranked]
+        if len(candidates) > limit:
+            best = np.argpartition(-counts, limit - 1)[:limit]
+            candidates, counts = candidates[best], counts[best]
+        order = np.lexsort((candidates, -counts))  # Más seguidos en común; a igualdad, id menor
+        return [(int(self.user_ids[candidates[i]]), int(counts[i])) for i in order]
+
+
+def popular_ids(limit):
+    return list(UserStats.objects.order_by('-follower_count', 'user_id').values_list('user_id', flat=True)[:limit])
+
+
+def with_popular(user_id, ranked, followed, popular, limit):
+    # Completa con cuentas populares hasta K, sin repetir ni incluir a seguidos
+    items = [[candidate, mutuals] for candidate, mutuals in ranked]
+    chosen = {candidate for candidate, _ in ranked} | set(followed) | {user_id}
+    for candidate in popular:
+        if len(items) >= limit:
+            break
+        if candidate not in chosen:
+            items.append([candidate, 0])
+            chosen.add(candidate)
+    return items
+
+
+def save(rows):
+    kwargs = {'update_conflicts': True, 'update_fields': ['items', 'computed_at']}
+    if connection.features.supports_update_conflicts_with_target:
+        kwargs['unique_fields'] = ['user']
+    UserSuggestions.objects.bulk_create(rows, **kwargs)
+
+
+def rebuild_all(batch_size=1000, limit=None):
+    limit = limit or top_k()
+    graph = FollowGraph.load()
+    popular = popular_ids(limit * 2)
+    now = timezone.now()
+    rows, total = [], 0
+    for index, user_id in enumerate(graph.user_ids):
+        followed = [graph.user_ids[followee] for followee in graph.followees(index)]
+        items = with_popular(user_id, graph.top(index, limit), followed, popular, limit)
+        rows.append(UserSuggestions(user_id=user_id, items=items, computed_at=now))
+        if len(rows) >= batch_size:
+            save(rows)
+            total += len(rows)
+            rows = []
+    if rows:
+        save(rows)
+        total += len(rows)
+    return total
+
+
+def refresh_user(user_id, limit=None):
+    # Cálculo de un solo usuario contra la base de datos (usuarios nuevos, o tras muchos
+    # follows) a partir de sus seguidos más recientes; el proceso completo sigue siendo
+    # rebuild_all
+    limit = limit or top_k()
+    follows = Follow.objects.filter(follower_id=user_id)
+    followed = set(follows.values_list('following_id', flat=True))
+    recent = list(follows.order_by('-id').values_list('following_id', flat=True)[:refresh_followees()])
+    ranked = (
+        Follow.objects.filter(follower_id__in=recent)
+        .exclude(following_id__in=[*recent, user_id])
+        .values('following_id')
+        .annotate(mutuals=Count('*'))
+        .order_by('-mutuals', 'following_id')
+        .values_list('following_id', 'mutuals')[:limit * 2]
+    )
+    # Los seguidos que no están entre los recientes se quitan aquí en vez de en la consulta
+    ranked = [(candidate, mutuals) for candidate, mutuals in ranked if candidate not in followed][:limit]
+    items = with_popular(user_id, ranked, followed, popular_ids(limit * 2), limit)
+    save([UserSuggestions(user_id=user_id, items=items, computed_at=timezone.now())])
+    return items
+
+
+def get_suggestions(user_id):
+    items = UserSuggestions.objects.filter(user_id=user_id).values_list('items', flat=True).first()
+    if items is None:
+        items = refresh_user(user_id)
+    return items
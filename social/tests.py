@@ -1,3 +1,1622 @@
-from django.test import TestCase
+import io
+import threading
+import time
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import events, notifications, services, sharding, timeline, tokens
+from .models import Comment, Follow, Like, Notification, Post, TimelineEntry, UserStats, UserSuggestions
+
+User = get_user_model()
+
+
+class CleanStateMixin:
+    # La caché y el timeline en memoria viven fuera de la transacción de cada test
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        timeline.reset_store()
+        events.reset_broker()
+        tokens.reset_user_cache()
+
+
+class TimelineTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.carol = User.objects.create_user('carol', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def tearDown(self):
+        timeline.reset_store()
+
+    def create_post(self, user, content):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/create-post/', {'content': content})
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def home_ids(self):
+        response = self.client.get('/api/home-posts/')
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.data['results']]
+
+    def test_post_is_fanned_out_to_followers(self):
+        Follow.objects.create(follower=self.alice, following=self.bob)
+        bob_post = self.create_post(self.bob, 'hola')
+        carol_post = self.create_post(self.carol, 'no me sigue nadie')
+        own_post = self.create_post(self.alice, 'mío')
+
+        self.assertEqual(self.home_ids(), [own_post, bob_post])
+        self.assertNotIn(carol_post, self.home_ids())
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.alice, post_id=bob_post).exists())
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        bob_post = self.create_post(self.bob, 'hola')
+        self.assertEqual(self.home_ids(), [])
+
+        self.client.post(f'/api/users/{self.bob.id}/follow/')
+        self.assertEqual(self.home_ids(), [bob_post])
+
+        self.client.post(f'/api/users/{self.bob.id}/unfollow/')
+        self.assertEqual(self.home_ids(), [])
+
+    def test_delete_removes_post_from_timelines(self):
+        Follow.objects.create(follower=self.alice, following=self.bob)
+        bob_post = self.create_post(self.bob, 'hola')
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        client.delete(f'/api/posts/{bob_post}/delete/')
+
+        self.assertEqual(self.home_ids(), [])
+        self.assertFalse(TimelineEntry.objects.filter(post_id=bob_post).exists())
+
+    @override_settings(SOCIAL_TIMELINE_FANOUT_LIMIT=1)
+    def test_high_follower_author_is_read_on_demand(self):
+        for follower in (self.alice, self.carol):
+            client = APIClient()
+            client.force_authenticate(follower)
+            client.post(f'/api/users/{self.bob.id}/follow/')
+        cache.clear()  # El conjunto de autores con fan-out on read se recalcula periódicamente
+        bob_post = self.create_post(self.bob, 'famoso')
+
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.alice, post_id=bob_post).exists())
+        self.assertEqual(self.home_ids(), [bob_post])
+
+    @override_settings(SOCIAL_TIMELINE_FANOUT_LIMIT=1)
+    def test_author_back_under_the_limit_is_backfilled(self):
+        for follower in (self.alice, self.carol):
+            client = APIClient()
+            client.force_authenticate(follower)
+            client.post(f'/api/users/{self.bob.id}/follow/')
+        cache.clear()
+        bob_post = self.create_post(self.bob, 'famoso')
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.alice, post_id=bob_post).exists())
+
+        client = APIClient()
+        client.force_authenticate(self.carol)
+        client.post(f'/api/users/{self.bob.id}/unfollow/')
+
+        # El unfollow que deja a bob en el límite rellena los timelines; la home solo lee
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.alice, post_id=bob_post).exists())
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.home_ids(), [bob_post])
+        writes = [query['sql'] for query in queries if not query['sql'].lstrip().upper().startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(writes, [])
+
+    @override_settings(SOCIAL_TIMELINE_FANOUT_LIMIT=1)
+    def test_home_pages_merge_timeline_and_pulled_authors(self):
+        for follower in (self.alice, self.carol):
+            client = APIClient()
+            client.force_authenticate(follower)
+            client.post(f'/api/users/{self.bob.id}/follow/')
+        Follow.objects.create(follower=self.alice, following=self.carol)
+        cache.clear()
+        posts = [self.create_post(user, f'post {i}') for i, user in enumerate([self.bob, self.carol, self.alice] * 2)]
+
+        ids, url = [], '/api/home-posts/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            ids += [post['id'] for post in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, posts[::-1])
+
+    @override_settings(SOCIAL_TIMELINE_MAX_ENTRIES=2, SOCIAL_TIMELINE_TRIM_SLACK=1)
+    def test_periodic_trim_keeps_max_entries(self):
+        from django.core.management import call_command
+
+        Follow.objects.create(follower=self.alice, following=self.bob)
+        posts = [self.create_post(self.bob, f'post {i}') for i in range(4)]
+        carol_post = self.create_post(self.carol, 'solo uno')
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.alice).count(), 4)  # El fan-out no recorta
+
+        output = io.StringIO()
+        call_command('rebuild_timelines', trim=True, stdout=output)
+        self.assertIn('2 timelines recortados', output.getvalue())  # El de carol está dentro del límite
+        self.assertEqual(list(TimelineEntry.objects.filter(owner=self.carol).values_list('post_id', flat=True)), [carol_post])
+        for owner in (self.alice, self.bob):
+            kept = TimelineEntry.objects.filter(owner=owner).order_by('-created_at', '-post_id').values_list('post_id', flat=True)
+            self.assertEqual(list(kept), posts[:1:-1])
+
+    @override_settings(SOCIAL_TIMELINE_BACKEND='social.timeline.LocMemTimelineStore')
+    def test_locmem_backend(self):
+        timeline.reset_store()
+        Follow.objects.create(follower=self.alice, following=self.bob)
+        first = self.create_post(self.bob, 'uno')
+        second = self.create_post(self.bob, 'dos')
+
+        self.assertEqual(self.home_ids(), [second, first])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+
+class KeysetPaginationTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.post = Post.objects.create(user=self.alice, content='post')
+        for i in range(4):
+            Post.objects.create(user=self.alice, content=f'post {i}', created_at=self.post.created_at)
+            Comment.objects.create(user=self.alice, post=self.post, content=f'comment {i}')
+
+    def collect(self, url, key):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data[key]]
+            url = response.data['next']
+        return ids
+
+    def test_posts_are_paginated_by_created_at_and_id(self):
+        ids = self.collect('/api/user-posts/?page_size=2', 'results')
+        expected = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_comments_are_paginated_in_chronological_order(self):
+        ids = self.collect(f'/api/posts/{self.post.id}/comments/?page_size=3', 'comments')
+        expected = list(Comment.objects.order_by('created_at', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_profile_embeds_one_page_of_posts(self):
+        response = self.client.get(f'/api/users/{self.alice.id}/?page_size=2')
+        self.assertEqual(len(response.data['posts']), 2)
+        self.assertIsNotNone(response.data['posts_next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/user-posts/?cursor=nope')
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor_values(self):
+        from .pagination import KeysetPagination
+
+        encode = KeysetPagination().encode_cursor
+        urls = ['/api/user-posts/', '/api/home-posts/', f'/api/users/{self.alice.id}/', f'/api/posts/{self.post.id}/comments/']
+        positions = [['x', 'y'], [None, None], [{'a': 1}, 1], ['2026-01-01T00:00:00', 'abc'], ['2026-13-01T00:00:00', 1], ['2026-01-01T00:00:00', True]]
+        for url in urls:
+            for position in positions:
+                with self.subTest(url=url, position=position):
+                    self.assertEqual(self.client.get(f'{url}?cursor={encode(position)}').status_code, 404)
+
+
+class FeedQueryCountTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.viewer = User.objects.create_user('viewer', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        self.authors = [User.objects.create_user(f'author{i}', password='pw') for i in range(3)]
+        for author in self.authors:
+            Follow.objects.create(follower=self.viewer, following=author)
+
+    def add_posts(self, count):
+        for i in range(count):
+            author = self.authors[i % len(self.authors)]
+            post = Post.objects.create(user=author, content=f'post {i}')
+            timeline.fan_out_post(post)
+            for commenter in self.authors:
+                Comment.objects.create(user=commenter, post=post, content='comentario')
+                Like.objects.create(user=commenter, post=post)
+
+    def count_queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_home_feed_query_count_does_not_depend_on_page_size(self):
+        self.add_posts(20)
+        self.client.get('/api/home-posts/')  # Calienta la caché de autores con fan-out on read
+        small, _ = self.count_queries('/api/home-posts/?page_size=5')
+        large, response = self.count_queries('/api/home-posts/?page_size=20')
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertTrue(response.data['results'][0]['comments'][0]['user']['is_followed'])
+
+    def test_profile_query_count_does_not_depend_on_page_size(self):
+        self.add_posts(12)
+        author = self.authors[0]
+        small, _ = self.count_queries(f'/api/users/{author.id}/?page_size=1')
+        large, _ = self.count_queries(f'/api/users/{author.id}/?page_size=4')
+        self.assertEqual(small, large)
+
+
+class CounterTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.post = Post.objects.create(user=self.bob, content='hola')
+
+    def test_like_and_comment_counters(self):
+        self.client.post('/api/like/', {'post_id': self.post.id})
+        response = self.client.post('/api/comments/', {'post_id': self.post.id, 'content': 'hey'})
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 1))
+        self.assertEqual(self.client.get(f'/api/post/{self.post.id}/likes-count/').data, {'likesCount': 1})
+
+        self.client.delete('/api/unlike/', {'post_id': self.post.id})
+        self.client.delete(f'/api/comments/{response.data["id"]}/')
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (0, 0))
+
+    def test_follow_and_post_counters(self):
+        self.client.post(f'/api/users/{self.bob.id}/follow/')
+        self.client.post('/api/create-post/', {'content': 'nuevo'})
+        response = self.client.get(f'/api/users/{self.bob.id}/')
+        self.assertEqual(response.data['followers_count'], 1)
+        self.assertEqual(UserStats.objects.get(user=self.alice).following_count, 1)
+        self.assertEqual(self.client.get(f'/api/users/{self.alice.id}/').data['post_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):  # Invalida la caché del perfil
+            self.client.post(f'/api/users/{self.bob.id}/unfollow/')
+        self.assertEqual(self.client.get(f'/api/users/{self.bob.id}/').data['followers_count'], 0)
+
+    def test_reconcile_command_fixes_drift(self):
+        from django.core.management import call_command
+        from io import StringIO
+
+        Like.objects.create(user=self.alice, post=self.post)
+        Follow.objects.create(follower=self.alice, following=self.bob)
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.bob.stats.refresh_from_db()
+        self.assertEqual((self.bob.stats.follower_count, self.bob.stats.post_count), (1, 1))
+
+
+class CompactFeedTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.client.post(f'/api/users/{self.bob.id}/follow/')
+        bob = APIClient()
+        bob.force_authenticate(self.bob)
+        self.post_id = bob.post('/api/create-post/', {'content': 'hola'}).data['id']
+        self.client.post('/api/like/', {'post_id': self.post_id})
+        for i in range(5):
+            bob.post('/api/comments/', {'post_id': self.post_id, 'content': f'comentario {i}'})
+
+    def test_compact_representation(self):
+        response = self.client.get('/api/home-posts/?fields=compact')
+        post = response.data['results'][0]
+        self.assertNotIn('likes', post)
+        self.assertEqual(post['like_count'], 1)
+        self.assertEqual(post['comment_count'], 5)
+        self.assertTrue(post['viewer_has_liked'])
+        self.assertEqual([c['content'] for c in post['latest_comments']], ['comentario 2', 'comentario 3', 'comentario 4'])
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get('/api/home-posts/?fields=id,like_count')
+        self.assertEqual(response.data['results'], [{'id': self.post_id, 'like_count': 1}])
+
+        response = self.client.get(f'/api/users/{self.bob.id}/?fields=compact,id,viewer_has_liked')
+        self.assertEqual(response.data['posts'], [{'id': self.post_id, 'viewer_has_liked': True}])
+
+
+class BatchStatusTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.carol = User.objects.create_user('carol', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.liked = Post.objects.create(user=self.bob, content='uno', like_count=1)
+        self.other = Post.objects.create(user=self.bob, content='dos')
+        Like.objects.create(user=self.alice, post=self.liked)
+        Follow.objects.create(follower=self.alice, following=self.bob)
+
+    def test_batch_like_status(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/like-status/?ids={self.liked.id},{self.other.id},999')
+        self.assertEqual(response.data['likes'], {
+            self.liked.id: {'liked': True, 'likesCount': 1},
+            self.other.id: {'liked': False, 'likesCount': 0},
+        })
+
+    def test_batch_follow_status(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/follow-status/?ids={self.bob.id},{self.carol.id}')
+        self.assertEqual(response.data['follows'], {self.bob.id: True, self.carol.id: False})
+
+    @override_settings(SOCIAL_BATCH_MAX_IDS=2)
+    def test_list_size_is_limited(self):
+        self.assertEqual(self.client.get('/api/follow-status/?ids=1,2,3').status_code, 400)
+        self.assertEqual(self.client.get('/api/like-status/?ids=a').status_code, 400)
+
+
+class ResponseCacheTests(CleanStateMixin, TransactionTestCase):
+    # TransactionTestCase: las versiones se suben en on_commit
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.bob_client = APIClient()
+        self.bob_client.force_authenticate(self.bob)
+        self.post_id = self.bob_client.post('/api/create-post/', {'content': 'hola'}).data['id']
+        self.bob_client.post('/api/comments/', {'post_id': self.post_id, 'content': 'primero'})
+
+    def profile(self, client=None):
+        return (client or self.client).get(f'/api/users/{self.bob.id}/').data
+
+    def test_profile_is_served_from_cache_until_a_write(self):
+        self.profile()
+        with self.assertNumQueries(2):  # is_followed y los is_followed de los comentarios
+            self.profile()
+
+        self.client.post('/api/like/', {'post_id': self.post_id})
+        self.assertEqual(len(self.profile()['posts'][0]['likes']), 1)
+
+        self.client.post('/api/comments/', {'post_id': self.post_id, 'content': 'segundo'})
+        self.assertEqual(len(self.profile()['posts'][0]['comments']), 2)
+
+    def test_viewer_specific_fields_are_not_shared(self):
+        self.client.post(f'/api/users/{self.bob.id}/follow/')
+        self.profile(self.bob_client)
+        data = self.profile()
+        self.assertTrue(data['is_followed'])
+        self.assertTrue(data['posts'][0]['comments'][0]['user']['is_followed'])
+        self.assertEqual(data['followers_count'], 1)
+        self.assertFalse(self.profile(self.bob_client)['posts'][0]['comments'][0]['user']['is_followed'])
+
+    def test_user_posts_invalidated_on_delete(self):
+        self.assertEqual(len(self.bob_client.get('/api/user-posts/').data['results']), 1)
+        self.bob_client.delete(f'/api/posts/{self.post_id}/delete/')
+        self.assertEqual(self.bob_client.get('/api/user-posts/').data['results'], [])
+
+    def test_deleting_a_user_invalidates_the_posts_they_liked_or_commented(self):
+        carol = User.objects.create_user('carol', password='pw')
+        carol_client = APIClient()
+        carol_client.force_authenticate(carol)
+        carol_client.post('/api/like/', {'post_id': self.post_id})
+        carol_client.post('/api/comments/', {'post_id': self.post_id, 'content': 'de carol'})
+        post = self.profile()['posts'][0]
+        self.assertEqual((len(post['likes']), len(post['comments'])), (1, 2))
+
+        carol.delete()
+        post = self.profile()['posts'][0]
+        self.assertEqual((len(post['likes']), len(post['comments'])), (0, 1))
+
+    def test_file_based_backend(self):
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as location:
+            backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+            with self.settings(CACHES={'default': backend}):
+                self.profile()
+                self.client.post('/api/like/', {'post_id': self.post_id})
+                self.assertEqual(self.profile()['posts'][0]['like_count'], 1)
+
+
+class ImagePipelineTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        import tempfile
+
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=self.media.name, SOCIAL_IMAGE_PIPELINE_SYNC=True, SOCIAL_IMAGE_VARIANT_WIDTHS=(32, 64, 1080))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def upload(self):
+        from io import BytesIO
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        image = Image.new('RGB', (100, 50), 'red')
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera Maker'  # Make
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', exif=exif)
+        upload = SimpleUploadedFile('foto.jpg', buffer.getvalue(), content_type='image/jpeg')
+        return self.client.post('/api/create-post/', {'content': 'con foto', 'image': upload}, format='multipart')
+
+    def test_variants_placeholder_and_exif(self):
+        from PIL import Image
+
+        self.assertEqual(self.upload().status_code, 201)
+        post = Post.objects.get()
+        self.assertEqual(sorted(post.image_variants['webp']), ['100', '32', '64'])
+        self.assertTrue(post.image_placeholder.startswith('data:image/jpeg;base64,'))
+        with post.image.open() as original:
+            self.assertFalse(Image.open(original).getexif())
+
+        data = self.client.get('/api/user-posts/').data['results'][0]
+        self.assertTrue(data['image_variants']['jpeg']['32'].startswith('http://testserver/media/blobs/'))
+        self.assertEqual((data['image_variants']['width'], data['image_variants']['height']), (100, 50))
+
+    def test_reprocessing_releases_previous_variants(self):
+        from django.core.management import call_command
+        from .models import MediaBlob
+
+        self.upload()
+        refs = dict(MediaBlob.objects.values_list('name', 'ref_count'))
+        call_command('process_post_images', '--all', stdout=io.StringIO())
+        call_command('process_post_images', '--all', stdout=io.StringIO())
+        self.assertEqual(dict(MediaBlob.objects.values_list('name', 'ref_count')), refs)
+
+        post = Post.objects.get()
+        self.client.delete(f'/api/posts/{post.id}/delete/')
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_delete_removes_variants(self):
+        self.upload()
+        post = Post.objects.get()
+        names = list(post.image_variants['webp'].values())
+        self.client.delete(f'/api/posts/{post.id}/delete/')
+        self.assertFalse(any(post.image.storage.exists(name) for name in names))
+
+
+class ContentAddressedStorageTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        import tempfile
+
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=self.media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def upload(self, name):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from io import BytesIO
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new('RGB', (4, 4), 'blue').save(buffer, 'PNG')
+        upload = SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+        response = self.client.post('/api/create-post/', {'content': name, 'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return Post.objects.get(id=response.data['id'])
+
+    def test_identical_uploads_share_one_blob(self):
+        from .models import MediaBlob
+
+        first = self.upload('Captura.png')
+        second = self.upload('Captura.png')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+
+        self.client.delete(f'/api/posts/{first.id}/delete/')
+        self.assertTrue(second.image.storage.exists(second.image.name))
+        self.client.delete(f'/api/posts/{second.id}/delete/')
+        self.assertFalse(second.image.storage.exists(second.image.name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+
+class UserSearchTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.viewer = User.objects.create_user('viewer', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        for name in ('xmaria', 'maria', 'mariano', 'anamaria', 'marioneta', 'pedro'):
+            User.objects.create_user(name, password='pw')
+
+    def search(self, query, **params):
+        response = self.client.get('/api/search-users/', {'query': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranking(self):
+        UserStats.objects.filter(user__username='anamaria').update(follower_count=10)
+        Follow.objects.create(follower=self.viewer, following=User.objects.get(username='xmaria'))
+
+        names = [user['username'] for user in self.search('Maria')['results']]
+        # exacto, prefijo, seguido por el usuario, más seguidores
+        self.assertEqual(names, ['maria', 'mariano', 'xmaria', 'anamaria'])
+        self.assertTrue(self.search('xmaria')['results'][0]['is_followed'])
+
+    def test_short_queries_match_prefix_and_rename_reindexes(self):
+        self.assertEqual([u['username'] for u in self.search('pe')['results']], ['pedro'])
+        pedro = User.objects.get(username='pedro')
+        pedro.username = 'pablo'
+        pedro.save()
+        self.assertEqual(self.search('edr')['results'], [])
+        self.assertEqual([u['username'] for u in self.search('abl')['results']], ['pablo'])
+
+    @override_settings(SOCIAL_USER_SEARCH_LIMIT=3)
+    def test_results_are_capped_and_paginated(self):
+        first = self.search('mari', page_size=2)
+        self.assertEqual(len(first['results']), 2)
+        second = self.client.get(first['next']).data
+        self.assertEqual(len(second['results']), 1)
+        self.assertIsNone(second['next'])
+
+    def test_empty_query_returns_nothing(self):
+        self.assertEqual(self.search('')['results'], [])
+
+
+class ContentSearchTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.other = Post.objects.create(user=self.alice, content='Hoy llueve en Madrid')
+        self.song = Post.objects.create(user=self.alice, content='Una canción, otra canción y más canciones')
+        self.both = Post.objects.create(user=self.alice, content='Canción para la lluvia de Madrid')
+        self.comment = Comment.objects.create(user=self.alice, post=self.other, content='Qué cancion tan buena')
+
+    def search(self, q, **params):
+        response = self.client.get('/api/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_posts_are_ranked_by_relevance(self):
+        ids = [post['id'] for post in self.search('cancion madrid')['results']]
+        self.assertEqual(ids, [self.both.id, self.song.id, self.other.id])
+
+    def test_comments_and_incremental_removal(self):
+        self.assertEqual([c['id'] for c in self.search('canción', type='comments')['results']], [self.comment.id])
+        self.comment.delete()
+        self.assertEqual(self.search('canción', type='comments')['results'], [])
+        self.song.delete()
+        self.assertEqual([post['id'] for post in self.search('canción')['results']], [self.both.id])
+
+    def test_cursor_pagination(self):
+        first = self.search('cancion madrid', page_size=2)
+        second = self.client.get(first['next']).data
+        ids = [post['id'] for post in first['results'] + second['results']]
+        self.assertEqual(ids, [self.both.id, self.song.id, self.other.id])
+        self.assertIsNone(second['next'])
+
+    def test_tampered_cursor(self):
+        import base64
+        import json
+        from django.core import signing
+        from .pagination import SearchPagination
+
+        def signed(payload):
+            return signing.dumps(payload, salt=SearchPagination.signing_salt, compress=True)
+
+        terms = {'cancion': 1, 'madrid': 1}
+        cursors = [
+            signed({'position': [1, 1, 1], 'weights': [1, 2]}),
+            signed({'position': ['a', 'b', 'c'], 'weights': terms}),
+            signed({'position': [1, 1, 1], 'weights': {'cancion': 10 ** 30, 'madrid': 1}}),
+            signed({'position': [1, 1, 1], 'weights': {'otra': 1}}),
+            base64.urlsafe_b64encode(json.dumps({'position': [1, 1, 1], 'weights': terms}).encode()).decode(),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/search/', {'q': 'cancion madrid', 'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_rebuild_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import ContentToken
+
+        ContentToken.objects.all().delete()
+        call_command('rebuild_search_index', batch_size=2, stdout=StringIO())
+        self.assertEqual(len(self.search('madrid')['results']), 2)
+
+
+def api_urlconf(use_async):
+    # Urlconf con la pila de vistas elegida, para comparar las dos en los tests
+    import types
+    from django.urls import include, path
+    from .urls import build_urlpatterns
+
+    module = types.ModuleType('async_urls' if use_async else 'sync_urls')
+    module.urlpatterns = [path('api/', include(build_urlpatterns(use_async)))]
+    return module
+
+
+class AsyncViewTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.client.post(f'/api/users/{self.bob.id}/follow/')
+        for i in range(3):
+            post = Post.objects.create(user=self.bob, content=f'hola mundo {i}')
+            timeline.fan_out_post(post)
+        self.post = post
+        Like.objects.create(user=self.alice, post=post)
+        Comment.objects.create(user=self.bob, post=post, content='hola de nuevo')
+
+    def get(self, use_async, url):
+        with override_settings(ROOT_URLCONF=api_urlconf(use_async)):
+            return self.client.get(url)
+
+    def test_async_views_match_sync_views(self):
+        urls = [
+            '/api/home-posts/?page_size=2',
+            '/api/home-posts/?fields=compact',
+            f'/api/users/{self.bob.id}/',
+            f'/api/users/{self.bob.id}/?fields=compact',
+            '/api/users/999/',
+            f'/api/posts/{self.post.id}/comments/',
+            '/api/posts/999/comments/',
+            f'/api/like-status/{self.post.id}/',
+            f'/api/follow-status/{self.bob.id}/',
+            f'/api/like-status/?ids={self.post.id},999',
+            f'/api/follow-status/?ids={self.bob.id},999',
+            '/api/search-users/?query=bo',
+            '/api/search/?q=hola',
+            '/api/search/?q=hola&type=comments',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                expected, actual = self.get(False, url), self.get(True, url)
+                self.assertEqual(actual.status_code, expected.status_code)
+                self.assertEqual(actual.json(), expected.json())
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.get(True, f'/api/users/{self.bob.id}/').status_code, 401)
+        self.assertEqual(self.get(True, '/api/home-posts/').json(), {'next': None, 'results': []})
+
+    async def test_served_through_asgi_with_jwt(self):
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.alice).access_token))()
+        with override_settings(ROOT_URLCONF=api_urlconf(True)):
+            response = await AsyncClient().get(f'/api/users/{self.bob.id}/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()['is_followed'])
+        self.assertEqual(len(response.json()['posts']), 3)
+
+
+class EventStreamTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.post = Post.objects.create(user=self.alice, content='hola')
+
+    def write(self, user, method, url, data=None):
+        # Escritura síncrona desde un test async, ejecutando los on_commit
+        def run():
+            client = APIClient()
+            client.force_authenticate(user)
+            with self.captureOnCommitCallbacks(execute=True):
+                return getattr(client, method)(url, data)
+        return sync_to_async(run)()
+
+    async def test_writes_publish_to_the_users_concerned(self):
+        alice = events.get_broker().subscribe(self.alice.id)
+        bob = events.get_broker().subscribe(self.bob.id)
+
+        await self.write(self.bob, 'post', '/api/like/', {'post_id': self.post.id})
+        await self.write(self.bob, 'post', '/api/comments/', {'post_id': self.post.id, 'content': 'bien'})
+        await self.write(self.bob, 'post', f'/api/users/{self.alice.id}/follow/')
+        received = [await alice.get(timeout=1) for _ in range(3)]
+        self.assertEqual([event['type'] for event in received], [events.LIKE, events.COMMENT, events.FOLLOW])
+
+        await self.write(self.alice, 'post', '/api/create-post/', {'content': 'nuevo'})
+        event = await bob.get(timeout=1)
+        self.assertEqual((event['type'], event['data']['user_id']), (events.NEW_POST, self.alice.id))
+        self.assertTrue(alice.queue.empty())  # Nadie recibe avisos de sus propias acciones
+        alice.close()
+        bob.close()
+
+    async def test_sse_stream_requires_a_valid_ticket(self):
+        from django.test import AsyncClient
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        client = AsyncClient()
+        self.assertEqual((await sync_to_async(APIClient().get)('/api/events/')).status_code, 501)  # WSGI
+        self.assertEqual((await client.get('/api/events/')).status_code, 401)
+        self.assertEqual((await client.get('/api/events/?ticket=nope')).status_code, 401)
+
+        # El JWT ya no vale en la URL; con él se pide un ticket que solo sirve para el stream
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.alice).access_token))()
+        self.assertEqual((await client.get(f'/api/events/?token={token}')).status_code, 401)
+        issued = await sync_to_async(APIClient().post)('/api/events/ticket/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(issued.status_code, 200)
+        with override_settings(SOCIAL_EVENT_TICKET_TTL=-1):
+            self.assertEqual((await client.get(f'/api/events/?ticket={issued.data["ticket"]}')).status_code, 401)
+
+        response = await client.get(f'/api/events/?ticket={issued.data["ticket"]}')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b'retry: 5000\n\n')
+
+        events.get_broker().publish([self.alice.id], {'type': events.LIKE, 'data': {'post_id': self.post.id}})
+        chunk = await anext(chunks)
+        self.assertIn(b'event: like\n', chunk)
+        self.assertIn(f'"post_id": {self.post.id}'.encode(), chunk)
+        await chunks.aclose()
+
+
+class NotificationTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.post = Post.objects.create(user=self.alice, content='hola')
+        self.others = [User.objects.create_user(f'user{i}', password='pw') for i in range(5)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def act(self, user, url, data=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post(url, data)
+
+    def test_similar_events_are_aggregated_while_unread(self):
+        for user in self.others:
+            self.act(user, '/api/like/', {'post_id': self.post.id})
+        self.act(self.others[0], '/api/comments/', {'post_id': self.post.id, 'content': 'bien'})
+        self.act(self.others[1], f'/api/users/{self.alice.id}/follow/')
+        self.act(self.alice, '/api/like/', {'post_id': self.post.id})  # Like propio: sin aviso
+
+        inbox = self.client.get('/api/notifications/').data['results']
+        self.assertEqual([n['verb'] for n in inbox], ['follow', 'comment', 'like'])
+        like = inbox[2]
+        self.assertEqual(like['actor_count'], 5)
+        self.assertEqual([actor['username'] for actor in like['latest_actors']], ['user4', 'user3', 'user2'])
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data, {'unread': 3})
+
+    def test_deleting_the_post_discounts_its_unread_notifications(self):
+        from django.core.management import call_command
+
+        for user in self.others[:2]:
+            self.act(user, '/api/like/', {'post_id': self.post.id})
+        self.act(self.others[0], '/api/comments/', {'post_id': self.post.id, 'content': 'bien'})
+        self.act(self.others[1], f'/api/users/{self.alice.id}/follow/')
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data, {'unread': 3})
+
+        self.client.delete(f'/api/posts/{self.post.id}/delete/')
+        self.assertEqual(Notification.objects.filter(recipient=self.alice).count(), 1)
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data, {'unread': 1})
+        output = io.StringIO()
+        call_command('reconcile_counters', stdout=output)
+        self.assertIn('0 usuarios corregidos', output.getvalue())
+
+    def test_mark_read_starts_a_new_group(self):
+        self.act(self.others[0], '/api/like/', {'post_id': self.post.id})
+        first = self.client.get('/api/notifications/').data['results'][0]['id']
+        response = self.client.post('/api/notifications/read/', {'ids': [first]}, format='json')
+        self.assertEqual(response.data, {'marked': 1, 'unread': 0})
+
+        self.act(self.others[1], '/api/like/', {'post_id': self.post.id})
+        inbox = self.client.get('/api/notifications/').data['results']
+        self.assertEqual([(n['actor_count'], n['is_read']) for n in inbox], [(1, False), (1, True)])
+
+        with self.assertNumQueries(3):  # Marcar, restar del contador y leerlo; sin COUNT(*)
+            self.assertEqual(self.client.post('/api/notifications/read/', {}, format='json').data['marked'], 1)
+        self.assertEqual(UserStats.objects.get(user=self.alice).unread_notifications, 0)
+
+
+class IdempotentWriteTests(CleanStateMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.post = Post.objects.create(user=self.bob, content='hola')
+
+    def hammer(self, action, *args, times=8):
+        # Varios "dobles clics" a la vez: hilos con su propia conexión que llaman al servicio
+        # después de esperarse en una barrera. SQLite solo admite un escritor y puede responder
+        # "database is locked"; la transacción se deshace entera, así que se reintenta como lo
+        # haría el cliente. Devuelve el primer valor de cada llamada (creado o borrado)
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import OperationalError, connection
+
+        barrier = threading.Barrier(times)
+
+        def call(_):
+            try:
+                barrier.wait()
+                for attempt in range(50):
+                    try:
+                        return action(*args)[0]
+                    except OperationalError:
+                        if attempt == 49:
+                            raise
+                        time.sleep(0.02)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=times) as pool:
+            return list(pool.map(call, range(times)))
+
+    def test_concurrent_likes_and_unlikes(self):
+        self.assertEqual(self.hammer(services.like_post, self.alice, self.post.id).count(True), 1)
+        self.assertEqual(Like.objects.count(), 1)
+        self.assertEqual(Post.objects.get(id=self.post.id).like_count, 1)
+        notification = Notification.objects.get(recipient=self.bob)
+        self.assertEqual((notification.verb, notification.actor_count), (Notification.LIKE, 1))
+        self.assertEqual(UserStats.objects.get(user=self.bob).unread_notifications, 1)
+
+        self.assertEqual(self.hammer(services.unlike_post, self.alice, self.post.id).count(True), 1)
+        self.assertEqual((Like.objects.count(), Post.objects.get(id=self.post.id).like_count), (0, 0))
+
+    def test_concurrent_follows_and_unfollows(self):
+        self.assertEqual(self.hammer(services.follow_user, self.alice, self.bob.id).count(True), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(UserStats.objects.get(user=self.bob).follower_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.alice).following_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.alice, post=self.post).exists())
+        self.assertEqual(Notification.objects.get(recipient=self.bob).verb, Notification.FOLLOW)
+
+        self.assertEqual(self.hammer(services.unfollow_user, self.alice, self.bob.id).count(True), 1)
+        self.assertEqual(UserStats.objects.get(user=self.bob).follower_count, 0)
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.alice).exists())
+
+    def test_failed_side_effect_rolls_back_and_the_retry_finishes_it(self):
+        from unittest import mock
+        from django.db import OperationalError
+
+        for action, target in ((services.follow_user, self.bob.id), (services.like_post, self.post.id)):
+            with self.subTest(action=action.__name__):
+                with mock.patch.object(notifications, 'notify', side_effect=OperationalError('database is locked')):
+                    with self.assertRaises(OperationalError):
+                        action(self.alice, target)
+                self.assertFalse(Follow.objects.exists() if action is services.follow_user else Like.objects.exists())
+                created, count = action(self.alice, target)
+                self.assertEqual((created, count), (True, 1))
+        self.assertEqual(Notification.objects.filter(recipient=self.bob).count(), 2)
+        self.assertEqual(UserStats.objects.get(user=self.bob).unread_notifications, 2)
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.alice, post=self.post).exists())
+
+    def test_state_and_counter_in_the_response(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.post('/api/like/', {'post_id': self.post.id})
+        self.assertEqual((response.status_code, response.data['liked'], response.data['likesCount']), (201, True, 1))
+        response = client.post('/api/like/', {'post_id': self.post.id})
+        self.assertEqual((response.status_code, response.data['likesCount']), (200, 1))
+        self.assertEqual(client.post('/api/like/', {'post_id': 999}).status_code, 404)
+        self.assertEqual(client.delete('/api/unlike/', {'post_id': 999}).status_code, 404)
+        self.assertEqual(client.post('/api/users/999/follow/').status_code, 404)
+        self.assertEqual(client.post('/api/users/999/unfollow/').status_code, 404)
+
+
+class BulkWriteTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.users = [User.objects.create_user(f'user{i}', password='pw') for i in range(4)]
+        self.posts = [Post.objects.create(user=user, content=f'post {user.username}') for user in self.users]
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_bulk_follow_and_unfollow(self):
+        ids = [user.id for user in self.users]
+        self.client.post(f'/api/users/{ids[0]}/follow/')
+        response = self.client.post('/api/follows/bulk/', {'user_ids': [*ids, self.alice.id, 999]}, format='json')
+        results = response.data['results']
+        self.assertEqual(results[ids[0]], 'already_following')
+        self.assertEqual([results[user_id] for user_id in ids[1:]], ['following'] * 3)
+        self.assertEqual((results[self.alice.id], results[999]), ('self', 'not_found'))
+
+        self.assertEqual(UserStats.objects.get(user=self.alice).following_count, 4)
+        self.assertEqual([UserStats.objects.get(user_id=user_id).follower_count for user_id in ids], [1] * 4)
+        self.assertEqual(len(self.client.get('/api/home-posts/').data['results']), 4)  # Timeline rellenado
+
+        response = self.client.delete('/api/follows/bulk/', {'user_ids': ids[:2]}, format='json')
+        self.assertEqual(set(response.data['results'].values()), {'unfollowed'})
+        self.assertEqual(UserStats.objects.get(user=self.alice).following_count, 2)
+        self.assertEqual(len(self.client.get('/api/home-posts/').data['results']), 2)
+
+    def test_bulk_likes_keep_counters_consistent(self):
+        ids = [post.id for post in self.posts]
+        self.client.post('/api/like/', {'post_id': ids[0]})
+        with self.captureOnCommitCallbacks(execute=True):
+            results = self.client.post('/api/likes/bulk/', {'post_ids': [*ids, 999]}, format='json').data['results']
+        self.assertEqual(results, {ids[0]: 'already_liked', ids[1]: 'liked', ids[2]: 'liked', ids[3]: 'liked', 999: 'not_found'})
+        self.assertEqual([Post.objects.get(id=post_id).like_count for post_id in ids], [1] * 4)
+        self.assertEqual(Notification.objects.filter(verb=Notification.LIKE).count(), 4)
+
+        results = self.client.delete('/api/likes/bulk/', {'post_ids': ids[:2]}, format='json').data['results']
+        self.assertEqual(results, {ids[0]: 'unliked', ids[1]: 'unliked'})
+        self.assertEqual([Post.objects.get(id=post_id).like_count for post_id in ids], [0, 0, 1, 1])
+        self.assertEqual(self.client.post('/api/likes/bulk/', {'post_ids': 'x'}, format='json').status_code, 400)
+
+    def test_bulk_comments(self):
+        Post.objects.get_or_create(id=1, defaults={'user': self.users[0], 'content': 'uno'})  # True == 1
+        items = [
+            {'post_id': self.posts[0].id, 'content': 'uno'},
+            {'post_id': self.posts[0].id, 'content': 'dos'},
+            {'post_id': 999, 'content': 'nada'},
+            {'post_id': self.posts[1].id, 'content': ' '},
+            {'post_id': True, 'content': 'bool'},
+        ]
+        results = self.client.post('/api/comments/bulk/', {'comments': items}, format='json').data['results']
+        self.assertEqual([('id' in result, result.get('error')) for result in results], [
+            (True, None), (True, None), (False, 'not_found'), (False, 'content is required'), (False, 'not_found'),
+        ])
+        self.assertEqual(Post.objects.get(id=self.posts[0].id).comment_count, 2)
+        self.assertFalse(Comment.objects.filter(content='bool').exists())
+        self.assertEqual(len(self.client.get('/api/search/', {'q': 'dos', 'type': 'comments'}).data['results']), 1)
+
+
+class SuggestionTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        names = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank']
+        self.u = {name: User.objects.create_user(name, password='pw') for name in names}
+        graph = {
+            'alice': ['bob', 'carol'],
+            'bob': ['dave', 'erin'],
+            'carol': ['dave', 'alice'],
+            'dave': ['frank'],
+            'erin': ['frank'],
+            'frank': ['dave'],
+        }
+        for follower, followees in graph.items():
+            for followee in followees:
+                Follow.objects.create(follower=self.u[follower], following=self.u[followee])
+        from django.core.management import call_command
+        from io import StringIO
+        call_command('reconcile_counters', stdout=StringIO())
+
+    def expected_for_alice(self):
+        # dave lo siguen bob y carol (2), erin solo bob (1); frank entra como cuenta popular
+        return [[self.u['dave'].id, 2], [self.u['erin'].id, 1], [self.u['frank'].id, 0]]
+
+    def test_graph_ranking_with_and_without_numpy(self):
+        from unittest import mock
+        from . import suggestions
+
+        for numpy in (suggestions.np, None):
+            with self.subTest(numpy=numpy is not None), mock.patch.object(suggestions, 'np', numpy):
+                suggestions.rebuild_all(batch_size=2, limit=3)
+                items = UserSuggestions.objects.get(user=self.u['alice']).items
+                self.assertEqual(items, self.expected_for_alice())
+
+    def test_endpoint_is_a_single_lookup_and_hides_new_follows(self):
+        from . import suggestions
+
+        suggestions.rebuild_all(limit=3)
+        client = APIClient()
+        client.force_authenticate(self.u['alice'])
+        with self.assertNumQueries(3):
+            results = client.get('/api/suggestions/').data['results']
+        self.assertEqual([(r['username'], r['mutual_count']) for r in results], [('dave', 2), ('erin', 1), ('frank', 0)])
+
+        client.post(f"/api/users/{self.u['dave'].id}/follow/")
+        self.assertEqual([r['username'] for r in client.get('/api/suggestions/?limit=1').data['results']], ['erin'])
+
+    def test_incremental_refresh_matches_offline_job(self):
+        from . import suggestions
+
+        self.assertEqual(suggestions.refresh_user(self.u['alice'].id, limit=3), self.expected_for_alice())
+
+    @override_settings(SOCIAL_SUGGESTIONS_REFRESH_FOLLOWEES=1)
+    def test_refresh_only_counts_the_latest_followees(self):
+        from . import suggestions
+
+        # Solo carol (el último seguido de alice): dave con 1 en común, el resto populares
+        self.assertEqual(
+            suggestions.refresh_user(self.u['alice'].id, limit=3),
+            [[self.u['dave'].id, 1], [self.u['frank'].id, 0], [self.u['erin'].id, 0]],
+        )
+
+
+class RankedFeedTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        from datetime import timedelta
+        from django.utils import timezone
+
+        self.alice, self.bob, self.carol, self.dave = (
+            User.objects.create_user(name, password='pw') for name in ('alice', 'bob', 'carol', 'dave')
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.client.post(f'/api/users/{self.bob.id}/follow/')
+        self.client.post(f'/api/users/{self.carol.id}/follow/')
+
+        now = timezone.now()
+        self.fresh = self.create_post(self.carol, now - timedelta(minutes=5))
+        self.liked_author = self.create_post(self.bob, now - timedelta(hours=6))
+        self.stale = self.create_post(self.carol, now - timedelta(days=3))
+        self.discovered = self.create_post(self.dave, now - timedelta(hours=1))  # Alice no sigue a dave
+
+        for old in range(3):  # Afinidad: alice suele dar like a bob
+            Like.objects.create(user=self.alice, post=self.create_post(self.bob, now - timedelta(days=5 + old)))
+        Like.objects.create(user=self.carol, post=self.discovered)
+        Like.objects.create(user=self.bob, post=self.discovered)
+
+    def create_post(self, user, created_at):
+        post = Post.objects.create(user=user, content='post', created_at=created_at)
+        timeline.fan_out_post(post)
+        return post
+
+    def ranked_ids(self, **params):
+        response = self.client.get('/api/home-posts/', {'mode': 'ranked', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data, [post['id'] for post in response.data['results']]
+
+    def test_ranking_uses_affinity_and_follows_engagement(self):
+        _, ids = self.ranked_ids()
+        watched = {self.liked_author.id, self.discovered.id, self.fresh.id, self.stale.id}
+        self.assertEqual(
+            [post_id for post_id in ids if post_id in watched],
+            [self.liked_author.id, self.discovered.id, self.fresh.id, self.stale.id],
+        )
+        # Sin mode se mantiene la home cronológica, que no incluye a dave
+        chronological = [post['id'] for post in self.client.get('/api/home-posts/').data['results']]
+        self.assertEqual(chronological[0], self.fresh.id)
+        self.assertNotIn(self.discovered.id, chronological)
+
+    def test_numpy_and_python_scoring_agree(self):
+        from unittest import mock
+        from . import ranking
+
+        orders = []
+        for numpy in (ranking.np, None):
+            with mock.patch.object(ranking, 'np', numpy):
+                orders.append(ranking.ranked_post_ids(self.alice))
+        self.assertEqual(orders[0], orders[1])
+
+    def test_pages_keep_the_order_and_budget_degrades(self):
+        first, first_ids = self.ranked_ids(page_size=2)
+        _, all_ids = self.ranked_ids(page_size=10)
+        Like.objects.create(user=self.alice, post=self.stale)  # No cambia el orden ya calculado
+        second = self.client.get(first['next']).data
+        self.assertEqual(first_ids + [post['id'] for post in second['results']], all_ids[:4])
+
+        with override_settings(SOCIAL_RANKED_FEED_BUDGET_MS=0):
+            _, ids = self.ranked_ids()
+        self.assertNotIn(self.discovered.id, ids)  # Sin tiempo, solo el timeline
+
+
+class FollowGraphTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol, self.dave = (
+            User.objects.create_user(name, password='pw') for name in ('alice', 'bob', 'carol', 'dave')
+        )
+        self.client = APIClient()
+        for user in (self.bob, self.carol, self.dave):
+            self.client.force_authenticate(user)
+            self.client.post(f'/api/users/{self.alice.id}/follow/')
+        self.client.force_authenticate(self.alice)
+        self.client.post(f'/api/users/{self.carol.id}/follow/')
+
+    def test_followers_list_is_cursor_paginated(self):
+        response = self.client.get(f'/api/users/{self.alice.id}/followers/', {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        first = response.data['results']
+        self.assertEqual([row['username'] for row in first], ['dave', 'carol'])
+        self.assertEqual([row['is_followed'] for row in first], [False, True])
+
+        rest = self.client.get(response.data['next']).data
+        self.assertEqual([row['username'] for row in rest['results']], ['bob'])
+        self.assertIsNone(rest['next'])
+
+    def test_following_list_and_profile_counts(self):
+        response = self.client.get(f'/api/users/{self.bob.id}/following/')
+        self.assertEqual([row['id'] for row in response.data['results']], [self.alice.id])
+        self.assertEqual(self.client.get(f'/api/users/{self.carol.id}/following/').data['results'][0]['is_followed'], False)
+        self.assertEqual(self.client.get('/api/users/999/followers/').status_code, 404)
+
+        profile = self.client.get(f'/api/users/{self.alice.id}/').data
+        self.assertEqual((profile['followers_count'], profile['following_count']), (3, 1))
+
+
+class FollowGraphMigrationTests(TransactionTestCase):
+    def test_m2m_followers_are_merged_into_follow(self):
+        from django.db import connection
+        from django.db.migrations.executor import MigrationExecutor
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([('social', '0017_user_suggestions')])
+        old_apps = executor.loader.project_state([('social', '0017_user_suggestions')]).apps
+        SocialUser = old_apps.get_model('social', 'User')
+        for name in ('alice', 'bob', 'carol'):
+            User.objects.create_user(name, password='pw')
+            SocialUser.objects.create(username=name)
+        alice, bob, carol = (SocialUser.objects.get(username=name) for name in ('alice', 'bob', 'carol'))
+        alice.followers.add(bob, carol)  # bob y carol siguen a alice
+        old_apps.get_model('social', 'Follow').objects.create(
+            follower_id=User.objects.get(username='bob').id, following_id=User.objects.get(username='alice').id,
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes('social'))
+
+        auth_alice = User.objects.get(username='alice')
+        self.assertEqual(
+            sorted(Follow.objects.filter(following=auth_alice).values_list('follower__username', flat=True)),
+            ['bob', 'carol'],
+        )
+        self.assertEqual(UserStats.objects.get(user=auth_alice).follower_count, 2)
+
+
+class ClaimsAuthTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.client = APIClient()
+        tokens_ = self.client.post('/api/login/', {'username': 'alice', 'password': 'pw'}).data
+        self.access, self.refresh = tokens_['access'], tokens_['refresh']
+
+    def auth(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_requests_do_not_load_the_user_row(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.auth(self.access)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/user/')
+        self.assertEqual(response.data, {'id': self.alice.id, 'username': 'alice', 'email': 'alice@example.com'})
+        self.assertEqual(len(queries), 0)
+
+        # Las escrituras asignan el usuario de los claims como clave foránea
+        self.assertEqual(self.client.post('/api/users/%d/follow/' % self.bob.id).status_code, 201)
+        self.assertTrue(Follow.objects.filter(follower=self.alice, following=self.bob).exists())
+
+    def test_tokens_without_claims_use_the_ttl_cache(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        self.auth(RefreshToken.for_user(self.alice).access_token)
+        self.client.get('/api/user/')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/user/').status_code, 200)
+        self.assertEqual(len(queries), 0)
+
+    def test_refresh_rotates_once_and_picks_up_renames(self):
+        self.auth(self.access)
+        response = self.client.put('/api/update_user/', {'username': 'alicia'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.client.credentials()
+        rotated = self.client.post('/api/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(rotated.status_code, 200)
+        self.auth(rotated.data['access'])
+        self.assertEqual(self.client.get('/api/user/').data['username'], 'alicia')
+
+        self.client.credentials()
+        reused = self.client.post('/api/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(reused.status_code, 401)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': rotated.data['refresh']}).status_code, 200)
+
+    def test_password_change_checks_the_real_row(self):
+        self.auth(self.access)
+        response = self.client.put('/api/update_user/', {
+            'current_password': 'pw', 'new_password': 'N3w-passw0rd!', 'confirm_password': 'N3w-passw0rd!',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.alice.refresh_from_db()
+        self.assertTrue(self.alice.check_password('N3w-passw0rd!'))
+
+
+class BenchmarkCommandTests(CleanStateMixin, TransactionTestCase):
+    def test_seed_and_benchmark_every_route(self):
+        import json
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+
+        call_command('seed_data', users=40, follows=5, posts=3, likes=5, comments=2, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='seed_').count(), 40)
+        self.assertTrue(Follow.objects.exists() and Like.objects.exists() and Comment.objects.exists())
+        # Ley de potencias: la cuenta más seguida concentra muchos más seguidores que la mediana
+        counts = sorted(UserStats.objects.values_list('follower_count', flat=True), reverse=True)
+        self.assertGreater(counts[0], 3 * counts[len(counts) // 2])
+
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            call_command('benchmark_routes', requests=1, warmup=0, stack='both', output=output.name, stdout=StringIO())
+            report = json.load(output)
+        from .urls import build_urlpatterns
+        measured = {key.split(' ', 2)[2] for key in report['routes']}
+        self.assertEqual(set(report['skipped']), {'events/'})
+        self.assertGreaterEqual(len(measured), len(build_urlpatterns()) - 1)
+        for key, result in report['routes'].items():
+            self.assertLess(max(map(int, result['status'])), 500, key)
+        self.assertEqual(report['dataset']['users'], 40)  # Las escrituras medidas se deshacen
+
+        stdout = StringIO()
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as baseline:
+            json.dump(report, baseline)
+            baseline.flush()
+            call_command('benchmark_routes', requests=1, warmup=0, baseline=baseline.name, threshold=10000, stdout=stdout)
+        self.assertIn('Sin regresiones', stdout.getvalue())
+
+
+class InstrumentationTests(CleanStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        from . import instrumentation
+
+        instrumentation.registry.reset()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_server_timing_counts_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        Post.objects.create(user=self.alice, content='hola')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/users/{self.alice.id}/')
+        header = response['Server-Timing']
+        self.assertIn(f'desc="{len(queries)} queries"', header)
+        self.assertRegex(header, r'serialize;dur=\d+\.\d, total;dur=\d+\.\d')
+
+    def test_serialize_time_includes_serializer_data(self):
+        import re
+        from unittest import mock
+        from rest_framework import serializers
+
+        Post.objects.create(user=self.alice, content='hola')
+        to_representation = serializers.Serializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.05)
+            return to_representation(serializer, instance)
+
+        with mock.patch.object(serializers.Serializer, 'to_representation', slow):
+            response = self.client.get('/api/user-posts/')
+        serialize = float(re.search(r'serialize;dur=([\d.]+)', response['Server-Timing']).group(1))
+        self.assertGreaterEqual(serialize, 50)
+
+    def test_queries_inside_serialization_only_count_as_db_time(self):
+        from . import instrumentation
+
+        def slow_query(*args):
+            time.sleep(0.05)
+
+        metrics = instrumentation.RequestMetrics()
+        token = instrumentation._current.set(metrics)
+        try:
+            with instrumentation.timed_serialization():
+                instrumentation.db_execute_wrapper(slow_query, 'SELECT 1', (), False, {})
+        finally:
+            instrumentation._current.reset(token)
+        self.assertGreaterEqual(metrics.db_time, 0.05)
+        self.assertLess(metrics.serialize_time, 0.025)
+
+    @override_settings(SOCIAL_SLOW_QUERY_MS=0, SOCIAL_METRICS_TOKEN='secret')
+    def test_metrics_endpoint_and_slow_query_log(self):
+        with self.assertLogs('social.instrumentation', 'WARNING') as logs:
+            self.client.get('/api/like-status/?ids=1,2,3')
+        self.assertIn('en api/like-status/:', logs.output[0])
+        self.assertIn('IN (...)', ''.join(logs.output))
+
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('social_request_queries_count{route="api/like-status/",method="GET"} 1', body)
+        self.assertIn('social_request_duration_seconds_bucket{route="api/like-status/",method="GET",le="+Inf"} 1', body)
+        self.assertIn('social_slow_queries_total{route="api/like-status/"}', body)
+
+    def test_fingerprint_strips_literals(self):
+        from .instrumentation import fingerprint
+
+        self.assertEqual(
+            fingerprint("SELECT * FROM post WHERE id IN (1, 2, 3) AND content = 'it''s'\n  LIMIT 21"),
+            'SELECT * FROM post WHERE id IN (...) AND content = ? LIMIT ?',
+        )
+
+    @override_settings(SOCIAL_PROFILE_SAMPLE_RATE=1.0)
+    def test_sampled_requests_are_profiled(self):
+        with self.assertLogs('social.profile', 'INFO') as logs:
+            self.client.get('/api/user/')
+        self.assertIn('Perfil de GET /api/user/', logs.output[0])
+        self.assertIn('cumulative', logs.output[0])
+
+
+@override_settings(SOCIAL_DB_REPLICAS=['replica'])
+class ReplicaRoutingTests(CleanStateMixin, TransactionTestCase):
+    # La réplica es una segunda conexión SQLite a la misma base de test. Se añade después de
+    # preparar la clase: el runner solo conoce los alias de DATABASES y no la bloquea
+
+    @classmethod
+    def setUpClass(cls):
+        from django.db import connections
+
+        super().setUpClass()
+        connections.settings['replica'] = {**connections['default'].settings_dict}
+        cls.databases = {'default', 'replica'}
+
+    @classmethod
+    def tearDownClass(cls):
+        from django.db import connections
+
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        super().setUp()
+        from . import db_router
+
+        db_router.health.reset()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.post = Post.objects.create(user=self.bob, content='hola')
+
+    def client_for(self, user):
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens.add_claims(RefreshToken.for_user(user), user).access_token}')
+        return client
+
+    def queries_per_alias(self, request):
+        from django.db import connections
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            response = request()
+        self.assertLess(response.status_code, 400)
+        return len(primary), len(replica)
+
+    def test_reads_go_to_the_replica_and_writes_pin_the_writer(self):
+        alice, bob = self.client_for(self.alice), self.client_for(self.bob)
+        comments_url = f'/api/posts/{self.post.id}/comments/'
+
+        primary, replica = self.queries_per_alias(lambda: alice.get(comments_url))
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+        primary, replica = self.queries_per_alias(lambda: alice.post('/api/comments/', {'post_id': self.post.id, 'content': 'hey'}))
+        self.assertEqual(replica, 0)  # Las peticiones de escritura leen y escriben en el primario
+
+        # Alice lee su propio comentario del primario; bob sigue en la réplica
+        primary, replica = self.queries_per_alias(lambda: alice.get(comments_url))
+        self.assertEqual((primary > 0, replica), (True, 0))
+        primary, replica = self.queries_per_alias(lambda: bob.get(comments_url))
+        self.assertEqual((primary, replica > 0), (0, True))
+
+    def test_unhealthy_or_lagging_replica_falls_back_to_primary(self):
+        from unittest import mock
+        from . import db_router
+
+        client = self.client_for(self.alice)
+        with mock.patch.object(db_router, 'replica_lag', return_value=60), self.assertLogs('social.db_router', 'WARNING'):
+            primary, replica = self.queries_per_alias(lambda: client.get(f'/api/posts/{self.post.id}/comments/'))
+        self.assertEqual((primary > 0, replica), (True, 0))
+
+        db_router.health.reset()
+        with mock.patch.object(db_router, 'replica_lag', side_effect=Exception('down')), self.assertLogs('social.db_router', 'WARNING'):
+            primary, replica = self.queries_per_alias(lambda: client.get(f'/api/posts/{self.post.id}/comments/'))
+        self.assertEqual((primary > 0, replica), (True, 0))
+
+    def test_code_outside_requests_uses_the_primary(self):
+        from django.db import router
+
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+
+@override_settings(SOCIAL_SHARDS=['default', 'shard1'])
+class ShardingTests(CleanStateMixin, TransactionTestCase):
+    # shard1 es otra base SQLite en un fichero temporal, migrada al preparar la clase
+
+    @classmethod
+    def setUpClass(cls):
+        import tempfile
+        from django.core.management import call_command
+        from django.db import connections
+
+        super().setUpClass()
+        cls.shard_dir = tempfile.TemporaryDirectory()
+        name = f'{cls.shard_dir.name}/shard1.sqlite3'
+        default = connections['default'].settings_dict
+        connections.settings['shard1'] = {**default, 'NAME': name, 'TEST': {**default['TEST'], 'NAME': name}}
+        cls.databases = {'default', 'shard1'}
+        call_command('migrate', database='shard1', verbosity=0)
+        # 'default' se migró sin SOCIAL_SHARDS y conserva las FK, como una base existente
+        cls.relaxed = sharding.set_foreign_keys('default', False)
+
+    @classmethod
+    def tearDownClass(cls):
+        from django.db import connections
+
+        sharding.set_foreign_keys('default', True)
+        super().tearDownClass()
+        connections['shard1'].close()
+        del connections['shard1']
+        del connections.settings['shard1']
+        cls.shard_dir.cleanup()
+
+    def setUp(self):
+        super().setUp()
+        # Un autor en cada shard
+        users = [User.objects.create_user(f'user{i}', password='pw') for i in range(8)]
+        placement = {user: sharding.hashed_shard(user.id, ['default', 'shard1']) for user in users}
+        self.near = next(user for user in users if placement[user] == 'default')
+        self.far = next(user for user in users if placement[user] == 'shard1')
+        self.viewer = next(user for user in users if user not in (self.near, self.far))
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        for author in (self.near, self.far):
+            self.client.post(f'/api/users/{author.id}/follow/')
+
+    def create_posts(self):
+        client = APIClient()
+        ids = []
+        for i in range(3):
+            for author in (self.far, self.near):
+                client.force_authenticate(author)
+                ids.append(client.post('/api/create-post/', {'content': f'post {i}'}).json()['id'])
+        return ids
+
+    def test_cross_shard_foreign_keys_only_exist_without_sharding(self):
+        self.assertEqual(self.relaxed, len(sharding.CROSS_SHARD_FOREIGN_KEYS))
+        self.assertEqual(sharding.foreign_keys('default'), [])
+        self.assertEqual(sharding.foreign_keys('shard1'), [])
+
+    def test_jump_hash_only_moves_keys_to_the_new_bucket(self):
+        from .sharding import jump_hash
+
+        moved = [key for key in range(1000) if jump_hash(key, 3) != jump_hash(key, 2)]
+        self.assertTrue(all(jump_hash(key, 3) == 2 for key in moved))
+        self.assertAlmostEqual(len(moved) / 1000, 1 / 3, delta=0.05)
+
+    def test_posts_live_in_the_author_shard_and_the_home_merges_them(self):
+        ids = self.create_posts()
+        self.assertEqual(len(set(ids)), 6)  # Ids globales
+        self.assertEqual(Post.objects.using('shard1').filter(user=self.far).count(), 3)
+        self.assertFalse(Post.objects.using('default').filter(user=self.far).exists())
+
+        expected = list(reversed(ids))
+        for use_async in (False, True):
+            with override_settings(ROOT_URLCONF=api_urlconf(use_async)):
+                first = self.client.get('/api/home-posts/?page_size=4').json()
+                second = self.client.get(first['next']).json()
+                profile = self.client.get(f'/api/users/{self.far.id}/').json()
+            self.assertEqual([post['id'] for post in first['results'] + second['results']], expected)
+            self.assertEqual([post['content'] for post in profile['posts']], ['post 2', 'post 1', 'post 0'])
+
+    def test_likes_and_comments_follow_their_post(self):
+        post_id = self.create_posts()[0]  # De self.far
+        self.assertEqual(self.client.post('/api/like/', {'post_id': post_id}).json()['likesCount'], 1)
+        comment = self.client.post('/api/comments/', {'post_id': post_id, 'content': 'hola'})
+        self.assertEqual(comment.status_code, 201, comment.content)
+        self.assertTrue(Like.objects.using('shard1').filter(user=self.viewer, post_id=post_id).exists())
+        self.assertTrue(Comment.objects.using('shard1').filter(id=comment.json()['id']).exists())
+
+        status = self.client.get(f'/api/like-status/?ids={post_id}').json()['likes']
+        self.assertEqual(status[str(post_id)], {'liked': True, 'likesCount': 1})
+        comments = self.client.get(f'/api/posts/{post_id}/comments/').json()
+        self.assertEqual([c['content'] for c in comments['comments']], ['hola'])
+        self.assertEqual(self.client.delete(f'/api/comments/{comment.json()["id"]}/').status_code, 204)
+        self.assertFalse(Comment.objects.using('shard1').exists())
+
+    def test_reshard_moves_users_to_the_new_shard(self):
+        from django.core.management import call_command
+        from .models import PostLocation, UserShard
+
+        sharding.set_foreign_keys('default', True)
+        with override_settings(SOCIAL_SHARDS=['default']):
+            post_id = self.create_posts()[0]
+            self.client.post('/api/like/', {'post_id': post_id})
+            self.client.post('/api/comments/', {'post_id': post_id, 'content': 'hola'})
+            self.assertEqual(Post.objects.using('default').count(), 6)
+            out = io.StringIO()
+            call_command('reshard', shards='default,shard1', grace=0, stdout=out)
+            self.assertIn('6 claves foráneas quitadas', out.getvalue())
+
+            self.assertEqual(Post.objects.using('shard1').filter(user=self.far).count(), 3)
+            self.assertEqual(Post.objects.using('default').count(), 3)
+            self.assertEqual(Like.objects.using('shard1').count(), 1)
+            self.assertEqual(Comment.objects.using('shard1').count(), 1)
+            self.assertEqual(PostLocation.objects.count(), 6)
+            # UserShard manda sobre el hash hasta desplegar la nueva lista
+            self.assertEqual(UserShard.objects.get(user=self.far).shard, 'shard1')
+            self.assertEqual(self.client.get(f'/api/like-status/{post_id}/').json(), {'liked': True})
+
+        self.assertEqual(len(self.client.get('/api/home-posts/').json()['results']), 6)
+        call_command('reshard', prune=True, stdout=io.StringIO())
+        self.assertFalse(UserShard.objects.exists())
+        self.assertEqual(len(self.client.get(f'/api/posts/{post_id}/comments/').json()['comments']), 1)
+
+
+class ConditionalGetTests(CleanStateMixin, TransactionTestCase):
+    # TransactionTestCase: las versiones se suben en on_commit
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.bob_client = APIClient()
+        self.bob_client.force_authenticate(self.bob)
+        self.client.post(f'/api/users/{self.bob.id}/follow/')
+        self.post_id = self.bob_client.post('/api/create-post/', {'content': 'hola'}).data['id']
+
+    def revalidate(self, url, use_async=False, **headers):
+        with override_settings(ROOT_URLCONF=api_urlconf(use_async)):
+            return self.client.get(url, headers=headers)
+
+    def test_unchanged_resources_answer_304(self):
+        urls = [f'/api/users/{self.bob.id}/', f'/api/posts/{self.post_id}/comments/', '/api/home-posts/?page_size=5']
+        for use_async in (False, True):
+            for url in urls:
+                with self.subTest(url=url, use_async=use_async):
+                    response = self.revalidate(url, use_async)
+                    self.assertEqual(response['Cache-Control'], 'private, no-cache')
+                    self.assertIn('Authorization', response['Vary'])
+                    with self.assertNumQueries(0 if 'home' not in url else 1):
+                        cached = self.revalidate(url, use_async, if_none_match=response['ETag'])
+                    self.assertEqual(cached.status_code, 304)
+                    self.assertEqual(cached['ETag'], response['ETag'])
+                    # Solo ETag: If-Modified-Since (resolución de segundos) no da 304
+                    self.assertNotIn('Last-Modified', response)
+                    since = self.revalidate(url, use_async, if_modified_since='Fri, 01 Jan 2100 00:00:00 GMT')
+                    self.assertEqual(since.status_code, 200)
+
+    def test_writes_and_viewer_change_the_etag(self):
+        profile, comments, home = f'/api/users/{self.bob.id}/', f'/api/posts/{self.post_id}/comments/', '/api/home-posts/'
+        etags = {url: self.revalidate(url)['ETag'] for url in (profile, comments, home)}
+
+        self.bob_client.post('/api/comments/', {'post_id': self.post_id, 'content': 'primero'})
+        for url in (profile, comments, home):
+            response = self.revalidate(url, if_none_match=etags[url])
+            self.assertEqual(response.status_code, 200, url)
+            etags[url] = response['ETag']
+
+        # Un segundo comentario en el mismo segundo también cambia el ETag
+        self.bob_client.post('/api/comments/', {'post_id': self.post_id, 'content': 'segundo'})
+        response = self.revalidate(comments, if_none_match=etags[comments])
+        self.assertEqual([c['content'] for c in response.data['comments']], ['primero', 'segundo'])
+        etags[comments] = response['ETag']
+
+        # Un post nuevo cambia la home; otro usuario no comparte los validadores de alice
+        self.bob_client.post('/api/create-post/', {'content': 'otro'})
+        self.assertEqual(len(self.revalidate(home, if_none_match=etags[home]).data['results']), 2)
+        self.client.force_authenticate(self.bob)
+        self.assertEqual(self.revalidate(comments, if_none_match=etags[comments]).status_code, 200)
@@ -0,0 +1,341 @@
+# Home timeline materializado (fan-out on write)
+#
+# Cada post se copia al timeline de los seguidores de su autor cuando se crea, de modo
+# que leer la home es un único range scan sobre el timeline del usuario. Los autores con
+# muchísimos seguidores no se replican: sus posts se mezclan al leer (fan-out on read).
+
+import heapq
+import threading
+from bisect import insort
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils.module_loading import import_string
+
+from . import sharding
+from .models import Follow, Post, TimelineEntry, UserStats
+
+FANOUT_BATCH_SIZE = 1000
+HIGH_FOLLOWER_CACHE_KEY = 'timeline:high-follower-ids'
+
+
+def fanout_limit():
+    return getattr(settings, 'SOCIAL_TIMELINE_FANOUT_LIMIT', 5000)
+
+
+def max_entries():
+    return getattr(settings, 'SOCIAL_TIMELINE_MAX_ENTRIES', 1000)
+
+
+def backfill_size():
+    return getattr(settings, 'SOCIAL_TIMELINE_BACKFILL', 50)
+
+
+def trim_slack():
+    return getattr(settings, 'SOCIAL_TIMELINE_TRIM_SLACK', 200)
+
+
+class BaseTimelineStore:
+    def add_post(self, post, owner_ids):
+        raise NotImplementedError
+
+    def add_posts(self, owner_id, posts):
+        raise NotImplementedError
+
+    def remove_post(self, post_id):
+        raise NotImplementedError
+
+    def remove_author(self, owner_id, author_id):
+        raise NotImplementedError
+
+    def remove_authors(self, owner_id, author_ids):
+        for author_id in author_ids:
+            self.remove_author(owner_id, author_id)
+
+    def clear(self, owner_id):
+        raise NotImplementedError
+
+    def trim_oversized(self):
+        # Recorta los timelines que pasan de max_entries() + trim_slack(); devuelve cuántos
+        return 0
+
+    def page(self, owner_id, position, limit):
+        # [(created_at, post_id, author_id)] del timeline, del más reciente al más antiguo,
+        # empezando después de position (created_at, post_id) si la hay
+        raise NotImplementedError
+
+
+class DatabaseTimelineStore(BaseTimelineStore):
+    def add_post(self, post, owner_ids):
+        entries = [
+            TimelineEntry(owner_id=owner_id, post_id=post.id, author_id=post.user_id, created_at=post.created_at)
+            for owner_id in owner_ids
+        ]
+        # Sin recortar: el fan-out de cada post tiene que seguir siendo un INSERT por lote. Los
+        # timelines crecen por encima de max_entries() hasta que rebuild_timelines --trim los
+        # recorta, y la lectura solo pide una página
+        TimelineEntry.objects.bulk_create(entries, batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True)
+
+    def add_posts(self, owner_id, posts):
+        entries = [
+            TimelineEntry(owner_id=owner_id, post_id=post.id, author_id=post.user_id, created_at=post.created_at)
+            for post in posts
+        ]
+        TimelineEntry.objects.bulk_create(entries, batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True)
+        self.trim([owner_id])  # Un solo dueño (follow, rebuild): barato
+
+    def trim_oversized(self):
+        oversized = list(
+            TimelineEntry.objects.values('owner_id').annotate(n=Count('*'))
+            .filter(n__gt=max_entries() + trim_slack()).values_list('owner_id', flat=True)
+        )
+        self.trim(oversized)
+        return len(oversized)
+
+    def trim(self, owner_ids):
+        # Cada timeline conserva sus max_entries() entradas más recientes, como en
+        # LocMemTimelineStore: una query busca la primera sobrante de cada dueño y otra borra
+        # desde ella hacia atrás
+        for start in range(0, len(owner_ids), FANOUT_BATCH_SIZE):
+            rank = Window(RowNumber(), partition_by=F('owner_id'), order_by=(F('created_at').desc(), F('post_id').desc()))
+            cutoffs = (
+                TimelineEntry.objects.filter(owner_id__in=owner_ids[start:start + FANOUT_BATCH_SIZE])
+                .annotate(rank=rank)
+                .filter(rank=max_entries() + 1)
+                .values_list('owner_id', 'created_at', 'post_id')
+            )
+            condition = Q()
+            for owner_id, created_at, post_id in cutoffs:
+                condition |= Q(owner_id=owner_id) & (Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lte=post_id))
+            if condition:
+                TimelineEntry.objects.filter(condition).delete()
+
+    def remove_post(self, post_id):
+        TimelineEntry.objects.filter(post_id=post_id).delete()
+
+    def remove_author(self, owner_id, author_id):
+        TimelineEntry.objects.filter(owner_id=owner_id, author_id=author_id).delete()
+
+    def remove_authors(self, owner_id, author_ids):
+        TimelineEntry.objects.filter(owner_id=owner_id, author_id__in=author_ids).delete()
+
+    def clear(self, owner_id):
+        TimelineEntry.objects.filter(owner_id=owner_id).delete()
+
+    def page(self, owner_id, position, limit):
+        # Range scan sobre el índice (owner, -created_at, -post)
+        entries = TimelineEntry.objects.filter(owner_id=owner_id)
+        if position is not None:
+            entries = entries.filter(older_than(position, 'post_id'))
+        return list(entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id', 'author_id')[:limit])
+
+
+class LocMemTimelineStore(BaseTimelineStore):
+    # Timeline en memoria del proceso, útil para tests y para un solo nodo
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timelines = {}  # owner_id -> lista ordenada de (created_at, post_id, author_id)
+
+    def _insert(self, owner_id, post):
+        timeline = self._timelines.setdefault(owner_id, [])
+        item = (post.created_at, post.id, post.user_id)
+        if item not in timeline:
+            insort(timeline, item)
+            if len(timeline) > max_entries():
+                del timeline[0]
+
+    def add_post(self, post, owner_ids):
+        with self._lock:
+            for owner_id in owner_ids:
+                self._insert(owner_id, post)
+
+    def add_posts(self, owner_id, posts):
+        with self._lock:
+            for post in posts:
+                self._insert(owner_id, post)
+
+    def remove_post(self, post_id):
+        with self._lock:
+            for owner_id, timeline in self._timelines.items():
+                self._timelines[owner_id] = [item for item in timeline if item[1] != post_id]
+
+    def remove_author(self, owner_id, author_id):
+        with self._lock:
+            timeline = self._timelines.get(owner_id, [])
+            self._timelines[owner_id] = [item for item in timeline if item[2] != author_id]
+
+    def clear(self, owner_id):
+        with self._lock:
+            self._timelines.pop(owner_id, None)
+
+    def page(self, owner_id, position, limit):
+        with self._lock:
+            items = reversed(self._timelines.get(owner_id, []))
+            if position is not None:
+                items = (item for item in items if item[:2] < tuple(position))
+            return list(islice(items, limit))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = getattr(settings, 'SOCIAL_TIMELINE_BACKEND', 'social.timeline.DatabaseTimelineStore')
+            _store = import_string(backend)()
+        return _store
+
+
+def reset_store():
+    # Para tests que cambian SOCIAL_TIMELINE_BACKEND
+    global _store
+    with _store_lock:
+        _store = None
+
+
+def high_follower_ids():
+    # Autores que se mezclan al leer; se recalcula cada pocos minutos. Un autor que acaba de
+    # cruzar el límite puede seguir aquí un rato: sus posts salen del timeline y de la mezcla,
+    # y home_entries quita los repetidos
+    ids = cache.get(HIGH_FOLLOWER_CACHE_KEY)
+    if ids is None:
+        ids = set(UserStats.objects.filter(follower_count__gt=fanout_limit()).values_list('user_id', flat=True))
+        cache.set(HIGH_FOLLOWER_CACHE_KEY, ids, 300)
+    return ids
+
+
+def is_high_follower(user_id):
+    # Al escribir se mira el contador actual, no el conjunto cacheado: un post que no se
+    # replica tiene que poder leerse en fan-out on read
+    count = UserStats.objects.filter(user_id=user_id).values_list('follower_count', flat=True).first() or 0
+    return count > fanout_limit()
+
+
+def on_followers_lost(author_id, follower_count):
+    # Al perder seguidores: si el autor acaba de bajar al límite deja de mezclarse al leer, y
+    # los posts que escribió mientras estaba por encima se copian a los timelines de sus
+    # seguidores. Se hace al escribir (en la transacción del unfollow), nunca en una lectura
+    if follower_count != fanout_limit():
+        return
+    cache.delete(HIGH_FOLLOWER_CACHE_KEY)
+    follower_ids = list(Follow.objects.filter(following_id=author_id).values_list('follower_id', flat=True))
+    if not follower_ids:
+        return
+    store = get_store()
+    for post in sharding.posts_of(author_id).order_by('-created_at', '-id')[:backfill_size()]:
+        store.add_post(post, follower_ids)
+
+
+def fan_out_post(post):
+    if is_high_follower(post.user_id):
+        # Autor con demasiados seguidores: sus posts se leen en fan-out on read
+        get_store().add_post(post, [post.user_id])
+        return
+    follower_ids = Follow.objects.filter(following_id=post.user_id).values_list('follower_id', flat=True)
+    get_store().add_post(post, [post.user_id, *follower_ids])
+
+
+def remove_post(post_id):
+    get_store().remove_post(post_id)
+
+
+def trim_timelines():
+    return get_store().trim_oversized()
+
+
+def on_follow(follower_id, following_id):
+    # Trae los posts recientes del nuevo seguido al timeline del seguidor
+    if following_id in high_follower_ids():
+        return
+    posts = sharding.posts_of(following_id).order_by('-created_at', '-id')[:backfill_size()]
+    get_store().add_posts(follower_id, posts)
+
+
+def on_unfollow(follower_id, following_id):
+    get_store().remove_author(follower_id, following_id)
+
+
+def on_follow_many(follower_id, following_ids):
+    # Follows en lote: una sola query con los posts más recientes de todos los nuevos seguidos
+    following_ids = set(following_ids) - high_follower_ids()
+    if following_ids:
+        posts = sharding.for_users(Post.objects.all(), following_ids).order_by('-created_at', '-id')[:max_entries()]
+        get_store().add_posts(follower_id, posts)
+
+
+def on_unfollow_many(follower_id, following_ids):
+    get_store().remove_authors(follower_id, following_ids)
+
+
+def rebuild(owner_id):
+    store = get_store()
+    store.clear(owner_id)
+    following_ids = Follow.objects.filter(follower_id=owner_id).values_list('following_id', flat=True)
+    if sharding.enabled():
+        # Cada shard recibe solo los autores que guarda
+        posts = sharding.for_users(Post.objects.all(), [owner_id, *following_ids])
+    else:
+        posts = Post.objects.filter(Q(user_id=owner_id) | Q(user_id__in=following_ids))
+    posts = posts.exclude(user_id__in=high_follower_ids() - {owner_id}).order_by('-created_at', '-id')[:max_entries()]
+    store.add_posts(owner_id, posts)
+
+
+def older_than(position, id_field='id'):
+    # Filas después de position (created_at, id) en orden descendente
+    created_at, object_id = position
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, **{f'{id_field}__lt': object_id})
+
+
+def pulled_authors(user):
+    # Autores seguidos con fan-out on read
+    pulled = high_follower_ids()
+    if not pulled:
+        return []
+    return list(Follow.objects.filter(follower_id=user.id, following_id__in=pulled).values_list('following_id', flat=True))
+
+
+def home_entries(user, position=None, limit=None):
+    # [(created_at, post_id, author_id)] de la home a partir de position (created_at, id): el
+    # cursor y el límite se aplican al timeline materializado y a los autores con fan-out on
+    # read, y se mezclan las dos páginas
+    limit = limit or max_entries()
+    pulled_ids = pulled_authors(user)
+    entries = get_store().page(user.id, position, limit)
+    if pulled_ids:
+        pulled = sharding.for_users(Post.objects.all(), pulled_ids)
+        if position is not None:
+            pulled = pulled.filter(older_than(position))
+        pulled = pulled.order_by('-created_at', '-id').values_list('created_at', 'id', 'user_id')[:limit]
+        merged = heapq.merge(entries, list(pulled), reverse=True)
+        entries = list(islice({entry[1]: entry for entry in merged}.values(), limit))
+    return entries
+
+
+def home_posts(entries):
+    # Los posts de esas entradas de home_entries, en el orden de la home
+    if sharding.enabled():
+        return sharded_home_posts(entries)
+    return Post.objects.filter(id__in=[post_id for _, post_id, _ in entries]).order_by('-created_at', '-id')
+
+
+def home_feed(user, position=None, limit=None):
+    return home_posts(home_entries(user, position, limit))
+
+
+def sharded_home_posts(entries):
+    # El timeline está en 'default' y los posts en los shards de sus autores: cada shard recibe
+    # los ids de la página que guarda y la paginación mezcla los flujos ordenados
+    placement = sharding.shards_for_users({author_id for _, _, author_id in entries})
+    post_ids = defaultdict(list)
+    for _, post_id, author_id in entries:
+        post_ids[placement[author_id]].append(post_id)
+    parts = {alias: Post.objects.using(alias).filter(id__in=ids) for alias, ids in post_ids.items()}
+    return sharding.ShardedQuerySet(parts).order_by('-created_at', '-id')
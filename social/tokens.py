@@ -0,0 +1,162 @@
+# Autenticación JWT sin leer el usuario de la base de datos en cada petición.
+#
+# Los tokens que emite login/ llevan username y email como claims. ClaimsJWTAuthentication
+# construye con ellos un ClaimsUser (proxy de User que no se puede guardar), suficiente para
+# las vistas, que solo usan id, username y email. Los tokens sin esos claims (emitidos antes
+# del cambio) y token/refresh/ leen la fila completa a través de una caché TTL pequeña en
+# memoria del proceso.
+#
+# Con ROTATE_REFRESH_TOKENS y BLACKLIST_AFTER_ROTATION el refresh usado se apunta en la caché
+# de Django hasta que caduca, en lugar de en las tablas de token_blacklist: comprobarlo es una
+# lectura de caché, no una query, y cache.add hace que dos refrescos simultáneos del mismo
+# token no puedan rotarlo los dos.
+#
+# Contrapartida: desactivar a un usuario o cambiarle el nombre llega a sus access tokens al
+# renovarlos (ACCESS_TOKEN_LIFETIME), no al instante.
+
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import ClaimsUser
+from .response_cache import get_cache
+
+User = get_user_model()
+
+CLAIM_FIELDS = ('username', 'email')
+
+
+def user_cache_ttl():
+    return getattr(settings, 'SOCIAL_AUTH_USER_CACHE_TTL', 60)
+
+
+def user_cache_size():
+    return getattr(settings, 'SOCIAL_AUTH_USER_CACHE_SIZE', 10000)
+
+
+class UserCache:
+    # Filas de usuario por id con caducidad. Es por proceso para no añadir un salto de red:
+    # invalidate() solo limpia el proceso actual, el resto ve el cambio al caducar la entrada
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # user_id -> (caduca, User o None)
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        user = User.objects.filter(id=user_id).first()
+        with self._lock:
+            if len(self._entries) >= user_cache_size():
+                self._entries = {key: value for key, value in self._entries.items() if value[0] > now}
+                if len(self._entries) >= user_cache_size():
+                    self._entries.clear()
+            self._entries[user_id] = (now + user_cache_ttl(), user)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_users = UserCache()
+
+
+def cached_user(user_id):
+    return _users.get(user_id)
+
+
+def invalidate_user(user_id):
+    _users.invalidate(user_id)
+
+
+def reset_user_cache():
+    # Para los tests
+    _users.clear()
+
+
+def add_claims(token, user):
+    for field in CLAIM_FIELDS:
+        token[field] = getattr(user, field)
+    return token
+
+
+def claims_user(token):
+    return ClaimsUser(
+        id=User._meta.pk.to_python(token[api_settings.USER_ID_CLAIM]),  # simplejwt lo guarda como texto
+        username=token['username'],
+        email=token['email'],
+        is_active=True,  # Solo se emiten tokens a usuarios activos
+    )
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Token contained no recognizable user identification')
+        if all(field in validated_token for field in CLAIM_FIELDS):
+            return claims_user(validated_token)
+
+        # Token antiguo sin claims: fila completa, desde la caché TTL
+        user = cached_user(User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM]))
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
+
+
+def blacklist_key(token):
+    return f'social:jwt:blacklist:{token[api_settings.JTI_CLAIM]}'
+
+
+def blacklist_once(token):
+    # Apunta el token hasta su caducidad; False si ya estaba (reutilizado o rotado a la vez)
+    ttl = max(int(token['exp'] - time.time()), 1)
+    return get_cache().add(blacklist_key(token), True, ttl)
+
+
+def is_blacklisted(token):
+    return get_cache().get(blacklist_key(token)) is not None
+
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_claims(super().get_token(user), user)
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_blacklisted(refresh):
+            raise TokenError('Token is blacklisted')
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        user = cached_user(User._meta.pk.to_python(user_id)) if user_id else None
+        if not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        add_claims(refresh, user)  # Recoge cambios de nombre o email hechos desde el login
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION and not blacklist_once(refresh):
+                raise TokenError('Token is blacklisted')
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
@@ -1,35 +1,61 @@
 # auth_app/urls.py
 
+from django.conf import settings
 from django.urls import path
-from .views import RegisterView, update_user, user_details,UserPostsView, UserProfileView, CheckFollowStatusView,CommentCreateView, CommentDetailView ,CommentListView,CurrentUserView ,UserSearchView ,CreatePostView, AllPostsView, LikePostView, UnlikePostView, FollowUserView, UnfollowUserView, DeletePostView, PostLikesCountView
+from . import async_views
+from .views import RegisterView, update_user, user_details,UserPostsView, UserProfileView, CheckFollowStatusView,CommentCreateView, CommentDetailView ,CommentListView,CurrentUserView ,UserSearchView ,CreatePostView, AllPostsView, LikePostView, UnlikePostView, FollowUserView, UnfollowUserView, DeletePostView, PostLikesCountView, BatchLikeStatusView, BatchFollowStatusView, ContentSearchView, NotificationListView, UnreadNotificationCountView, MarkNotificationsReadView, BulkLikeView, BulkFollowView, BulkCommentView, SuggestionsView, FollowersListView, FollowingListView, EventTicketView
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
 
-urlpatterns = [
-    path('register/', RegisterView.as_view(), name='register'),
-    path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('update_user/', update_user, name='update_user'),
-    path('user_details/', user_details, name='user_details'),
-    path('create-post/', CreatePostView.as_view(), name='posts'),
-    path('user-posts/', UserPostsView.as_view(), name='user-posts'),
-    path('all-posts/', AllPostsView.as_view(), name='all-posts'),
-    path('like/', LikePostView.as_view(), name='like'),
-    path('unlike/', UnlikePostView.as_view(), name='unlike'),
-    path('comments/', CommentCreateView.as_view(), name='comment'),
-    path('comments/<int:comment_id>/', CommentDetailView.as_view(), name='comment-detail'),
-    path('posts/<int:post_id>/comments/', CommentListView.as_view(), name='comment'),
-    path('users/<int:user_id>/follow/', FollowUserView.as_view(), name='follow-user'),
-    path('users/<int:user_id>/unfollow/', UnfollowUserView.as_view(), name='unfollow-user'),
-    path('home-posts/', AllPostsView.as_view(), name='home-posts'),
-    path('search-users/', UserSearchView.as_view(), name='search-users'),
-    path('user/', CurrentUserView.as_view(), name='current-user'),
-    path('posts/<int:post_id>/delete/', DeletePostView.as_view(), name='delete-post'),
-    path('like-status/<int:post_id>/', LikePostView.as_view(), name='like-status'),
-    path('post/<int:post_id>/likes-count/', PostLikesCountView.as_view(), name='likes-count'),
-    path('follow-status/<int:user_id>/', CheckFollowStatusView.as_view(), name='follow-status'),
-    path('users/<int:user_id>/', UserProfileView.as_view(), name='user-profile'),
-]
+def read_view(sync_view, async_view, use_async=None):
+    # Con SOCIAL_ASYNC_VIEWS las lecturas más frecuentes usan las vistas async (pensadas para ASGI)
+    if use_async is None:
+        use_async = getattr(settings, 'SOCIAL_ASYNC_VIEWS', False)
+    return (async_view if use_async else sync_view).as_view()
 
+
+def build_urlpatterns(use_async=None):
+    return [
+        path('register/', RegisterView.as_view(), name='register'),
+        path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+        path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+        path('update_user/', update_user, name='update_user'),
+        path('user_details/', user_details, name='user_details'),
+        path('create-post/', CreatePostView.as_view(), name='posts'),
+        path('user-posts/', UserPostsView.as_view(), name='user-posts'),
+        path('all-posts/', AllPostsView.as_view(), name='all-posts'),
+        path('like/', LikePostView.as_view(), name='like'),
+        path('unlike/', UnlikePostView.as_view(), name='unlike'),
+        path('likes/bulk/', BulkLikeView.as_view(), name='bulk-likes'),
+        path('follows/bulk/', BulkFollowView.as_view(), name='bulk-follows'),
+        path('comments/bulk/', BulkCommentView.as_view(), name='bulk-comments'),
+        path('comments/', CommentCreateView.as_view(), name='comment'),
+        path('comments/<int:comment_id>/', CommentDetailView.as_view(), name='comment-detail'),
+        path('posts/<int:post_id>/comments/', read_view(CommentListView, async_views.AsyncCommentListView, use_async), name='comment'),
+        path('users/<int:user_id>/follow/', FollowUserView.as_view(), name='follow-user'),
+        path('users/<int:user_id>/unfollow/', UnfollowUserView.as_view(), name='unfollow-user'),
+        path('users/<int:user_id>/followers/', FollowersListView.as_view(), name='user-followers'),
+        path('users/<int:user_id>/following/', FollowingListView.as_view(), name='user-following'),
+        path('home-posts/', read_view(AllPostsView, async_views.AsyncHomePostsView, use_async), name='home-posts'),
+        path('search-users/', read_view(UserSearchView, async_views.AsyncUserSearchView, use_async), name='search-users'),
+        path('suggestions/', SuggestionsView.as_view(), name='suggestions'),
+        path('search/', read_view(ContentSearchView, async_views.AsyncContentSearchView, use_async), name='search'),
+        path('user/', CurrentUserView.as_view(), name='current-user'),
+        path('posts/<int:post_id>/delete/', DeletePostView.as_view(), name='delete-post'),
+        path('like-status/<int:post_id>/', read_view(LikePostView, async_views.AsyncLikeStatusView, use_async), name='like-status'),
+        path('post/<int:post_id>/likes-count/', PostLikesCountView.as_view(), name='likes-count'),
+        path('follow-status/<int:user_id>/', read_view(CheckFollowStatusView, async_views.AsyncFollowStatusView, use_async), name='follow-status'),
+        path('like-status/', read_view(BatchLikeStatusView, async_views.AsyncBatchLikeStatusView, use_async), name='batch-like-status'),
+        path('follow-status/', read_view(BatchFollowStatusView, async_views.AsyncBatchFollowStatusView, use_async), name='batch-follow-status'),
+        path('events/', async_views.event_stream, name='events'),
+        path('events/ticket/', EventTicketView.as_view(), name='event-ticket'),
+        path('notifications/', NotificationListView.as_view(), name='notifications'),
+        path('notifications/unread-count/', UnreadNotificationCountView.as_view(), name='notifications-unread-count'),
+        path('notifications/read/', MarkNotificationsReadView.as_view(), name='notifications-read'),
+        path('users/<int:user_id>/', read_view(UserProfileView, async_views.AsyncUserProfileView, use_async), name='user-profile'),
+    ]
+
+
+urlpatterns = build_urlpatterns()
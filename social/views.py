@@ -9,18 +9,31 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import generics, permissions
 from .models import Post
-from .serializers import PostSerializer
+from .serializers import PostSerializer, CompactPostSerializer, requested_fields
 from rest_framework.views import APIView
 from .models import Like, Follow
 from .serializers import LikeSerializer
-from .models import Comment
+from .models import Comment, ContentToken, Notification
 from .serializers import CommentSerializer
-from .serializers import FollowSerializer
+from .serializers import FollowerSerializer, FollowingSerializer, NotificationSerializer
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
-import logging
+from django.conf import settings
+from django.utils.functional import cached_property
+from . import counters, events, images, instrumentation, notifications, ranking, response_cache, search, services, sharding, suggestions, timeline, tokens
+from .pagination import CommentPagination, FollowPagination, NotificationPagination, PostPagination, RankedPagination, SearchPagination
+from .prefetch import followed_ids, liked_post_ids, post_page_context, prefetch_comments, prefetch_post_page
 User = get_user_model()
 
+class EventTicketView(APIView):
+    # Ticket para abrir events/ desde EventSource (ver events.issue_ticket)
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        ticket = events.issue_ticket(request.user.id)
+        return Response({'ticket': ticket, 'expires_in': events.ticket_ttl()}, status=status.HTTP_200_OK)
+
+
 class CurrentUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -38,7 +51,7 @@ class RegisterView(APIView):
         serializer = UserSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             serializer.save()
-            return Response(serializer.data, status=201)
+            return Response(instrumentation.serialized(serializer), status=201)
         return Response(serializer.errors, status=400)
 
 class LoginView(views.APIView):
@@ -48,7 +61,7 @@ class LoginView(views.APIView):
         user = authenticate(username=username, password=password)
         
         if user is not None:
-            refresh = RefreshToken.for_user(user)
+            refresh = tokens.add_claims(RefreshToken.for_user(user), user)
             access_token = str(refresh.access_token)
             refresh_token = str(refresh)
             return Response({
@@ -61,12 +74,21 @@ class LoginView(views.APIView):
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_user(request):
-    serializer = UserSerializer(request.user, data=request.data, partial=True, context={'request': request})
+    instance = User.objects.get(id=request.user.id)  # request.user puede ser un ClaimsUser (ver tokens.py)
+    serializer = UserSerializer(instance, data=request.data, partial=True, context={'request': request})
     if serializer.is_valid():
+        previous_username = instance.username
         user = serializer.save()
+        tokens.invalidate_user(user.id)
+        response_cache.bump_user(user.id)
+        if user.username != previous_username:
+            # El nombre aparece en los comentarios embebidos en los posts de otros usuarios
+            # (cada comentario está en el shard de su post, así que el join con Post es local)
+            commented = sharding.everywhere(Comment.objects.filter(user=user).values_list('post_id', 'post__user_id').distinct())
+            for post_id, author_id in commented:
+                response_cache.post_changed(post_id, author_id)
         return Response({"detail": "Detalles del usuario actualizados con éxito."}, status=status.HTTP_200_OK)
     else:
-        print(serializer.errors)  # Añade esta línea para depurar errores
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -75,7 +97,44 @@ def update_user(request):
 def user_details(request):
     user = request.user
     serializer = UserSerializer(user)
-    return Response(serializer.data)
+    return Response(instrumentation.serialized(serializer))
+
+
+class FollowedIdsMixin:
+    # Resuelve is_followed de toda la página con una sola query en vez de una por usuario
+
+    def get_followed_candidates(self, page):
+        return {obj.id for obj in page}
+
+    def get_serializer(self, *args, **kwargs):
+        if args and kwargs.get('many'):
+            context = self.get_serializer_context()
+            context['followed_ids'] = followed_ids(self.request.user, self.get_followed_candidates(args[0]))
+            kwargs['context'] = context
+        return super().get_serializer(*args, **kwargs)
+
+
+class PostListMixin:
+    # Listados de posts: representación completa o compacta (?fields=compact) y campos dispersos
+
+    def get_posts(self):
+        raise NotImplementedError
+
+    def get_queryset(self):
+        return prefetch_post_page(self.request, self.get_posts())
+
+    def get_serializer_class(self):
+        compact, _ = requested_fields(self.request)
+        return CompactPostSerializer if compact else PostSerializer
+
+    viewer_fields = True  # False si la respuesta se cachea y los campos del usuario se añaden después
+
+    def get_serializer(self, *args, **kwargs):
+        if args and kwargs.get('many'):
+            context = self.get_serializer_context()
+            context.update(post_page_context(self.request, args[0], viewer_fields=self.viewer_fields))
+            kwargs['context'] = context
+        return super().get_serializer(*args, **kwargs)
 
 
 class CreatePostView(APIView):
@@ -86,62 +145,131 @@ class CreatePostView(APIView):
         data['user'] = request.user.id
         serializer = PostSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=201)
+            with sharding.on_user(request.user.id):  # objects.create no pasa la instancia al router
+                post = serializer.save()
+            counters.bump_user(request.user.id, post_count=1)
+            response_cache.bump_user(request.user.id)
+            timeline.fan_out_post(post)  # Copia el post al timeline de los seguidores
+            images.schedule(post)  # Variantes y placeholder de la imagen, fuera de la petición
+            events.post_created(post)  # Aviso en tiempo real a los seguidores conectados
+            return Response(instrumentation.serialized(serializer), status=201)
         return Response(serializer.errors, status=400)
     
-class UserPostsView(generics.ListAPIView):
+class UserPostsView(instrumentation.TimedListMixin, PostListMixin, generics.ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PostPagination
 
-    def get_queryset(self):
+    viewer_fields = False
+
+    def get_posts(self):
         user = self.request.user
-        return Post.objects.filter(user=user)
+        return sharding.posts_of(user.id)
+
+    def list(self, request, *args, **kwargs):
+        # Se cachea por versión del usuario; is_followed/viewer_has_liked se calculan aparte
+        def build():
+            return super(UserPostsView, self).list(request, *args, **kwargs).data
+
+        data = response_cache.cached_data('user-posts', [('user', request.user.id)], request, build)
+        response_cache.apply_viewer_fields(request, data['results'])
+        return Response(data)
     
-class AllPostsView(generics.ListAPIView):
+def home_dependencies(viewer_id, entries):
+    # La página cambia si entra o sale un post, si cambia uno de sus posts o autores, o si el
+    # usuario sigue o deja de seguir a alguien
+    dependencies = [('user', viewer_id)]
+    for _, post_id, author_id in entries:
+        dependencies += [('post', post_id), ('user', author_id)]
+    return dependencies
+
+
+class AllPostsView(instrumentation.TimedListMixin, PostListMixin, generics.ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = PostPagination
 
-    def get_queryset(self):
+    @cached_property
+    def home_entries(self):
+        # La página pedida del timeline (ver timeline.home_entries): los validadores salen de
+        # ella sin leer los posts y el listado lee solo esos posts
+        return timeline.home_entries(self.request.user, *self.paginator.get_window(self.request))
+
+    def get_posts(self):
         user = self.request.user
         if user.is_authenticated:
-            # Obtener los IDs de los usuarios que el usuario está siguiendo
-            following_users_ids = user.following.values_list('following_id', flat=True)
-            
-            # Obtener los posts de los usuarios seguidos
-            following_posts = Post.objects.filter(user_id__in=following_users_ids)
-            
-            # Obtener los posts del propio usuario
-            user_posts = Post.objects.filter(user=user)
-            
-            # Unir los dos conjuntos de resultados
-            return following_posts.union(user_posts)
+            # Timeline materializado del usuario (sus posts y los de los usuarios que sigue)
+            return timeline.home_posts(self.home_entries)
         else:
             # Si no está autenticado, no se devuelven posts
             return Post.objects.none()
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        if request.query_params.get('mode') != 'ranked':
+            # Validadores a partir de los ids de la página, sin cargar los posts
+            validators = response_cache.validators_for(home_dependencies(request.user.id, self.home_entries))
+            not_modified = validators.not_modified(request)
+            if not_modified is not None:
+                return not_modified
+            return validators.apply(super().list(request, *args, **kwargs))
+
+        # Home ordenada por relevancia (ver ranking.py); sin cursor se recalcula el orden
+        paginator = RankedPagination()
+        ranked = ranking.cached_ranked_post_ids(request.user, refresh=not request.query_params.get(paginator.cursor_query_param))
+        page_ids = paginator.paginate_queryset(ranked, request, view=self)
+        posts = prefetch_post_page(request, sharding.for_posts(Post.objects.all(), page_ids)).in_bulk()
+        page = [posts[post_id] for post_id in page_ids if post_id in posts]
+        return paginator.get_paginated_response(instrumentation.serialized(self.get_serializer(page, many=True)))
         
 
 class UserProfileView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, user_id):
+        validators = response_cache.validators_for([('user', user_id), ('user', request.user.id)])
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
         try:
-            user = User.objects.get(id=user_id)
-            posts = Post.objects.filter(user=user)  # Obtener los posts del usuario
-            serialized_posts = PostSerializer(posts, many=True)  # Serializar los posts
-            
-            data = {
-                'username': user.username,
-                'email': user.email,
-                'is_followed': user.followers.filter(id=request.user.id).exists(),
-                'followers_count': user.followers.count(),  # Contar los seguidores
-                'following_count': user.following.count(),  # Contar los seguidos
-                'posts': serialized_posts.data
-            }
-            return Response(data, status=status.HTTP_200_OK)
+            data = response_cache.cached_data('profile', [('user', user_id)], request, lambda: self.build(request, user_id))
         except User.DoesNotExist:
             return Response({'error': 'User does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
+        # Lo que depende del usuario en sesión no se cachea
+        data['is_followed'] = user_id in followed_ids(request.user, [user_id])
+        response_cache.apply_viewer_fields(request, data['posts'])
+        return validators.apply(Response(data, status=status.HTTP_200_OK))
+
+    def build(self, request, user_id):
+        user = User.objects.get(id=user_id)
+        stats = counters.get_user_stats(user.id)  # Contadores desnormalizados, sin COUNT(*)
+        posts = prefetch_post_page(request, sharding.posts_of(user.id))  # Obtener los posts del usuario
+        paginator = PostPagination()
+        page = paginator.paginate_queryset(posts, request, view=self)  # Solo una página de posts
+        compact, _ = requested_fields(request)
+        serializer_class = CompactPostSerializer if compact else PostSerializer
+        context = post_page_context(request, page, viewer_fields=False)
+        serialized_posts = serializer_class(page, many=True, context=context)  # Serializar los posts
+
+        return {
+            'username': user.username,
+            'email': user.email,
+            'followers_count': stats.follower_count,
+            'following_count': stats.following_count,
+            'post_count': stats.post_count,
+            'posts': instrumentation.serialized(serialized_posts),
+            'posts_next': paginator.get_next_link(),  # Siguiente página de posts
+        }
+
+
+def parse_post_id(request):
+    try:
+        return int(request.data.get('post_id'))
+    except (TypeError, ValueError):
+        return None
+
 
 class LikePostView(generics.CreateAPIView):
     queryset = Like.objects.all()
@@ -149,32 +277,34 @@ class LikePostView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        user = request.user
-        post_id = request.data.get('post_id')
-        post = Post.objects.get(id=post_id)
-
-        if Like.objects.filter(user=user, post=post).exists():
-            return Response({"detail": "You already liked this post."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        Like.objects.create(user=user, post=post)
-        return Response({"detail": "Post liked successfully."}, status=status.HTTP_201_CREATED)
+        # Idempotente: repetir el like no falla, devuelve el mismo estado
+        post_id = parse_post_id(request)
+        if post_id is None:
+            return Response({'error': 'post_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            created, likes_count = services.like_post(request.user, post_id)
+        except Post.DoesNotExist:
+            return Response({'error': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {"detail": "Post liked successfully.", "liked": True, "likesCount": likes_count},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
     
     def get(self, request, post_id):
         user = request.user
         try:
-            post = Post.objects.get(id=post_id)
-            has_liked = Like.objects.filter(user=user, post=post).exists()
+            with sharding.on_post(post_id):
+                post = Post.objects.get(id=post_id)
+                has_liked = Like.objects.filter(user=user, post=post).exists()
             return Response({'liked': has_liked})
         except Post.DoesNotExist:
             return Response({'error': 'Post not found'}, status=404)
         
 class PostLikesCountView(APIView):
     def get(self, request, post_id):
-        # Obtener el post
-        post = get_object_or_404(Post, id=post_id)
-        
-        # Contar el número de "likes" asociados con el post
-        likes_count = Like.objects.filter(post=post).count()
+        # Contador desnormalizado del post, sin COUNT(*) sobre Like
+        posts = Post.objects.using(sharding.shard_for_post(post_id))
+        likes_count = get_object_or_404(posts.values_list('like_count', flat=True), id=post_id)
         
         # Devolver la cantidad de likes en la respuesta
         return Response({'likesCount': likes_count}, status=status.HTTP_200_OK)
@@ -185,15 +315,14 @@ class UnlikePostView(generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
 
     def delete(self, request, *args, **kwargs):
-        user = request.user
-        post_id = request.data.get('post_id')
-        post = Post.objects.get(id=post_id)
-
-        like = Like.objects.filter(user=user, post=post).first()
-        if like:
-            like.delete()
-            return Response({"detail": "Post unliked successfully."}, status=status.HTTP_204_NO_CONTENT)
-        return Response({"detail": "You haven't liked this post."}, status=status.HTTP_400_BAD_REQUEST)
+        post_id = parse_post_id(request)
+        if post_id is None:
+            return Response({'error': 'post_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            _, likes_count = services.unlike_post(request.user, post_id)
+        except Post.DoesNotExist:
+            return Response({'error': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"detail": "Post unliked successfully.", "liked": False, "likesCount": likes_count}, status=status.HTTP_200_OK)
     
 class CommentDetailView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -201,7 +330,7 @@ class CommentDetailView(APIView):
     def delete(self, request, *args, **kwargs):
         comment_id = kwargs.get('comment_id')
         try:
-            comment = Comment.objects.get(id=comment_id)
+            comment = Comment.objects.using(sharding.shard_for_comment(comment_id)).get(id=comment_id)
         except Comment.DoesNotExist:
             return Response({'error': 'Comment not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -211,6 +340,8 @@ class CommentDetailView(APIView):
         # Verificar si el usuario es el autor del comentario o el autor del post
         if comment.user == user or post.user == user:
             comment.delete()
+            counters.bump_post(post.id, comment_count=-1)
+            response_cache.post_changed(post.id, post.user_id)
             return Response({'status': 'Comment deleted'}, status=status.HTTP_204_NO_CONTENT)
         else:
             return Response({'error': 'You do not have permission to delete this comment'}, status=status.HTTP_403_FORBIDDEN)
@@ -221,10 +352,17 @@ class CommentCreateView(APIView):
 
     def post(self, request, *args, **kwargs):
         serializer = CommentSerializer(data=request.data, context={'request': request})
-        
-        if serializer.is_valid():
-            serializer.save(user=request.user)  # Pasamos el usuario actual al save
-            return Response(serializer.data, status=201)
+
+        # Con sharding, el post se valida y el comentario se guarda en el shard del post
+        with sharding.on_post(parse_post_id(request)):
+            valid = serializer.is_valid()
+            comment = serializer.save(user=request.user) if valid else None  # Pasamos el usuario actual al save
+        if valid:
+            counters.bump_post(comment.post_id, comment_count=1)
+            response_cache.post_changed(comment.post_id, comment.post.user_id)
+            events.comment_created(comment, comment.post.user_id)
+            notifications.notify(comment.post.user_id, Notification.COMMENT, request.user, comment.post_id)
+            return Response(instrumentation.serialized(serializer), status=201)
         
         return Response(serializer.errors, status=400)
 
@@ -234,21 +372,33 @@ class CommentListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, post_id):
+        # Los comentarios suben la versión del post (y el nombre de sus autores también)
+        validators = response_cache.validators_for([('post', post_id), ('user', request.user.id)])
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
         try:
-            post = Post.objects.get(id=post_id)
+            post = Post.objects.using(sharding.shard_for_post(post_id)).get(id=post_id)
         except Post.DoesNotExist:
             return Response({"error": "Post not found"}, status=404)
 
-        comments = Comment.objects.filter(post=post)
-        serializer = CommentSerializer(comments, many=True)
+        comments = prefetch_comments(post.comments.all())
+        paginator = CommentPagination()
+        page = paginator.paginate_queryset(comments, request, view=self)
+        context = {
+            'request': request,
+            'followed_ids': followed_ids(request.user, {comment.user_id for comment in page}),
+        }
+        serializer = CommentSerializer(page, many=True, context=context)
 
         response_data = {
-            'post_owner_id': post.user.id,  # ID del dueño del post
-            'comments': serializer.data,  # Comentarios con los IDs del dueño de cada comentario
+            'post_owner_id': post.user_id,  # ID del dueño del post
+            'comments': instrumentation.serialized(serializer),  # Comentarios con los IDs del dueño de cada comentario
+            'next': paginator.get_next_link(),  # Siguiente página de comentarios
             'current_user_id': request.user.id  # ID del usuario en sesión
         }
 
-        return Response(response_data)
+        return validators.apply(Response(response_data))
 
 class FollowUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -257,27 +407,15 @@ class FollowUserView(APIView):
         follower = request.user  # Usuario autenticado
         user_id_to_follow = kwargs['user_id']  # ID del usuario que queremos seguir
 
-        # Registro para verificar el ID del usuario a seguir
-        logging.info(f"User ID to follow: {user_id_to_follow}")
-
         if follower.id == user_id_to_follow:
             return Response({'error': 'You cannot follow yourself'}, status=400)
 
+        # Idempotente: seguir otra vez no falla, devuelve el mismo estado
         try:
-            following = User.objects.get(id=user_id_to_follow)
+            created, followers_count = services.follow_user(follower, user_id_to_follow)
         except User.DoesNotExist:
             return Response({'error': 'User does not exist'}, status=404)
-
-        # Verifica si la relación ya existe
-        if Follow.objects.filter(follower=follower, following=following).exists():
-            return Response({'error': 'You are already following this user'}, status=400)
-
-        serializer = FollowSerializer(data={'follower': follower.id, 'following': following.id})
-
-        if serializer.is_valid():
-            serializer.save()
-            return Response({'status': 'following'}, status=201)
-        return Response(serializer.errors, status=400)
+        return Response({'status': 'following', 'followers_count': followers_count}, status=201 if created else 200)
     
 
 class DeletePostView(APIView):
@@ -285,11 +423,17 @@ class DeletePostView(APIView):
 
     def delete(self, request, post_id):
         try:
-            post = Post.objects.get(id=post_id, user=request.user)
+            post = Post.objects.using(sharding.shard_for_post(post_id)).get(id=post_id, user=request.user)
         except Post.DoesNotExist:
             return Response({'error': 'Post not found or you do not have permission to delete it.'}, status=404)
 
+        timeline.remove_post(post.id)
+        if post.image:
+            images.delete_variants(post)
+            post.image.delete(save=False)  # Libera la referencia al blob (se borra si nadie más lo usa)
         post.delete()
+        counters.bump_user(request.user.id, post_count=-1)
+        response_cache.post_changed(post_id, request.user.id)
         return Response({'message': 'Post deleted successfully'}, status=204)
 
 
@@ -297,25 +441,54 @@ class UnfollowUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        follower = request.user
         try:
-            following = User.objects.get(id=kwargs['user_id'])
+            _, followers_count = services.unfollow_user(request.user, kwargs['user_id'])
         except User.DoesNotExist:
             return Response({'error': 'User not found'}, status=404)
-
-        follow_instance = Follow.objects.filter(follower=follower, following=following)
-        if follow_instance.exists():
-            follow_instance.delete()
-            return Response({'status': 'unfollowed'}, status=204)
-        return Response({'status': 'not_following'}, status=400)
+        return Response({'status': 'unfollowed', 'followers_count': followers_count}, status=200)
     
 class UserSearchView(generics.ListAPIView):
     serializer_class = UserSerializer
+    pagination_class = RankedPagination
     
     def get_queryset(self):
         query = self.request.query_params.get('query', '')
-        return User.objects.filter(username__icontains=query)
+        return search.search_users(query, self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        context = self.get_serializer_context()
+        context['followed_ids'] = {user.id for user in page if user.viewer_follows}  # Resuelto en la propia búsqueda
+        serializer = self.get_serializer(page, many=True, context=context)
+        return self.get_paginated_response(instrumentation.serialized(serializer))
     
+class FollowersListView(APIView):
+    # users/<id>/followers/: seguidores del usuario, los más recientes primero
+    permission_classes = [IsAuthenticated]
+    serializer_class = FollowerSerializer
+    lookup = 'following_id'  # Lado del Follow que identifica al usuario del perfil
+
+    def get(self, request, user_id):
+        if not User.objects.filter(id=user_id).exists():
+            return Response({'error': 'User does not exist'}, status=404)
+
+        side = self.serializer_class.side
+        follows = Follow.objects.filter(**{self.lookup: user_id}).select_related(side)
+        paginator = FollowPagination()
+        page = paginator.paginate_queryset(follows, request, view=self)
+        context = {
+            'request': request,
+            'followed_ids': followed_ids(request.user, [getattr(follow, f'{side}_id') for follow in page]),
+        }
+        return paginator.get_paginated_response(instrumentation.serialized(self.serializer_class(page, many=True, context=context)))
+
+
+class FollowingListView(FollowersListView):
+    # users/<id>/following/: usuarios a los que sigue
+    serializer_class = FollowingSerializer
+    lookup = 'follower_id'
+
+
 class CheckFollowStatusView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -330,3 +503,202 @@ class CheckFollowStatusView(APIView):
 
         is_followed = Follow.objects.filter(follower=follower, following=following).exists()
         return Response({'is_followed': is_followed}, status=200)
+
+
+def batch_max_ids():
+    return getattr(settings, 'SOCIAL_BATCH_MAX_IDS', 100)
+
+
+def parse_id_list(request):
+    # ?ids=1,2,3 -> [1, 2, 3]; None si la lista no es válida o supera el límite
+    raw = request.query_params.get('ids', '')
+    try:
+        ids = list(dict.fromkeys(int(value) for value in raw.split(',') if value.strip()))
+    except ValueError:
+        return None
+    if not ids or len(ids) > batch_max_ids():
+        return None
+    return ids
+
+
+class BatchLikeStatusView(APIView):
+    # Estado de like y contador de varios posts en una sola petición
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        post_ids = parse_id_list(request)
+        if post_ids is None:
+            return Response({'error': 'ids must be a comma separated list of at most %d post ids' % batch_max_ids()}, status=400)
+
+        like_counts = dict(sharding.for_posts(Post.objects.all(), post_ids).values_list('id', 'like_count'))
+        liked = liked_post_ids(request.user, like_counts)
+        data = {
+            post_id: {'liked': post_id in liked, 'likesCount': like_count}
+            for post_id, like_count in like_counts.items()
+        }
+        return Response({'likes': data}, status=200)
+
+
+class BatchFollowStatusView(APIView):
+    # Estado de follow de varios usuarios en una sola petición
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        user_ids = parse_id_list(request)
+        if user_ids is None:
+            return Response({'error': 'ids must be a comma separated list of at most %d user ids' % batch_max_ids()}, status=400)
+
+        followed = followed_ids(request.user, user_ids)
+        return Response({'follows': {user_id: user_id in followed for user_id in user_ids}}, status=200)
+
+
+class ContentSearchView(APIView):
+    # Búsqueda de texto en posts (?type=posts, por defecto) o comentarios (?type=comments)
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        kind = ContentToken.COMMENT if request.query_params.get('type') == 'comments' else ContentToken.POST
+        terms = search.query_terms(request.query_params.get('q', ''))
+        if not terms:
+            return Response({'next': None, 'results': []}, status=200)
+
+        backend = search.get_content_backend()
+        paginator = SearchPagination()
+        weights = paginator.get_cursor_weights(request, terms) or backend.weights(kind, terms)
+        page = paginator.paginate_queryset(backend.search(kind, terms, weights), request, view=self, weights=weights)
+        ids = [row['object_id'] for row in page]
+
+        if kind == ContentToken.POST:
+            objects = prefetch_post_page(request, sharding.for_posts(Post.objects.all(), ids)).in_bulk()
+            results = [objects[object_id] for object_id in ids if object_id in objects]
+            compact, _ = requested_fields(request)
+            serializer_class = CompactPostSerializer if compact else PostSerializer
+            data = instrumentation.serialized(serializer_class(results, many=True, context=post_page_context(request, results)))
+        else:
+            objects = prefetch_comments(sharding.for_comments(Comment.objects.all(), ids)).in_bulk()
+            results = [objects[object_id] for object_id in ids if object_id in objects]
+            context = {
+                'request': request,
+                'followed_ids': followed_ids(request.user, {comment.user_id for comment in results}),
+            }
+            data = instrumentation.serialized(CommentSerializer(results, many=True, context=context))
+        return paginator.get_paginated_response(data)
+
+
+class NotificationListView(instrumentation.TimedListMixin, generics.ListAPIView):
+    # Bandeja de avisos del usuario, los más recientes primero
+    serializer_class = NotificationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationPagination
+
+    def get_queryset(self):
+        return Notification.objects.filter(recipient=self.request.user)
+
+
+class UnreadNotificationCountView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        # Contador desnormalizado, sin COUNT(*) sobre Notification
+        return Response({'unread': notifications.unread_count(request.user.id)}, status=200)
+
+
+class MarkNotificationsReadView(APIView):
+    # Marca como leídos los avisos indicados en "ids", o todos si no se indica ninguno
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        ids = request.data.get('ids')
+        if ids is not None and (not isinstance(ids, list) or not all(isinstance(value, int) for value in ids)):
+            return Response({'error': 'ids must be a list of notification ids'}, status=400)
+        marked = notifications.mark_read(request.user.id, ids)
+        return Response({'marked': marked, 'unread': notifications.unread_count(request.user.id)}, status=200)
+
+
+def bulk_max_items():
+    return getattr(settings, 'SOCIAL_BULK_MAX_ITEMS', 1000)
+
+
+def parse_bulk_ids(request, key):
+    # {"post_ids": [1, 2, 3]} -> [1, 2, 3]; None si la lista no es válida o supera el límite
+    ids = request.data.get(key)
+    if not isinstance(ids, list) or not ids or len(ids) > bulk_max_items():
+        return None
+    if not all(isinstance(value, int) and not isinstance(value, bool) for value in ids):
+        return None
+    return list(dict.fromkeys(ids))
+
+
+class BulkLikeView(APIView):
+    # Like (POST) o unlike (DELETE) de muchos posts en una transacción
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        post_ids = parse_bulk_ids(request, 'post_ids')
+        if post_ids is None:
+            return Response({'error': 'post_ids must be a list of at most %d post ids' % bulk_max_items()}, status=400)
+        return Response({'results': services.bulk_like(request.user, post_ids)}, status=200)
+
+    def delete(self, request):
+        post_ids = parse_bulk_ids(request, 'post_ids')
+        if post_ids is None:
+            return Response({'error': 'post_ids must be a list of at most %d post ids' % bulk_max_items()}, status=400)
+        return Response({'results': services.bulk_unlike(request.user, post_ids)}, status=200)
+
+
+class BulkFollowView(APIView):
+    # Follow (POST) o unfollow (DELETE) de muchos usuarios en una transacción
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        user_ids = parse_bulk_ids(request, 'user_ids')
+        if user_ids is None:
+            return Response({'error': 'user_ids must be a list of at most %d user ids' % bulk_max_items()}, status=400)
+        return Response({'results': services.bulk_follow(request.user, user_ids)}, status=200)
+
+    def delete(self, request):
+        user_ids = parse_bulk_ids(request, 'user_ids')
+        if user_ids is None:
+            return Response({'error': 'user_ids must be a list of at most %d user ids' % bulk_max_items()}, status=400)
+        return Response({'results': services.bulk_unfollow(request.user, user_ids)}, status=200)
+
+
+class BulkCommentView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        items = request.data.get('comments')
+        if not isinstance(items, list) or not items or len(items) > bulk_max_items() or not all(isinstance(item, dict) for item in items):
+            return Response({'error': 'comments must be a list of at most %d {post_id, content} objects' % bulk_max_items()}, status=400)
+        return Response({'results': services.bulk_comment(request.user, items)}, status=200)
+
+
+class SuggestionsView(APIView):
+    # A quién seguir: lista precalculada (suggestions.py), sin joins sobre Follow en la petición
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), suggestions.top_k()))
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=400)
+
+        items = suggestions.get_suggestions(request.user.id)
+        # La lista puede ser de hace unas horas: se quitan los que ya sigue desde entonces
+        already = followed_ids(request.user, [user_id for user_id, _ in items])
+        items = [(user_id, mutuals) for user_id, mutuals in items if user_id not in already][:limit]
+        users = {
+            user['id']: user
+            for user in User.objects.filter(id__in=[user_id for user_id, _ in items]).values('id', 'username', 'stats__follower_count')
+        }
+        results = [
+            {
+                'id': user_id,
+                'username': users[user_id]['username'],
+                'mutual_count': mutuals,
+                'followers_count': users[user_id]['stats__follower_count'] or 0,
+            }
+            for user_id, mutuals in items
+            if user_id in users
+        ]
+        return Response({'results': results}, status=200)